@@ -42,6 +42,65 @@ class Algorithm(object):
                                   "class of 'Algorithm' ,'{}'"
                                   .format(self.__class__.__name__))
 
+    def ask(self, num_candidates=None):
+        """
+        Returns candidates to be evaluated, allowing the caller to drive the
+        evaluation instead of passing an evaluator to optimize. The fitnesses
+        of the candidates are returned with tell, in any order and batch size.
+        Returns an empty list if no candidates can be proposed until more
+        fitnesses have been told (or the algorithm has stopped)
+
+        `num_candidates` -- the maximum number of candidates to return, which
+                            is left to the algorithm (typically a generation)
+                            if None [int]
+        """
+        raise NotImplementedError("'ask' is not implemented by derived class "
+                                  "of 'Algorithm' ,'{}'"
+                                  .format(self.__class__.__name__))
+
+    def tell(self, candidates, fitnesses):
+        """
+        Returns the fitnesses of candidates returned by ask
+
+        `candidates` -- the evaluated candidates [list(list(float))]
+        `fitnesses`  -- the fitnesses of the candidates [list]
+        """
+        raise NotImplementedError("'tell' is not implemented by derived "
+                                  "class of 'Algorithm' ,'{}'"
+                                  .format(self.__class__.__name__))
+
+    def stop(self):
+        """
+        Checks whether the algorithm has finished when driven by ask and tell
+        """
+        raise NotImplementedError("'stop' is not implemented by derived "
+                                  "class of 'Algorithm' ,'{}'"
+                                  .format(self.__class__.__name__))
+
+    def result(self):
+        """
+        Returns the result of the algorithm (as returned by optimize) once it
+        has been driven to completion by ask and tell
+        """
+        raise NotImplementedError("'result' is not implemented by derived "
+                                  "class of 'Algorithm' ,'{}'"
+                                  .format(self.__class__.__name__))
+
+    def optimize_ask_tell(self, evaluator, num_candidates=None):
+        """
+        Runs the algorithm through its ask and tell interface, evaluating the
+        candidates in the batches it asks for
+
+        `evaluator`      -- a function that takes a list of candidates and
+                            returns their fitnesses [function]
+        `num_candidates` -- the maximum number of candidates evaluated at a
+                            time [int]
+        """
+        while not self.stop():
+            candidates = self.ask(num_candidates)
+            self.tell(candidates, evaluator(candidates))
+        return self.result()
+
     def set_tune_parameters(self, tune_parameters):
         self.genome_size = len(tune_parameters)
         self.constraints = [(p.lbound, p.ubound) for p in tune_parameters]
@@ -0,0 +1,261 @@
+"""
+A native implementation of the covariance matrix adaptation evolution
+strategy (CMA-ES), which learns the correlations between the parameters and so
+converges in far fewer evaluations than the inspyred algorithms on correlated
+parameters (such as conductances)
+"""
+from __future__ import absolute_import
+import math
+import numpy
+from . import Algorithm
+
+
+class CMAESAlgorithm(Algorithm):
+    """
+    The (mu/mu_w, lambda)-CMA-ES (Hansen, 2016) with optional IPOP restarts
+    (the population size is doubled at each restart). The search is performed
+    over the parameter bounds scaled to the unit hypercube, with samples that
+    fall outside the bounds reflected back into them. For log-scaled
+    parameters the candidates are the exponents, so the search is over the
+    logarithms of the parameter values.
+
+    Candidates can either be evaluated by optimize or requested and returned
+    in batches of any size with ask and tell, the distribution being updated
+    each time the fitnesses of a full population of the current generation
+    have been told
+    """
+
+    def __init__(self, sigma0=0.3, pop_size=None, max_generations=100,
+                 max_evaluations=None, seeds=None, restarts=0, tol_x=1e-8,
+                 tol_fun=1e-12, random_seed=None):
+        """
+        `sigma0`          -- the initial step size, as a fraction of the
+                             parameter bounds [float]
+        `pop_size`        -- the number of candidates in each generation
+                             (lambda), 4 + 3 * ln(num_params) if None [int]
+        `max_generations` -- the maximum number of generations (including
+                             those of restarts) [int]
+        `max_evaluations` -- the maximum number of evaluations [int]
+        `seeds`           -- the initial mean of the search (the first
+                             restart after which starts from a random mean),
+                             the middle of the bounds if None
+                             [list(list(float))]
+        `restarts`        -- the maximum number of IPOP restarts [int]
+        `tol_x`           -- the search is restarted (or stopped) once the
+                             step size in every direction is smaller than
+                             this [float]
+        `tol_fun`         -- the search is restarted (or stopped) once the
+                             range of the recent best fitnesses is smaller
+                             than this [float]
+        `random_seed`     -- the seed of the random number generator [int]
+        """
+        self.sigma0 = sigma0
+        self.pop_size = pop_size
+        self.max_generations = max_generations
+        self.max_evaluations = max_evaluations
+        self.seeds = seeds
+        self.restarts = restarts
+        self.tol_x = tol_x
+        self.tol_fun = tol_fun
+        self._rng = numpy.random.RandomState(random_seed)
+        self.tuner = None
+
+    def set_tune_parameters(self, tune_parameters):
+        super(CMAESAlgorithm, self).set_tune_parameters(tune_parameters)
+        self._lbounds, self._ubounds = (numpy.array(b, dtype=float)
+                                        for b in zip(*self.constraints))
+        self.best_candidate = None
+        self.best_fitness = float('inf')
+        self.num_evaluations = 0
+        self.num_generations = 0
+        self.num_restarts = 0
+        if self.seeds:
+            mean = self._normalise(self.seeds[0])
+        else:
+            mean = numpy.empty(self.genome_size)
+            mean.fill(0.5)
+        lam = self.pop_size
+        if lam is None:
+            lam = 4 + int(3 * math.log(self.genome_size))
+        self._start(mean, lam)
+
+    def optimize(self, evaluator, **kwargs):  # @UnusedVariable
+        """
+        Runs the search until a stopping criteria is met and returns the best
+        candidate and its fitness
+        """
+        return self.optimize_ask_tell(evaluator)
+
+    def ask(self, num_candidates=None):
+        """
+        Samples candidates from the current search distribution
+
+        `num_candidates` -- the number of candidates to sample, the population
+                            size if None [int]
+        """
+        if num_candidates is None:
+            num_candidates = self._lambda
+        z = self._rng.standard_normal((num_candidates, self.genome_size))
+        x = self._mean + self._sigma * z.dot((self._B * self._D).T)
+        # Reflect the samples back into the bounds
+        x = numpy.abs(x) % 2.0
+        x = numpy.where(x > 1.0, 2.0 - x, x)
+        candidates = [list(c) for c in self._denormalise(x)]
+        for c in candidates:
+            self._pending[tuple(c)] = self._generation_id
+        return candidates
+
+    def tell(self, candidates, fitnesses):
+        """
+        Returns the fitnesses of asked candidates (in any order or batch
+        size), updating the search distribution once a full population of the
+        current generation has been evaluated. The fitnesses of candidates
+        from previous generations only count towards the best candidate
+
+        `candidates` -- the evaluated candidates [list(list(float))]
+        `fitnesses`  -- the fitnesses of the candidates [list(float)]
+        """
+        for candidate, fitness in zip(candidates, fitnesses):
+            if numpy.ndim(fitness):
+                raise Exception("CMA-ES only supports single objectives")
+            fitness = float(fitness)
+            if math.isnan(fitness):
+                fitness = float('inf')
+            self.num_evaluations += 1
+            if fitness < self.best_fitness:
+                self.best_fitness = fitness
+                self.best_candidate = list(candidate)
+            generation_id = self._pending.pop(tuple(candidate), None)
+            if generation_id == self._generation_id:
+                self._told.append((fitness, self._normalise(candidate)))
+            if len(self._told) == self._lambda:
+                self._update()
+
+    def stop(self):
+        """
+        Checks whether the search has reached its limits (restarting it if
+        it has converged and there are restarts remaining)
+        """
+        if (self.max_evaluations is not None and
+                self.num_evaluations >= self.max_evaluations):
+            return True
+        if (self.max_generations is not None and
+                self.num_generations >= self.max_generations):
+            return True
+        if self._converged():
+            if self.num_restarts >= self.restarts:
+                return True
+            self.num_restarts += 1
+            self._start(self._rng.uniform(size=self.genome_size),
+                        2 * self._lambda)
+        return False
+
+    def result(self):
+        return self.best_candidate, self.best_fitness
+
+    def _start(self, mean, lam):
+        """
+        (Re)starts the search from the given mean with the given population
+        size
+        """
+        n = self.genome_size
+        self._lambda = lam
+        self._mu = lam // 2
+        weights = math.log(self._mu + 0.5) - numpy.log(numpy.arange(
+                                                            1, self._mu + 1))
+        self._weights = weights / weights.sum()
+        self._mueff = 1.0 / (self._weights ** 2).sum()
+        mueff = self._mueff
+        self._cc = (4.0 + mueff / n) / (n + 4.0 + 2.0 * mueff / n)
+        self._cs = (mueff + 2.0) / (n + mueff + 5.0)
+        self._c1 = 2.0 / ((n + 1.3) ** 2 + mueff)
+        self._cmu = min(1.0 - self._c1,
+                        2.0 * (mueff - 2.0 + 1.0 / mueff) /
+                        ((n + 2.0) ** 2 + mueff))
+        self._damps = (1.0 + 2.0 * max(0.0, math.sqrt((mueff - 1.0) /
+                                                      (n + 1.0)) - 1.0) +
+                       self._cs)
+        self._chi_n = math.sqrt(n) * (1.0 - 1.0 / (4.0 * n) +
+                                      1.0 / (21.0 * n ** 2))
+        self._mean = numpy.array(mean, dtype=float)
+        self._sigma = float(self.sigma0)
+        self._C = numpy.eye(n)
+        self._B = numpy.eye(n)
+        self._D = numpy.ones(n)
+        self._pc = numpy.zeros(n)
+        self._ps = numpy.zeros(n)
+        self._restart_generation = 0
+        self._recent_best = []
+        self._generation_id = getattr(self, '_generation_id', -1) + 1
+        self._pending = {}
+        self._told = []
+
+    def _update(self):
+        """
+        Updates the mean, evolution paths, covariance matrix and step size from
+        the told population of the current generation
+        """
+        n = self.genome_size
+        self._told.sort(key=lambda t: t[0])
+        fitnesses = [f for f, _ in self._told]
+        x = numpy.array([c for _, c in self._told[:self._mu]])
+        y = (x - self._mean) / self._sigma
+        y_w = self._weights.dot(y)
+        self._mean = self._mean + self._sigma * y_w
+        # Update the evolution paths
+        inv_sqrt_C = (self._B / self._D).dot(self._B.T)
+        self._ps = ((1.0 - self._cs) * self._ps +
+                    math.sqrt(self._cs * (2.0 - self._cs) * self._mueff) *
+                    inv_sqrt_C.dot(y_w))
+        self._restart_generation += 1
+        ps_norm = numpy.linalg.norm(self._ps)
+        hsig = (ps_norm / math.sqrt(1.0 - (1.0 - self._cs) **
+                                    (2 * self._restart_generation)) /
+                self._chi_n) < 1.4 + 2.0 / (n + 1.0)
+        self._pc = ((1.0 - self._cc) * self._pc +
+                    hsig * math.sqrt(self._cc * (2.0 - self._cc) *
+                                     self._mueff) * y_w)
+        # Update the covariance matrix with the rank-one and rank-mu updates
+        self._C = ((1.0 - self._c1 - self._cmu) * self._C +
+                   self._c1 * (numpy.outer(self._pc, self._pc) +
+                               (1.0 - hsig) * self._cc * (2.0 - self._cc) *
+                               self._C) +
+                   self._cmu * (y.T * self._weights).dot(y))
+        self._sigma *= math.exp((self._cs / self._damps) *
+                                (ps_norm / self._chi_n - 1.0))
+        # Decompose the covariance matrix for sampling
+        self._C = numpy.triu(self._C) + numpy.triu(self._C, 1).T
+        eigenvalues, self._B = numpy.linalg.eigh(self._C)
+        self._D = numpy.sqrt(numpy.maximum(eigenvalues, 1e-20))
+        self._recent_best.append(fitnesses[0])
+        del self._recent_best[:-self._recent_best_length()]
+        self._recent_range = max(fitnesses + self._recent_best) - min(
+                                              fitnesses + self._recent_best)
+        self.num_generations += 1
+        self._generation_id += 1
+        self._pending = {}
+        self._told = []
+
+    def _converged(self):
+        """
+        Checks whether the current search has converged
+        """
+        if not self._restart_generation:
+            return False
+        if self._sigma * self._D.max() < self.tol_x:
+            return True
+        if (len(self._recent_best) == self._recent_best_length() and
+                self._recent_range < self.tol_fun):
+            return True
+        # The covariance matrix is ill-conditioned
+        return self._D.max() > 1e7 * self._D.min()
+
+    def _recent_best_length(self):
+        return 10 + int(30 * self.genome_size / self._lambda)
+
+    def _normalise(self, candidate):
+        return ((numpy.asarray(candidate, dtype=float) - self._lbounds) /
+                (self._ubounds - self._lbounds))
+
+    def _denormalise(self, x):
+        return self._lbounds + x * (self._ubounds - self._lbounds)
@@ -1,4 +1,9 @@
+import os
+import os.path
+from glob import glob
+from itertools import product
 import numpy
+from numpy.lib.format import open_memmap
 from . import Algorithm
 
 
@@ -10,8 +15,24 @@ class GridAlgorithm(Algorithm):
 
     BAD_FITNESS_VALUE = float('nan')
 
-    def __init__(self, num_steps):
+    def __init__(self, num_steps, chunk_size=4096, results_path=None):
+        """
+        `num_steps`    -- the number of steps along each dimension of the
+                          grid [int or list(int)]
+        `chunk_size`   -- the number of grid points generated and passed to
+                          the evaluator at a time [int]
+        `results_path` -- the path of a .npy file the fitnesses are written to
+                          (memory-mapped) as each chunk completes. If the file
+                          already exists the points that have already been
+                          evaluated are skipped, so an interrupted run can be
+                          resumed. When the grid is evaluated in partitions
+                          each partition is first written to its own file
+                          alongside it (see evaluate_partition). If None the
+                          fitnesses are held in memory [str]
+        """
         self.num_steps = num_steps
+        self.chunk_size = chunk_size
+        self.results_path = results_path
 
     def set_tune_parameters(self, tune_parameters):
         super(GridAlgorithm, self).set_tune_parameters(tune_parameters)
@@ -31,43 +52,487 @@ class GridAlgorithm(Algorithm):
                             "algorithm so it doesn't have a dimension")
 
     def optimize(self, evaluator, **kwargs):  # @UnusedVariable
-        # Convert number of steps into a list with a step number for each
-        # dimension if it is not already
-        if isinstance(self.num_steps, int):
-            num_steps = numpy.empty(self.num_dims, dtype=int)
-            num_steps.fill(self.num_steps)
+        num_steps = self._get_num_steps()
+        param_ranges = self._param_ranges(num_steps)
+        num_points = int(num_steps.prod())
+        fitnesses, done = self._open_results(num_points)
+        # Evaluate the grid points a chunk at a time, skipping points that
+        # were evaluated in a previous run
+        for start in xrange(0, num_points, self.chunk_size):
+            stop = min(start + self.chunk_size, num_points)
+            if done is not None:
+                indices = start + numpy.flatnonzero(~done[start:stop])
+                if not len(indices):
+                    continue
+            else:
+                indices = numpy.arange(start, stop)
+            candidates = self.grid_candidates(indices, param_ranges)
+            chunk_fitnesses = numpy.array(evaluator(candidates))
+            if fitnesses is None:
+                # The number of objectives isn't known until the first
+                # fitnesses are returned
+                fitnesses, done = self._open_results(
+                                  num_points, chunk_fitnesses.shape[1:])
+            self._store_results(fitnesses, done, indices, chunk_fitnesses)
+        return self._fittest_and_grid(fitnesses, num_steps, param_ranges)
+
+    def evaluate_partition(self, evaluator, part, num_parts,
+                           contiguous=False):
+        """
+        Evaluates the grid points in one of a fixed set of partitions of the
+        grid, so that separate processes can each evaluate their own partition
+        without any coordination until their results are assembled (see
+        assemble_partitions). If results_path is set, the fitnesses of the
+        partition are written to a file of their own as each chunk completes,
+        so an interrupted run can be resumed before the partitions are
+        assembled, and points already evaluated in a previous run are
+        skipped. Returns the flat indices of the points evaluated since the
+        partitions were last assembled and their fitnesses
+
+        `evaluator`  -- a function that takes a list of candidates and returns
+                        their fitnesses [function]
+        `part`       -- the index of the partition to evaluate [int]
+        `num_parts`  -- the number of partitions the grid is split into [int]
+        `contiguous` -- whether each partition is a contiguous block of points
+                        or every num_parts-th point (which tends to balance
+                        the cost of the partitions better) [bool]
+        """
+        num_steps = self._get_num_steps()
+        param_ranges = self._param_ranges(num_steps)
+        num_points = int(num_steps.prod())
+        if contiguous:
+            indices = numpy.arange(part * num_points // num_parts,
+                                   (part + 1) * num_points // num_parts)
         else:
-            if len(self.num_steps) > self.num_dims:
-                raise Exception("Length of the number of steps ({}) list does "
-                                "not match the number of dimensions ({}) "
-                                "provided "
-                                .format(len(self.num_steps), self.num_dims))
-            num_steps = numpy.asarray(self.num_steps, dtype=int)
-        # Get the ranges of the parameters using the number of steps
-        param_ranges = [numpy.linspace(l, u, n)
-                        for (l, u), n in zip(self.constraints, num_steps)]
-        if self.num_dims == 1:
-            candidates = numpy.asarray(zip(*param_ranges))
+            indices = numpy.arange(part, num_points, num_parts)
+        # The points of the partition that were assembled into the results in
+        # a previous run
+        done_path = self._done_path()
+        if done_path is not None and os.path.exists(done_path):
+            assembled = open_memmap(done_path, mode='r')[indices]
+        else:
+            assembled = numpy.zeros(len(indices), dtype=bool)
+        # The points of the partition are stored by their position in it
+        pending = ~assembled
+        part_path = self._partition_path(part, num_parts, contiguous)
+        fitnesses, done = self._open_results(len(indices),
+                                             results_path=part_path)
+        if done is not None:
+            pending &= ~done
+            evaluated = numpy.array(done)
         else:
-            # Get all permutations of candidates given parameter ranges
-            meshes = numpy.meshgrid(*param_ranges)
-            cand_mesh = numpy.concatenate([mesh.reshape([1] + list(mesh.shape))
-                                           for mesh in meshes])
-            candidates = cand_mesh.reshape((self.num_dims, -1)).T
-        # Evaluate fitnesses
-        fitnesses = numpy.array(evaluator(candidates))
+            evaluated = numpy.zeros(len(indices), dtype=bool)
+        positions = numpy.flatnonzero(pending)
+        for start in xrange(0, len(positions), self.chunk_size):
+            chunk = positions[start:start + self.chunk_size]
+            chunk_fitnesses = numpy.array(evaluator(self.grid_candidates(
+                                                indices[chunk], param_ranges)))
+            if fitnesses is None:
+                fitnesses, done = self._open_results(
+                                    len(indices), chunk_fitnesses.shape[1:],
+                                    results_path=part_path)
+            self._store_results(fitnesses, done, chunk, chunk_fitnesses)
+            evaluated[chunk] = True
+        evaluated &= ~assembled
+        if fitnesses is None or not evaluated.any():
+            return indices[:0], numpy.empty(0)
+        return (indices[evaluated],
+                numpy.array(fitnesses[..., evaluated].T))
+
+    def assemble_partitions(self, indices, fitnesses):
+        """
+        Assembles the fitnesses evaluated by evaluate_partition (along with
+        those of a previous run if results_path is set) and returns the
+        fittest candidate and the grid of fitnesses as returned by optimize
+
+        `indices`   -- the flat indices of the evaluated points
+                       [numpy.array(int)]
+        `fitnesses` -- the fitnesses of the evaluated points [numpy.array]
+        """
+        num_steps = self._get_num_steps()
+        param_ranges = self._param_ranges(num_steps)
+        num_points = int(num_steps.prod())
+        if len(indices):
+            results, done = self._open_results(num_points, fitnesses.shape[1:])
+            self._store_results(results, done, indices, fitnesses)
+        else:
+            results, done = self._open_results(num_points)
+        if self.results_path is not None:
+            # The fitnesses of the partitions are now stored in the results
+            for path in glob(self._partition_path('*', '*', '*')):
+                os.remove(path)
+        return self._fittest_and_grid(results, num_steps, param_ranges)
+
+    def _store_results(self, results, done, indices, fitnesses):
+        """
+        Stores the fitnesses of the evaluated points in the results
+        """
+        results[..., indices] = fitnesses.T
+        if done is not None:
+            # Flush the fitnesses before marking them as done so that an
+            # interruption can't leave points marked done but unwritten
+            results.flush()
+            done[indices] = True
+            done.flush()
+
+    def _fittest_and_grid(self, fitnesses, num_steps, param_ranges):
+        """
+        Returns the fittest candidate(s) and the fitnesses reshaped into the
+        grid
+        """
         # Check to see if multi-objective
         if fitnesses.ndim == 2:
             # Get fittest candidates for each objective
-            fittest_candidate = [candidates[f.argmin(), :]
-                                 for f in fitnesses.T]
-            fitness_grid = numpy.reshape(fitnesses.T,
-                                         [fitnesses.shape[1]] +
+            fittest_candidate = [
+                self.grid_candidates([self._nanargmin(f)], param_ranges)[0]
+                for f in fitnesses]
+            fitness_grid = numpy.reshape(fitnesses,
+                                         [fitnesses.shape[0]] +
                                          list(num_steps))
         else:
             # Get fittest candidate
-            fittest_candidate = candidates[fitnesses.argmin(), :]
+            fittest_candidate = self.grid_candidates(
+                                [self._nanargmin(fitnesses)], param_ranges)[0]
             fitness_grid = numpy.reshape(fitnesses, num_steps)
         # return fittest candidate and grid of fitnesses (for plotting
         # potentially)
         return fittest_candidate, fitness_grid
+
+    def _get_num_steps(self):
+        """
+        Converts the number of steps into an array with a step number for each
+        dimension if it is not already
+        """
+        if isinstance(self.num_steps, int):
+            num_steps = numpy.empty(self.num_dims, dtype=int)
+            num_steps.fill(self.num_steps)
+        else:
+            if len(self.num_steps) > self.num_dims:
+                raise Exception("Length of the number of steps ({}) list does "
+                                "not match the number of dimensions ({}) "
+                                "provided "
+                                .format(len(self.num_steps), self.num_dims))
+            num_steps = numpy.asarray(self.num_steps, dtype=int)
+        return num_steps
+
+    def _param_ranges(self, num_steps):
+        """
+        Returns the values of the grid points along each dimension
+        """
+        return [numpy.linspace(l, u, n)
+                for (l, u), n in zip(self.constraints, num_steps)]
+
+    @classmethod
+    def grid_candidates(cls, indices, param_ranges):
+        """
+        Returns the candidates at the given flat indices of the grid, which
+        are ordered as the points of numpy.meshgrid(*param_ranges) (i.e. with
+        the first two dimensions swapped so the grid of a 2-D search can be
+        plotted as an image)
+
+        `indices`      -- the flat indices of the grid points [list(int)]
+        `param_ranges` -- the values along each dimension of the grid
+                          [list(numpy.array(float))]
+        """
+        shape = [len(r) for r in param_ranges]
+        if len(shape) > 1:
+            shape[0], shape[1] = shape[1], shape[0]
+        subs = list(numpy.unravel_index(numpy.asarray(indices, dtype=int),
+                                        shape))
+        if len(subs) > 1:
+            subs[0], subs[1] = subs[1], subs[0]
+        return numpy.array([r[s] for r, s in zip(param_ranges, subs)]).T
+
+    def _open_results(self, num_points, objectives_shape=None,
+                      results_path=None):
+        """
+        Returns the arrays the fitnesses and the flags marking the evaluated
+        points are stored in, which are memory-mapped from the results files
+        if a results path was provided (and reopened if they already exist).
+        Returns (None, None) if the number of objectives isn't known yet and
+        there aren't any existing results
+
+        `num_points`       -- the number of points in the grid [int]
+        `objectives_shape` -- the shape of the fitnesses returned for each
+                              candidate, () for a single objective [tuple]
+        `results_path`     -- the path of the results file if not the
+                              results_path of the algorithm [str]
+        """
+        if results_path is None:
+            results_path = self.results_path
+        if results_path is None:
+            if objectives_shape is None:
+                return None, None
+            fitnesses = numpy.empty(tuple(objectives_shape) + (num_points,))
+            fitnesses.fill(numpy.nan)
+            return fitnesses, None
+        done_path = self._done_path(results_path)
+        if os.path.exists(results_path) and os.path.exists(done_path):
+            fitnesses = open_memmap(results_path, mode='r+')
+            done = open_memmap(done_path, mode='r+')
+            if fitnesses.shape[-1] != num_points or len(done) != num_points:
+                raise Exception("Existing grid results at '{}' don't match "
+                                "the number of grid points ({})"
+                                .format(results_path, num_points))
+            return fitnesses, done
+        if objectives_shape is None:
+            return None, None
+        fitnesses = open_memmap(results_path, mode='w+', dtype=float,
+                                shape=tuple(objectives_shape) + (num_points,))
+        fitnesses.fill(numpy.nan)
+        done = open_memmap(done_path, mode='w+', dtype=bool,
+                           shape=(num_points,))
+        return fitnesses, done
+
+    def _done_path(self, results_path=None):
+        """
+        The path of the file marking the points of the grid (or of the results
+        file provided) that have been evaluated, or None if the results aren't
+        saved
+        """
+        if results_path is None:
+            results_path = self.results_path
+        if results_path is None:
+            return None
+        return os.path.splitext(results_path)[0] + '.done.npy'
+
+    def _partition_path(self, part, num_parts, contiguous):
+        """
+        The path of the file the fitnesses of a partition of the grid are
+        written to until they are assembled, or None if the results aren't
+        saved (glob patterns can be passed for the partition fields)
+        """
+        if self.results_path is None:
+            return None
+        if contiguous != '*':
+            contiguous = 'contiguous' if contiguous else 'strided'
+        return (os.path.splitext(self.results_path)[0] +
+                '.{}-part{}of{}.npy'.format(contiguous, part, num_parts))
+
+    def _nanargmin(self, fitnesses):
+        """
+        Returns the index of the minimum fitness ignoring bad (NaN) fitnesses,
+        scanning the (potentially memory-mapped) fitnesses a chunk at a time
+        """
+        best_index = 0
+        best_value = numpy.inf
+        for start in xrange(0, len(fitnesses), self.chunk_size):
+            chunk = numpy.asarray(fitnesses[start:start + self.chunk_size])
+            valid = ~numpy.isnan(chunk)
+            if valid.any():
+                i = numpy.flatnonzero(valid)[chunk[valid].argmin()]
+                if chunk[i] < best_value:
+                    best_index = start + i
+                    best_value = chunk[i]
+        return best_index
+
+
+class AdaptiveGridAlgorithm(GridAlgorithm):
+    """
+    A grid "algorithm" that evaluates a coarse lattice over the parameter
+    bounds and then repeatedly halves the spacing within only the cells that
+    contain a local minimum or have the largest variation in fitness across
+    their corners, until the spacing of the full grid is reached. The fitnesses
+    of the points that aren't evaluated are linearly interpolated from those of
+    the coarser lattices so the returned grid has the same form as the one
+    returned by GridAlgorithm
+    """
+
+    def __init__(self, num_steps, num_levels=3, refine_fraction=0.1,
+                 chunk_size=4096):
+        """
+        `num_steps`       -- the number of steps along each dimension of the
+                             full grid, which must be one more than a
+                             multiple of 2 ** num_levels [int or list(int)]
+        `num_levels`      -- the number of times the spacing of the initial
+                             coarse lattice is halved to reach the full grid
+                             [int]
+        `refine_fraction` -- the fraction of the cells of each lattice with
+                             the largest variation in fitness that are
+                             refined in addition to the cells containing a
+                             local minimum [float]
+        `chunk_size`      -- the maximum number of grid points passed to the
+                             evaluator at a time [int]
+        """
+        super(AdaptiveGridAlgorithm, self).__init__(num_steps,
+                                                    chunk_size=chunk_size)
+        self.num_levels = int(num_levels)
+        self.refine_fraction = refine_fraction
+
+    def optimize(self, evaluator, **kwargs):  # @UnusedVariable
+        num_steps = self._get_num_steps()
+        stride = 2 ** self.num_levels
+        if any((num_steps - 1) % stride):
+            raise Exception("Number of steps ({}) must be one more than a "
+                            "multiple of 2 ** num_levels ({}) along each "
+                            "dimension".format(list(num_steps), stride))
+        param_ranges = self._param_ranges(num_steps)
+        shape = tuple(num_steps)
+        evaluated = numpy.zeros(shape, dtype=bool)
+        # Evaluate the coarse lattice
+        to_evaluate = numpy.zeros(shape, dtype=bool)
+        to_evaluate[self._lattice(shape, stride)] = True
+        fitnesses = self._evaluate_points(evaluator, to_evaluate, param_ranges,
+                                          None, evaluated)
+        # Refine the cells of each lattice selected from its fitnesses
+        while stride > 1:
+            refine = self._cells_to_refine(fitnesses, evaluated, stride)
+            stride //= 2
+            to_evaluate = numpy.zeros(shape, dtype=bool)
+            to_evaluate[self._lattice(shape, stride)] = refine
+            to_evaluate &= ~evaluated
+            fitnesses = self._evaluate_points(evaluator, to_evaluate,
+                                              param_ranges, fitnesses,
+                                              evaluated)
+        self.num_evaluations = int(evaluated.sum())
+        # Get the fittest of the evaluated candidates (the fitnesses of the
+        # points that weren't evaluated are still NaN at this point)
+        objective_fitnesses = fitnesses.reshape((-1,) + shape)
+        fittest_candidate = [
+            numpy.array([r[i] for r, i in zip(
+                param_ranges, numpy.unravel_index(self._nanargmin(f.ravel()),
+                                                  shape))])
+            for f in objective_fitnesses]
+        grid = self._interpolate(fitnesses, evaluated, 2 ** self.num_levels)
+        # Reorder the grid into the same layout as GridAlgorithm
+        grid = numpy.array([self._grid_layout(g)
+                            for g in grid.reshape((-1,) + shape)])
+        if fitnesses.ndim == len(shape):
+            return fittest_candidate[0], grid[0]
+        else:
+            return fittest_candidate, grid
+
+    def _evaluate_points(self, evaluator, to_evaluate, param_ranges,
+                         fitnesses, evaluated):
+        """
+        Evaluates the selected grid points a chunk at a time, storing their
+        fitnesses and marking them as evaluated. Returns the fitnesses array,
+        which is allocated once the number of objectives is known
+        """
+        shape = to_evaluate.shape
+        points = numpy.flatnonzero(to_evaluate)
+        for start in xrange(0, len(points), self.chunk_size):
+            chunk = points[start:start + self.chunk_size]
+            subs = numpy.unravel_index(chunk, shape)
+            candidates = numpy.array([r[s]
+                                      for r, s in zip(param_ranges, subs)]).T
+            chunk_fitnesses = numpy.array(evaluator(candidates))
+            if fitnesses is None:
+                fitnesses = numpy.empty(chunk_fitnesses.shape[1:] + shape)
+                fitnesses.fill(numpy.nan)
+            fitnesses.reshape(fitnesses.shape[:-len(shape)] + (-1,))[
+                                                ..., chunk] = chunk_fitnesses.T
+            evaluated.flat[chunk] = True
+        return fitnesses
+
+    def _cells_to_refine(self, fitnesses, evaluated, stride):
+        """
+        Selects the cells of the lattice with the given spacing that contain a
+        local minimum or whose variation in fitness is in the top
+        refine_fraction, out of the cells whose corners have all been
+        evaluated. Returns a mask over the lattice with half the spacing
+        marking the points within the selected cells
+        """
+        lattice = self._lattice(evaluated.shape, stride)
+        known = evaluated[lattice]
+        cell_shape = tuple(max(m - 1, 1) for m in known.shape)
+        corners = [tuple(slice(o, o + c) for o, c in zip(offset, cell_shape))
+                   for offset in product(*[(0, 1) if m > 1 else (0,)
+                                           for m in known.shape])]
+        complete = numpy.all([known[c] for c in corners], axis=0)
+        selected = numpy.zeros(cell_shape, dtype=bool)
+        for values in fitnesses[(Ellipsis,) + lattice].reshape(
+                                                        (-1,) + known.shape):
+            minima = self._local_minima(values, known)
+            selected |= numpy.any([minima[c] for c in corners], axis=0)
+            if self.refine_fraction > 0.0:
+                corner_values = numpy.array([values[c] for c in corners])
+                is_nan = numpy.isnan(corner_values)
+                spread = (numpy.where(is_nan, -numpy.inf,
+                                      corner_values).max(axis=0) -
+                          numpy.where(is_nan, numpy.inf,
+                                      corner_values).min(axis=0))
+                valid = complete & numpy.isfinite(spread)
+                if valid.any():
+                    threshold = numpy.percentile(
+                        spread[valid], 100.0 * (1.0 - self.refine_fraction))
+                    selected |= valid & (spread >= threshold) & (spread > 0.0)
+        selected &= complete
+        # Mark the points of the half-spaced lattice within the selected cells
+        # by placing the selection at the first corner of each cell and
+        # dilating it along each dimension
+        refine = numpy.zeros(tuple(2 * m - 1 for m in known.shape),
+                             dtype=bool)
+        refine[tuple(slice(None, 2 * c, 2) for c in cell_shape)] = selected
+        for dim in xrange(refine.ndim):
+            if refine.shape[dim] > 1:
+                view = numpy.rollaxis(refine, dim)
+                first = view[:-1].copy()
+                view[1:] |= first
+                view[2:] |= first[:-1]
+        return refine
+
+    @classmethod
+    def _local_minima(cls, values, known):
+        """
+        Marks the evaluated points of a lattice that are no greater than any of
+        their evaluated neighbours along each axis and less than at least one
+        """
+        values = numpy.where(known & ~numpy.isnan(values), values, numpy.inf)
+        minima = numpy.isfinite(values)
+        lower = numpy.zeros(values.shape, dtype=bool)
+        for dim in xrange(values.ndim):
+            v = numpy.rollaxis(values, dim)
+            m = numpy.rollaxis(minima, dim)
+            l = numpy.rollaxis(lower, dim)
+            m[:-1] &= v[:-1] <= v[1:]
+            m[1:] &= v[1:] <= v[:-1]
+            l[:-1] |= v[:-1] < v[1:]
+            l[1:] |= v[1:] < v[:-1]
+        return minima & lower
+
+    @classmethod
+    def _interpolate(cls, fitnesses, evaluated, stride):
+        """
+        Fills in the fitnesses of the points that weren't evaluated by
+        multilinear interpolation from successively finer lattices, starting
+        from the coarse lattice (which is always fully evaluated)
+        """
+        grid = fitnesses.copy()
+        shape = evaluated.shape
+        while stride > 1:
+            half = stride // 2
+            for dim in xrange(len(shape)):
+                # The midpoints along this dimension, on the finer lattice
+                # along the preceding dimensions and the coarser lattice along
+                # the following ones
+                index = [slice(None, None, half)] * dim
+                index.extend([slice(None, None, stride)] *
+                             (len(shape) - dim - 1))
+                mid = list(index)
+                mid.insert(dim, slice(half, None, stride))
+                before = list(index)
+                before.insert(dim, slice(None, -1, stride))
+                after = list(index)
+                after.insert(dim, slice(stride, None, stride))
+                mid, before, after = tuple(mid), tuple(before), tuple(after)
+                numpy.copyto(grid[(Ellipsis,) + mid],
+                             0.5 * (grid[(Ellipsis,) + before] +
+                                    grid[(Ellipsis,) + after]),
+                             where=~evaluated[mid])
+            stride = half
+        return grid
+
+    @classmethod
+    def _lattice(cls, shape, stride):
+        return tuple(slice(None, None, stride) for _ in shape)
+
+    @classmethod
+    def _grid_layout(cls, grid):
+        """
+        Reorders a grid indexed by the parameter indices into the layout of
+        the grids returned by GridAlgorithm (see grid_candidates)
+        """
+        if grid.ndim > 1:
+            grid = numpy.reshape(grid.swapaxes(0, 1).ravel(), grid.shape)
+        return grid
@@ -5,6 +5,8 @@ provided by the inspyred library (https://pypi.python.org/pypi/inspyred)
 """
 from __future__ import absolute_import, print_function
 import os.path
+import sys
+import threading
 from copy import copy
 from abc import ABCMeta  # Metaclass for abstract base classes
 from time import time
@@ -27,6 +29,13 @@ class InspyredAlgorithm(Algorithm):
     _ea_defaults = {'terminator': ec.terminators.generation_termination,
                     'observer': [ec.observers.best_observer]}
 
+    # The replacers that only keep the best of the current population and the
+    # offspring, so an offspring less fit than the least fit individual of the
+    # population is discarded whatever its exact fitness (plus replacement
+    # only if all of the population are selected as parents)
+    _cutoff_replacers = (ec.replacers.truncation_replacement,
+                         ec.replacers.plus_replacement)
+
     def __init__(self, pop_size, output_dir=os.getcwd(),
                  max_generations=100, seeds=None, random_seed=None, **kwargs):
         """
@@ -60,8 +69,133 @@ class InspyredAlgorithm(Algorithm):
         self.output_dir = output_dir
         self.set_random_seed(random_seed)
         self.set_seeds(seeds)
+        self._ask_tell = None
 
     def optimize(self, evaluator, **kwargs):
+        return self._evolve(evaluator, **kwargs)
+
+    def ask(self, num_candidates=None, **kwargs):
+        """
+        Returns candidates of the current generation that haven't been asked
+        for yet. The inspyred evolve loop is run in a background thread, which
+        waits at each generation until the fitnesses of all of its candidates
+        have been told. Returns an empty list if all the candidates of the
+        current generation have been asked for or the evolution has finished
+
+        `num_candidates` -- the maximum number of candidates to return, the
+                            rest of the generation if None [int]
+        `kwargs`         -- optional arguments passed to the optimisation
+                            algorithm, which start the evolution so can only
+                            be passed to the first call
+        """
+        if self._ask_tell is None:
+            self._start_ask_tell(**kwargs)
+        elif kwargs:
+            raise Exception("Optimisation arguments ('{}') can only be passed "
+                            "to the first call of ask, which starts the "
+                            "evolution".format("', '".join(kwargs)))
+        state = self._ask_tell
+        with state['condition']:
+            self._wait_for_generation()
+            unasked = state['unasked']
+            if num_candidates is None:
+                num_candidates = len(unasked)
+            asked = unasked[:num_candidates]
+            del unasked[:num_candidates]
+            # The candidates are cleared once the whole generation has been
+            # told so they need to be retrieved before the lock is released
+            return [state['candidates'][i] for i in asked]
+
+    def tell(self, candidates, fitnesses):
+        """
+        Returns the fitnesses of candidates of the current generation, the
+        evolution continuing once all of them have been told
+
+        `candidates` -- the evaluated candidates [list(list(float))]
+        `fitnesses`  -- the fitnesses of the candidates [list]
+        """
+        state = self._ask_tell
+        if state is None:
+            raise Exception("Candidates were told before any were asked for")
+        with state['condition']:
+            for candidate, fitness in zip(candidates, fitnesses):
+                try:
+                    index = state['indices'][tuple(candidate)].pop()
+                except (KeyError, IndexError):
+                    raise Exception("Told candidate {} is not part of the "
+                                    "current generation".format(candidate))
+                state['fitnesses'][index] = fitness
+                state['remaining'] -= 1
+            if not state['remaining']:
+                # Mark the generation as finished here rather than in the
+                # evolve thread, so that ask and stop wait for the next one
+                # instead of returning the told generation again
+                state['candidates'] = None
+                state['condition'].notify_all()
+
+    def stop(self):
+        # The evolution is started by the first call of ask (so that it can
+        # be passed the optimisation arguments) and can't have finished before
+        if self._ask_tell is None:
+            return False
+        with self._ask_tell['condition']:
+            self._wait_for_generation()
+            return self._ask_tell['result'] is not None
+
+    def result(self):
+        return self._ask_tell['result']
+
+    def _start_ask_tell(self, **kwargs):
+        """
+        Starts the evolve loop in a background thread with an evaluator that
+        hands the generations over to ask and tell
+        """
+        state = self._ask_tell = {'condition': threading.Condition(),
+                                  'candidates': None, 'result': None,
+                                  'error': None}
+
+        def ask_tell_evaluator(candidates, args=None,  # @UnusedVariable
+                               cutoffs=None):  # @UnusedVariable
+            with state['condition']:
+                indices = {}
+                for i, candidate in enumerate(candidates):
+                    indices.setdefault(tuple(candidate), []).append(i)
+                state.update(candidates=candidates, indices=indices,
+                             unasked=range(len(candidates)),
+                             fitnesses=[None] * len(candidates),
+                             remaining=len(candidates))
+                state['condition'].notify_all()
+                while state['remaining']:
+                    state['condition'].wait()
+                return state['fitnesses']
+
+        def run():
+            try:
+                result = self._evolve(ask_tell_evaluator, **kwargs)
+            except Exception:
+                result = None
+                state['error'] = sys.exc_info()
+            with state['condition']:
+                state['result'] = result if result is not None else ()
+                state['condition'].notify_all()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _wait_for_generation(self):
+        """
+        Waits (with the condition of the ask/tell state acquired) until the
+        evolve loop has passed over a new generation or finished, re-raising
+        any exception raised in it
+        """
+        state = self._ask_tell
+        while state['candidates'] is None and state['result'] is None:
+            state['condition'].wait()
+        if state['error'] is not None:
+            raise state['error'][0], state['error'][1], state['error'][2]
+
+    def _evolve(self, evaluator, **kwargs):
         if not self.tuner:
             raise Exception("optimize method of algorithm must be called from "
                             "within tuner")
@@ -89,7 +223,7 @@ class InspyredAlgorithm(Algorithm):
                             .format(stats_path))
         with open(stats_path, 'w') as stats_f, open(indiv_path, 'w') as ind_f:
             pop = ea.evolve(generator=self.uniform_random_chromosome,
-                            evaluator=evaluator,
+                            evaluator=self._cutoff_evaluator(evaluator, ea),
                             pop_size=self.pop_size,
                             bounder=ec.Bounder(*zip(*self.constraints)),
                             maximize=False,
@@ -99,6 +233,31 @@ class InspyredAlgorithm(Algorithm):
                             **evolve_kwargs)
         return pop, ea
 
+    def _cutoff_evaluator(self, evaluator, ea):
+        """
+        If the offspring only survive by being fitter than the least fit
+        individual of the population, wraps the evaluator to pass the fitness
+        of that individual as the cutoff for each offspring, above which the
+        objective can return a lower bound instead of the exact fitness (see
+        objective.multi.WeightedSumObjective)
+
+        `evaluator` -- the evaluator passed to the optimize method [function]
+        `ea`        -- the evolutionary computation [inspyred.ec]
+        """
+        if (ea.replacer not in self._cutoff_replacers or
+                (ea.replacer is ec.replacers.plus_replacement and
+                 ea.selector is not ec.selectors.default_selection)):
+            return evaluator
+
+        def cutoff_evaluator(candidates, args):
+            # The initial population is evaluated exactly
+            if not ea.population:
+                return evaluator(candidates, args)
+            cutoff = min(ea.population).fitness
+            return evaluator(candidates, args,
+                             cutoffs=[cutoff] * len(candidates))
+        return cutoff_evaluator
+
     def set_random_seed(self, seed=None):
         if seed is None:
             seed = (long(time() * 256))
@@ -107,21 +266,31 @@ class InspyredAlgorithm(Algorithm):
     def set_seeds(self, seeds):
         self.seeds = seeds
 
+    def jump_random_state(self, n):
+        """
+        Changes the state of the random number generator to one far along its
+        sequence, so that copies of the algorithm (e.g. on different islands)
+        generate independent candidates
+
+        `n` -- the number of the jump [int]
+        """
+        self._rng.jumpahead(n)
+
 
 class MultiObjectiveInspyredAlgorithm(InspyredAlgorithm):
 
     # Declare this class abstract to avoid accidental construction
     __metaclass__ = ABCMeta
 
-    def optimize(self, evaluator, **kwargs):
+    def _evolve(self, evaluator, **kwargs):
         # Wrap the list returned from the multi-objective objective in the
         # required class after it is evaluated (this saves having to import the
         # inspyred module into objective.combined, an allows it to be more
         # general)
         def pareto_evaluator(candidates, args):  # @UnusedVariable
             return ec.emo.Pareto(evaluator(candidates))
-        super(MultiObjectiveInspyredAlgorithm, self).optimize(pareto_evaluator,
-                                                              **kwargs)
+        return super(MultiObjectiveInspyredAlgorithm, self)._evolve(
+                                                   pareto_evaluator, **kwargs)
 
 
 class GAAlgorithm(InspyredAlgorithm):
@@ -0,0 +1,287 @@
+"""
+Space-filling (quasi-random) sampling of the parameter space, which covers
+the bounds far more evenly per evaluation than uniform grids in more than a
+few dimensions
+"""
+from __future__ import absolute_import
+import os.path
+import numpy
+from . import Algorithm
+
+
+class QuasiRandomAlgorithm(Algorithm):
+    """
+    Evaluates a Sobol, Halton or Latin hypercube design over the parameter
+    bounds in batches, keeping the best candidates and (optionally) a table of
+    all evaluated candidates and their fitnesses on disk. The samples are
+    uniform over the bounds of the candidates, which for log-scaled parameters
+    are the bounds of the exponents so the samples are log-uniform in the
+    parameter values
+    """
+
+    BAD_FITNESS_VALUE = float('nan')
+
+    SAMPLING_METHODS = ('sobol', 'halton', 'latin_hypercube')
+
+    # The degree, the (interior) coefficients of the primitive polynomial and
+    # the initial direction numbers of each dimension of the Sobol sequence
+    # after the first (from Joe & Kuo, 2008)
+    SOBOL_DIRECTIONS = [(1, 0, [1]),
+                        (2, 1, [1, 3]),
+                        (3, 1, [1, 3, 1]),
+                        (3, 2, [1, 1, 1]),
+                        (4, 1, [1, 1, 3, 3]),
+                        (4, 4, [1, 3, 5, 13]),
+                        (5, 2, [1, 1, 5, 5, 17]),
+                        (5, 4, [1, 1, 5, 5, 5]),
+                        (5, 7, [1, 1, 7, 11, 19]),
+                        (5, 11, [1, 1, 5, 1, 1]),
+                        (5, 13, [1, 1, 1, 3, 11]),
+                        (5, 14, [1, 3, 5, 5, 31]),
+                        (6, 1, [1, 3, 3, 9, 7, 49]),
+                        (6, 13, [1, 1, 1, 15, 21, 21]),
+                        (6, 16, [1, 3, 1, 13, 27, 49]),
+                        (6, 19, [1, 1, 1, 15, 7, 5]),
+                        (6, 22, [1, 3, 1, 15, 13, 25]),
+                        (6, 25, [1, 1, 5, 5, 19, 61]),
+                        (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+                        (7, 4, [1, 3, 7, 13, 13, 15, 69])]
+    SOBOL_BITS = 32
+
+    def __init__(self, num_samples, method='sobol', batch_size=256,
+                 num_best=10, results_path=None, random_seed=None,
+                 randomize=False):
+        """
+        `num_samples`  -- the total number of samples to evaluate [int]
+        `method`       -- the sampling method, one of 'sobol', 'halton' or
+                          'latin_hypercube' [str]
+        `batch_size`   -- the number of samples passed to the evaluator at a
+                          time [int]
+        `num_best`     -- the number of best candidates kept (for each
+                          objective) [int]
+        `results_path` -- the path of a (comma-separated) table the samples
+                          and their fitnesses are appended to as each batch
+                          completes. If the table already exists the samples
+                          in it are skipped, so an interrupted run can be
+                          resumed (with the same random seed) [str]
+        `random_seed`  -- the seed for the Latin hypercube design and the
+                          random shifts of the Sobol and Halton sequences
+                          [int]
+        `randomize`    -- whether the Sobol and Halton sequences are randomly
+                          shifted (modulo 1), which gives independent designs
+                          for different seeds [bool]
+        """
+        if method not in self.SAMPLING_METHODS:
+            raise Exception("Unrecognised sampling method '{}', can be one of "
+                            "'{}'".format(method,
+                                          "', '".join(self.SAMPLING_METHODS)))
+        self.num_samples = int(num_samples)
+        self.method = method
+        self.batch_size = batch_size
+        self.num_best = num_best
+        self.results_path = results_path
+        self.random_seed = random_seed
+        self.randomize = randomize
+        self.tuner = None
+
+    def set_tune_parameters(self, tune_parameters):
+        super(QuasiRandomAlgorithm, self).set_tune_parameters(tune_parameters)
+        if (self.method == 'sobol' and
+                self.genome_size > len(self.SOBOL_DIRECTIONS) + 1):
+            raise Exception("Sobol sampling is only supported for up to {} "
+                            "parameters ({} provided), use 'halton' or "
+                            "'latin_hypercube' instead"
+                            .format(len(self.SOBOL_DIRECTIONS) + 1,
+                                    self.genome_size))
+        self.parameter_names = [p.name for p in tune_parameters]
+
+    def optimize(self, evaluator, **kwargs):  # @UnusedVariable
+        """
+        Evaluates the samples and returns the best candidates and their
+        fitnesses (lists of them for each objective if multi-objective)
+        """
+        rng = numpy.random.RandomState(self.random_seed)
+        if self.method == 'latin_hypercube':
+            unit_samples = self.latin_hypercube(self.num_samples,
+                                                self.genome_size, rng)
+        else:
+            shift = (rng.uniform(size=self.genome_size) if self.randomize
+                     else None)
+        lbounds, ubounds = (numpy.array(b, dtype=float)
+                            for b in zip(*self.constraints))
+        best_candidates = best_fitnesses = None
+        # Load the samples evaluated in a previous run
+        start = 0
+        if self.results_path is not None and os.path.exists(
+                                                           self.results_path):
+            table = numpy.loadtxt(self.results_path, delimiter=',',
+                                  skiprows=1, ndmin=2)
+            if table.size:
+                start = int(table[:, 0].max()) + 1
+                candidates = table[:, 1:self.genome_size + 1]
+                fitnesses = table[:, self.genome_size + 1:]
+                best_candidates, best_fitnesses = self._update_best(
+                    best_candidates, best_fitnesses, candidates, fitnesses)
+        for batch_start in xrange(start, self.num_samples, self.batch_size):
+            indices = numpy.arange(batch_start,
+                                   min(batch_start + self.batch_size,
+                                       self.num_samples))
+            if self.method == 'latin_hypercube':
+                unit = unit_samples[indices]
+            else:
+                if self.method == 'sobol':
+                    unit = self.sobol(indices, self.genome_size)
+                else:
+                    unit = self.halton(indices, self.genome_size)
+                if shift is not None:
+                    unit = (unit + shift) % 1.0
+            candidates = lbounds + unit * (ubounds - lbounds)
+            fitnesses = numpy.array(evaluator(candidates), dtype=float)
+            fitnesses = fitnesses.reshape((len(candidates), -1))
+            if self.results_path is not None:
+                self._append_results(indices, candidates, fitnesses)
+            best_candidates, best_fitnesses = self._update_best(
+                best_candidates, best_fitnesses, candidates, fitnesses)
+        if best_fitnesses is None:
+            raise Exception("No samples were evaluated")
+        if len(best_fitnesses) == 1:
+            return best_candidates[0], best_fitnesses[0]
+        return best_candidates, best_fitnesses
+
+    def _update_best(self, best_candidates, best_fitnesses, candidates,
+                     fitnesses):
+        """
+        Merges the evaluated candidates into the best candidates for each
+        objective, ignoring bad (NaN) fitnesses
+        """
+        if best_fitnesses is None:
+            best_candidates = [numpy.empty((0, self.genome_size))
+                               for _ in xrange(fitnesses.shape[1])]
+            best_fitnesses = [numpy.empty(0)
+                              for _ in xrange(fitnesses.shape[1])]
+        for i, column in enumerate(fitnesses.T):
+            valid = ~numpy.isnan(column)
+            merged_fitnesses = numpy.concatenate((best_fitnesses[i],
+                                                  column[valid]))
+            merged_candidates = numpy.concatenate((best_candidates[i],
+                                                   candidates[valid]))
+            order = numpy.argsort(merged_fitnesses,
+                                  kind='mergesort')[:self.num_best]
+            best_fitnesses[i] = merged_fitnesses[order]
+            best_candidates[i] = merged_candidates[order]
+        return best_candidates, best_fitnesses
+
+    def _append_results(self, indices, candidates, fitnesses):
+        """
+        Appends the evaluated samples to the results table, writing the header
+        if the table is new
+        """
+        is_new = not os.path.exists(self.results_path)
+        with open(self.results_path, 'a') as f:
+            if is_new:
+                if fitnesses.shape[1] == 1:
+                    fitness_names = ['fitness']
+                else:
+                    fitness_names = ['fitness{}'.format(i)
+                                     for i in xrange(fitnesses.shape[1])]
+                f.write(','.join(['index'] + self.parameter_names +
+                                 fitness_names) + '\n')
+            numpy.savetxt(f, numpy.hstack((indices[:, None], candidates,
+                                           fitnesses)),
+                          delimiter=',',
+                          fmt=['%d'] + ['%.17g'] * (candidates.shape[1] +
+                                                    fitnesses.shape[1]))
+            f.flush()
+
+    @classmethod
+    def sobol(cls, indices, num_dims):
+        """
+        Returns the points of the Sobol sequence at the given indices, which
+        are generated independently of each other from the Gray code of each
+        index
+
+        `indices`  -- the indices of the points in the sequence
+                      [numpy.array(int)]
+        `num_dims` -- the number of dimensions [int]
+        """
+        directions = cls._sobol_directions(num_dims)
+        indices = numpy.asarray(indices, dtype=numpy.uint64)
+        gray = indices ^ (indices >> numpy.uint64(1))
+        points = numpy.zeros((len(indices), num_dims), dtype=numpy.uint64)
+        for bit in xrange(cls.SOBOL_BITS):
+            is_set = ((gray >> numpy.uint64(bit)) &
+                      numpy.uint64(1)).astype(bool)
+            points[is_set] ^= directions[:, bit]
+        return points / float(2 ** cls.SOBOL_BITS)
+
+    @classmethod
+    def _sobol_directions(cls, num_dims):
+        """
+        Returns the direction numbers (scaled to SOBOL_BITS bits) of each
+        dimension of the Sobol sequence
+        """
+        nbits = cls.SOBOL_BITS
+        directions = numpy.empty((num_dims, nbits), dtype=numpy.uint64)
+        # The first dimension is the van der Corput sequence in base 2
+        directions[0] = [1 << (nbits - 1 - k) for k in xrange(nbits)]
+        for dim, (degree, coeffs, initial) in zip(
+                xrange(1, num_dims), cls.SOBOL_DIRECTIONS):
+            m = list(initial)
+            for k in xrange(degree, nbits):
+                new = m[k - degree] ^ (m[k - degree] << degree)
+                for j in xrange(1, degree):
+                    if (coeffs >> (degree - 1 - j)) & 1:
+                        new ^= m[k - j] << j
+                m.append(new)
+            directions[dim] = [m[k] << (nbits - 1 - k) for k in xrange(nbits)]
+        return directions
+
+    @classmethod
+    def halton(cls, indices, num_dims):
+        """
+        Returns the points of the Halton sequence at the given indices (the
+        radical inverses of each index in the first num_dims prime bases)
+
+        `indices`  -- the indices of the points in the sequence
+                      [numpy.array(int)]
+        `num_dims` -- the number of dimensions [int]
+        """
+        points = numpy.zeros((len(indices), num_dims))
+        for dim, base in enumerate(cls._primes(num_dims)):
+            remaining = numpy.array(indices, dtype=numpy.int64)
+            scale = 1.0 / base
+            while remaining.any():
+                points[:, dim] += scale * (remaining % base)
+                remaining //= base
+                scale /= base
+        return points
+
+    @classmethod
+    def _primes(cls, num):
+        """
+        Returns the first num prime numbers
+        """
+        primes = []
+        candidate = 2
+        while len(primes) < num:
+            if all(candidate % p for p in primes):
+                primes.append(candidate)
+            candidate += 1
+        return primes
+
+    @classmethod
+    def latin_hypercube(cls, num_samples, num_dims, rng):
+        """
+        Returns a Latin hypercube design over the unit hypercube, in which
+        each dimension is split into num_samples strata that each contain
+        exactly one sample
+
+        `num_samples` -- the number of samples [int]
+        `num_dims`    -- the number of dimensions [int]
+        `rng`         -- the random number generator
+                         [numpy.random.RandomState]
+        """
+        strata = numpy.array([rng.permutation(num_samples)
+                              for _ in xrange(num_dims)]).T
+        return (strata + rng.uniform(size=(num_samples, num_dims))) / \
+            num_samples
@@ -0,0 +1,124 @@
+"""
+Multi-fidelity evaluation by successive halving, in which candidates are
+screened by cheap, reduced fidelity simulations (shorter recordings and
+coarser timesteps) and only the most promising are promoted to full fidelity
+"""
+from __future__ import absolute_import
+import math
+import numpy
+from . import Algorithm
+from ..simulation import Fidelity
+
+
+class SuccessiveHalvingAlgorithm(Algorithm):
+    """
+    Wraps another (single-objective) algorithm and evaluates each batch of
+    candidates it passes to the evaluator (e.g. the offspring of a generation)
+    by successive halving. The batch is evaluated at the lowest fidelity, the
+    best promote_fraction of it at the next fidelity and so on until the
+    remaining candidates are evaluated at full fidelity. The candidates that
+    aren't promoted are ranked behind all of those evaluated at full fidelity
+    (those eliminated at higher fidelities ahead of those eliminated at lower
+    ones) by giving them fitnesses above the worst full fidelity fitness of
+    the batch, so they should be combined with rank-based selection
+    """
+
+    def __init__(self, algorithm, fidelities=(Fidelity(0.1, 4),),
+                 promote_fraction=1.0 / 3.0):
+        """
+        `algorithm`        -- the algorithm whose candidates are evaluated
+                              [neurotune.algorithm.Algorithm]
+        `fidelities`       -- the reduced fidelities the candidates are
+                              screened at, in increasing order of fidelity
+                              [list(simulation.Fidelity)]
+        `promote_fraction` -- the fraction of the candidates evaluated at each
+                              fidelity that are promoted to the next [float]
+        """
+        if not 0.0 < promote_fraction <= 1.0:
+            raise Exception("Fraction of candidates to promote ({}) must be "
+                            "in the range (0, 1]".format(promote_fraction))
+        self.algorithm = algorithm
+        self.fidelities = list(fidelities)
+        self.promote_fraction = promote_fraction
+        # The number of evaluations at each reduced fidelity and full fidelity
+        self.num_evaluations = [0] * (len(self.fidelities) + 1)
+
+    @property
+    def tuner(self):
+        return self.algorithm.tuner
+
+    @tuner.setter
+    def tuner(self, tuner):
+        self.algorithm.tuner = tuner
+
+    @property
+    def BAD_FITNESS_VALUE(self):
+        return self.algorithm.BAD_FITNESS_VALUE
+
+    def set_tune_parameters(self, tune_parameters):
+        super(SuccessiveHalvingAlgorithm, self).set_tune_parameters(
+                                                              tune_parameters)
+        self.algorithm.set_tune_parameters(tune_parameters)
+
+    def optimize(self, evaluator, **kwargs):
+        def halving_evaluator(candidates, args=None,  # @UnusedVariable
+                              cutoffs=None):
+            return self._successive_halving(evaluator, candidates, cutoffs)
+        return self.algorithm.optimize(halving_evaluator, **kwargs)
+
+    def _successive_halving(self, evaluator, candidates, cutoffs=None):
+        """
+        Evaluates the candidates at successively higher fidelities, promoting
+        the best fraction at each. The cutoffs of the candidates are only
+        passed on to the evaluator at full fidelity, as the candidates are
+        ranked against each other at the reduced fidelities
+        """
+        remaining = range(len(candidates))
+        # The rung each eliminated candidate was eliminated at and its rank
+        # (as a fraction) amongst the eliminated candidates of that rung
+        eliminated = []
+        for rung, fidelity in enumerate(self.fidelities):
+            num_promoted = int(math.ceil(self.promote_fraction *
+                                         len(remaining)))
+            if num_promoted >= len(remaining):
+                continue
+            fitnesses = self._scalar_fitnesses(evaluator(
+                [candidates[i] for i in remaining], fidelity=fidelity))
+            self.num_evaluations[rung] += len(remaining)
+            order = numpy.argsort(fitnesses, kind='mergesort')
+            num_eliminated = len(remaining) - num_promoted
+            eliminated.extend((rung, float(rank) / num_eliminated,
+                               remaining[i])
+                              for rank, i in enumerate(order[num_promoted:]))
+            remaining = [remaining[i] for i in order[:num_promoted]]
+        if cutoffs:
+            evaluated = evaluator([candidates[i] for i in remaining],
+                                  cutoffs=[cutoffs[i] for i in remaining])
+        else:
+            evaluated = evaluator([candidates[i] for i in remaining])
+        self.num_evaluations[-1] += len(remaining)
+        fitnesses = [None] * len(candidates)
+        for i, fitness in zip(remaining, evaluated):
+            fitnesses[i] = fitness
+        if eliminated:
+            valid = self._scalar_fitnesses(evaluated)
+            valid = valid[numpy.isfinite(valid) &
+                          (valid < self.BAD_FITNESS_VALUE)]
+            worst = valid.max() if len(valid) else 0.0
+            for rung, rank, i in eliminated:
+                fitnesses[i] = (worst + (len(self.fidelities) - rung) +
+                                rank)
+        return fitnesses
+
+    @classmethod
+    def _scalar_fitnesses(cls, fitnesses):
+        """
+        Converts the fitnesses to an array, with bad (NaN) fitnesses ranked
+        last
+        """
+        if any(numpy.ndim(f) for f in fitnesses):
+            raise Exception("Successive halving only supports single "
+                            "objectives")
+        fitnesses = numpy.array(fitnesses, dtype=float)
+        fitnesses[numpy.isnan(fitnesses)] = numpy.inf
+        return fitnesses
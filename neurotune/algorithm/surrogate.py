@@ -0,0 +1,170 @@
+"""
+Surrogate-assisted optimisation, in which a cheap model fitted to all of the
+candidates evaluated so far is used to pre-screen the candidates proposed by
+the wrapped algorithm so that only the most promising are simulated
+"""
+from __future__ import absolute_import
+import math
+import numpy
+from . import Algorithm
+
+
+class SurrogateAssistedAlgorithm(Algorithm):
+    """
+    Wraps another (single-objective) algorithm and intercepts the batches of
+    candidates it passes to the evaluator (e.g. the offspring produced by the
+    inspyred variators each generation). Once enough candidates have been
+    evaluated, the fitnesses of each batch are predicted by a Gaussian
+    kernel ridge regression over all the evaluated candidates and only the
+    best predicted fraction are simulated. The remaining candidates are given
+    their predicted fitness, but no better than the worst simulated fitness
+    of the batch, so they can't displace simulated candidates from the
+    population
+    """
+
+    def __init__(self, algorithm, evaluate_fraction=1.0 / 3.0,
+                 min_training=20, max_training=500, length_scale=0.2,
+                 regularisation=1e-6):
+        """
+        `algorithm`         -- the algorithm whose candidates are screened
+                               [neurotune.algorithm.Algorithm]
+        `evaluate_fraction` -- the fraction of each batch of candidates that
+                               are simulated [float]
+        `min_training`      -- the number of candidates that are simulated
+                               before the surrogate is used [int]
+        `max_training`      -- the maximum number of (the most recently)
+                               simulated candidates the surrogate is fitted
+                               to [int]
+        `length_scale`      -- the length scale of the Gaussian kernel, as a
+                               fraction of the parameter bounds [float]
+        `regularisation`    -- the ridge added to the diagonal of the kernel
+                               matrix relative to the variance of the
+                               fitnesses [float]
+        """
+        if not 0.0 < evaluate_fraction <= 1.0:
+            raise Exception("Fraction of candidates to evaluate ({}) must be "
+                            "in the range (0, 1]".format(evaluate_fraction))
+        self.algorithm = algorithm
+        self.evaluate_fraction = evaluate_fraction
+        self.min_training = min_training
+        self.max_training = max_training
+        self.length_scale = length_scale
+        self.regularisation = regularisation
+        self.num_simulated = 0
+        self.num_screened = 0
+        self._training_candidates = []
+        self._training_fitnesses = []
+        self._model = None
+
+    @property
+    def tuner(self):
+        return self.algorithm.tuner
+
+    @tuner.setter
+    def tuner(self, tuner):
+        self.algorithm.tuner = tuner
+
+    @property
+    def BAD_FITNESS_VALUE(self):
+        return self.algorithm.BAD_FITNESS_VALUE
+
+    def set_tune_parameters(self, tune_parameters):
+        super(SurrogateAssistedAlgorithm, self).set_tune_parameters(
+                                                              tune_parameters)
+        self.algorithm.set_tune_parameters(tune_parameters)
+
+    def optimize(self, evaluator, **kwargs):
+        def screening_evaluator(candidates, args=None,  # @UnusedVariable
+                                cutoffs=None):
+            return self._screen(evaluator, candidates, cutoffs)
+        return self.algorithm.optimize(screening_evaluator, **kwargs)
+
+    def _screen(self, evaluator, candidates, cutoffs=None):
+        """
+        Simulates the most promising of the candidates and predicts the
+        fitnesses of the rest
+        """
+        num_evaluate = int(math.ceil(self.evaluate_fraction *
+                                     len(candidates)))
+        if (len(self._training_fitnesses) < self.min_training or
+                num_evaluate >= len(candidates)):
+            fitnesses = self._evaluate(evaluator, candidates, cutoffs)
+        else:
+            predicted = self.predict(candidates)
+            order = numpy.argsort(predicted, kind='mergesort')
+            selected = order[:num_evaluate]
+            evaluated = self._evaluate(
+                evaluator, [candidates[i] for i in selected],
+                [cutoffs[i] for i in selected] if cutoffs else None)
+            # Candidates that failed to simulate don't set the floor of the
+            # predicted fitnesses, otherwise the screened candidates would be
+            # treated as failures too
+            valid = [f for f in evaluated
+                     if not numpy.isnan(f) and
+                     f < self.algorithm.BAD_FITNESS_VALUE]
+            worst = max(valid) if valid else -float('inf')
+            fitnesses = [max(float(p), worst) for p in predicted]
+            for i, fitness in zip(selected, evaluated):
+                fitnesses[i] = fitness
+            self.num_screened += len(candidates) - num_evaluate
+        return fitnesses
+
+    def _evaluate(self, evaluator, candidates, cutoffs=None):
+        """
+        Simulates the candidates and adds them to the training set of the
+        surrogate
+        """
+        if cutoffs:
+            fitnesses = evaluator(candidates, cutoffs=cutoffs)
+        else:
+            fitnesses = evaluator(candidates)
+            cutoffs = [None] * len(candidates)
+        self.num_simulated += len(candidates)
+        for candidate, fitness, cutoff in zip(candidates, fitnesses, cutoffs):
+            if numpy.ndim(fitness):
+                raise Exception("Surrogate-assisted optimisation only "
+                                "supports single objectives")
+            # Leave out the candidates that couldn't be simulated and those
+            # whose fitness is only a lower bound above the cutoff
+            if not numpy.isnan(fitness) and \
+                    fitness < self.algorithm.BAD_FITNESS_VALUE and \
+                    (cutoff is None or fitness <= cutoff):
+                self._training_candidates.append(list(candidate))
+                self._training_fitnesses.append(float(fitness))
+        del self._training_candidates[:-self.max_training]
+        del self._training_fitnesses[:-self.max_training]
+        self._model = None
+        return fitnesses
+
+    def predict(self, candidates):
+        """
+        Predicts the fitnesses of the candidates from the simulated
+        candidates
+
+        `candidates` -- the candidates to predict [list(list(float))]
+        """
+        if self._model is None:
+            X = self._normalise(self._training_candidates)
+            y = numpy.array(self._training_fitnesses)
+            mean = y.mean()
+            kernel = self._kernel(X, X)
+            kernel[numpy.diag_indices_from(kernel)] += (
+                self.regularisation * max(y.var(), 1e-12) + 1e-10)
+            self._model = (X, mean, numpy.linalg.solve(kernel, y - mean))
+        X, mean, weights = self._model
+        return mean + self._kernel(self._normalise(candidates), X).dot(weights)
+
+    def _normalise(self, candidates):
+        """
+        Scales the candidates to the unit hypercube of the parameter bounds
+        """
+        lbounds, ubounds = (numpy.array(b, dtype=float)
+                            for b in zip(*self.constraints))
+        return ((numpy.asarray(candidates, dtype=float) - lbounds) /
+                (ubounds - lbounds))
+
+    def _kernel(self, A, B):
+        sq_dists = ((A ** 2).sum(axis=1)[:, None] + (B ** 2).sum(axis=1) -
+                    2.0 * A.dot(B.T))
+        return numpy.exp(-numpy.maximum(sq_dists, 0.0) /
+                         (2.0 * self.length_scale ** 2))
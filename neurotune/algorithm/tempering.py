@@ -0,0 +1,223 @@
+"""
+Parallel tempering (replica exchange), in which many annealing chains at
+different temperatures are advanced simultaneously so that the proposals of
+all the chains can be evaluated in parallel
+"""
+from __future__ import absolute_import
+import math
+from time import time
+import numpy
+from inspyred import ec
+from . import Algorithm
+
+
+class ParallelTemperingAlgorithm(Algorithm):
+    """
+    Runs a Metropolis chain with Gaussian proposals at each of a geometric
+    ladder of temperatures, proposing and evaluating a new candidate for
+    every chain at each generation (as a single batch). Every swap_interval
+    generations the states of neighbouring chains are exchanged with the
+    replica exchange acceptance probability, letting good states found by the
+    hot, exploring chains pass down to the cold chains. Proposals are bounded
+    by the parameter constraints with an inspyred Bounder, as for the inspyred
+    algorithms.
+
+    Candidates can either be evaluated by optimize or requested and returned
+    with ask and tell (see Algorithm.ask)
+    """
+
+    def __init__(self, num_chains=8, min_temperature=1e-3,
+                 max_temperature=1.0, max_generations=100, swap_interval=1,
+                 gaussian_stdev=0.1, cooling_rate=1.0, seeds=None,
+                 random_seed=None):
+        """
+        `num_chains`      -- the number of chains (each of which is evaluated
+                             in parallel) [int]
+        `min_temperature` -- the temperature of the coldest chain, on the
+                             scale of the fitnesses [float]
+        `max_temperature` -- the temperature of the hottest chain [float]
+        `max_generations` -- the number of generations each chain is advanced
+                             [int]
+        `swap_interval`   -- the number of generations between exchanges of
+                             the states of neighbouring chains [int]
+        `gaussian_stdev`  -- the standard deviation of the proposals of the
+                             coldest chain as a fraction of the parameter
+                             bounds, which increases with the square root of
+                             the temperature for the hotter chains [float]
+        `cooling_rate`    -- the factor all the temperatures are multiplied
+                             by each generation (1.0 for constant
+                             temperatures) [float]
+        `seeds`           -- the initial states of the chains, the rest are
+                             drawn uniformly from the bounds
+                             [list(list(float))]
+        `random_seed`     -- the seed of the random number generator [int]
+        """
+        if num_chains < 1:
+            raise Exception("Number of chains must be positive (found {})"
+                            .format(num_chains))
+        self.num_chains = num_chains
+        if num_chains > 1:
+            self.temperatures = numpy.exp(numpy.linspace(
+                math.log(min_temperature), math.log(max_temperature),
+                num_chains))
+        else:
+            self.temperatures = numpy.array([float(min_temperature)])
+        self.max_generations = max_generations
+        self.swap_interval = swap_interval
+        self.gaussian_stdev = gaussian_stdev
+        self.cooling_rate = cooling_rate
+        self.seeds = seeds if seeds is not None else []
+        if random_seed is None:
+            random_seed = int(time() * 256) % (2 ** 32)
+        self._rng = numpy.random.RandomState(random_seed)
+        self.tuner = None
+
+    def set_tune_parameters(self, tune_parameters):
+        super(ParallelTemperingAlgorithm, self).set_tune_parameters(
+                                                              tune_parameters)
+        self.bounder = ec.Bounder(*zip(*self.constraints))
+        self._lbounds, self._ubounds = (numpy.array(b, dtype=float)
+                                        for b in zip(*self.constraints))
+        self.best_candidate = None
+        self.best_fitness = float('inf')
+        self.num_generations = 0
+        self.num_evaluations = 0
+        self.num_accepted = numpy.zeros(self.num_chains, dtype=int)
+        self.num_swaps = numpy.zeros(max(self.num_chains - 1, 0), dtype=int)
+        self.states = None
+        self.fitnesses = None
+        # The initial states of the chains are the first candidates to be
+        # evaluated
+        initial = [list(s) for s in self.seeds[:self.num_chains]]
+        num_random = self.num_chains - len(initial)
+        initial.extend(list(c) for c in self._lbounds + self._rng.uniform(
+                        size=(num_random, self.genome_size)) *
+                       (self._ubounds - self._lbounds))
+        self._set_proposals([self.bounder(c, {}) for c in initial])
+
+    def optimize(self, evaluator, **kwargs):  # @UnusedVariable
+        """
+        Advances the chains for max_generations generations and returns the
+        best candidate and its fitness
+        """
+        return self.optimize_ask_tell(evaluator)
+
+    def ask(self, num_candidates=None):
+        """
+        Returns proposals of the current generation that haven't been asked
+        for yet (one per chain)
+
+        `num_candidates` -- the maximum number of proposals to return, all of
+                            the remaining proposals if None [int]
+        """
+        if num_candidates is None:
+            num_candidates = len(self._unasked)
+        asked = self._unasked[:num_candidates]
+        del self._unasked[:num_candidates]
+        return [self._proposals[i] for i in asked]
+
+    def tell(self, candidates, fitnesses):
+        """
+        Returns the fitnesses of asked proposals (in any order or batch size),
+        advancing the chains once the proposals of every chain have been told
+
+        `candidates` -- the evaluated candidates [list(list(float))]
+        `fitnesses`  -- the fitnesses of the candidates [list(float)]
+        """
+        for candidate, fitness in zip(candidates, fitnesses):
+            if numpy.ndim(fitness):
+                raise Exception("Parallel tempering only supports single "
+                                "objectives")
+            try:
+                index = self._indices[tuple(candidate)].pop()
+            except (KeyError, IndexError):
+                raise Exception("Told candidate {} is not one of the current "
+                                "proposals".format(candidate))
+            fitness = float(fitness)
+            if math.isnan(fitness):
+                fitness = float('inf')
+            self._proposal_fitnesses[index] = fitness
+            self._remaining -= 1
+            self.num_evaluations += 1
+            if fitness < self.best_fitness:
+                self.best_fitness = fitness
+                self.best_candidate = list(candidate)
+        if not self._remaining:
+            self._step()
+
+    def stop(self):
+        return self.num_generations >= self.max_generations
+
+    def result(self):
+        return self.best_candidate, self.best_fitness
+
+    def _set_proposals(self, proposals):
+        """
+        Sets the candidates to be evaluated next
+        """
+        self._proposals = proposals
+        self._proposal_fitnesses = numpy.empty(len(proposals))
+        self._indices = {}
+        for i, proposal in enumerate(proposals):
+            self._indices.setdefault(tuple(proposal), []).append(i)
+        self._unasked = range(len(proposals))
+        self._remaining = len(proposals)
+
+    def _step(self):
+        """
+        Accepts or rejects the evaluated proposals, exchanges the states of
+        neighbouring chains and then proposes the next candidates
+        """
+        proposal_fitnesses = self._proposal_fitnesses
+        if self.states is None:
+            # The initial states have been evaluated
+            self.states = self._proposals
+            self.fitnesses = proposal_fitnesses
+        else:
+            self.num_generations += 1
+            # Metropolis acceptance of each chain's proposal
+            with numpy.errstate(invalid='ignore', over='ignore'):
+                log_accept = -(proposal_fitnesses -
+                               self.fitnesses) / self.temperatures
+            accepted = ((proposal_fitnesses <= self.fitnesses) |
+                        (numpy.log(self._rng.uniform(size=self.num_chains)) <
+                         log_accept))
+            for i in numpy.flatnonzero(accepted):
+                self.states[i] = self._proposals[i]
+                self.fitnesses[i] = proposal_fitnesses[i]
+            self.num_accepted += accepted
+            if not self.num_generations % self.swap_interval:
+                self._exchange()
+            self.temperatures = self.temperatures * self.cooling_rate
+        if self.stop():
+            self._set_proposals([])
+            return
+        # Propose the next candidates, with the step size of each chain
+        # increasing with its temperature
+        scales = (self.gaussian_stdev *
+                  numpy.sqrt(self.temperatures / self.temperatures[0]))
+        steps = (self._rng.standard_normal((self.num_chains,
+                                            self.genome_size)) *
+                 scales[:, None] * (self._ubounds - self._lbounds))
+        self._set_proposals([self.bounder(list(numpy.asarray(s) + step), {})
+                             for s, step in zip(self.states, steps)])
+
+    def _exchange(self):
+        """
+        Attempts to exchange the states of neighbouring chains, alternating
+        between the even and odd pairs so each chain takes part in at most one
+        exchange at a time
+        """
+        start = (self.num_generations // self.swap_interval) % 2
+        for i in xrange(start, self.num_chains - 1, 2):
+            j = i + 1
+            log_accept = ((1.0 / self.temperatures[i] -
+                           1.0 / self.temperatures[j]) *
+                          (self.fitnesses[i] - self.fitnesses[j]))
+            if (not numpy.isnan(log_accept) and
+                    (log_accept >= 0.0 or
+                     math.log(self._rng.uniform()) < log_accept)):
+                self.states[i], self.states[j] = (self.states[j],
+                                                  self.states[i])
+                self.fitnesses[[i, j]] = self.fitnesses[[j, i]]
+                self.num_swaps[i] += 1
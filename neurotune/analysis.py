@@ -10,13 +10,22 @@ from scipy.interpolate import UnivariateSpline, InterpolatedUnivariateSpline
 from scipy.optimize import brentq
 import numpy
 import math
+import struct
+import zlib
+import cPickle as pkl
 from copy import copy
+from collections import deque
 import quantities as pq
 import neo.core
 
 
 class Analysis(object):
 
+    # The precision and compression used to encode the recorded signals when
+    # the analysis is pickled (see encode_signal)
+    ENCODING_PRECISION = 'float64'
+    ENCODING_COMPRESS = True
+
     def __init__(self, recordings, simulation_setups):
         self.recordings = recordings
         self._simulation_setups = simulation_setups
@@ -31,8 +40,24 @@ class Analysis(object):
                 # add the full signal or a sliced version to the requests
                 # dictionary
                 sliced_signals = {}
-                for key, t_start, t_stop in request_refs:
-                    if t_start != signal.t_start or t_stop != signal.t_stop:
+                for key, t_start, t_stop, t_offset in request_refs:
+                    t_offset = pq.Quantity(t_offset, 'ms')
+                    if t_offset:
+                        # The request's protocol was concatenated with others
+                        # so its window is shifted back to the requested times
+                        dict_key = (float(pq.Quantity(t_start, 'ms')),
+                                    float(pq.Quantity(t_stop, 'ms')),
+                                    float(t_offset))
+                        try:
+                            req_signal = sliced_signals[dict_key]
+                        except KeyError:
+                            req_signal = self._shifted_window(
+                                               signal, pq.Quantity(t_start,
+                                                                   'ms'),
+                                               pq.Quantity(t_stop, 'ms'),
+                                               t_offset)
+                            sliced_signals[dict_key] = req_signal
+                    elif t_start != signal.t_start or t_stop != signal.t_stop:
                         # Try to reuse the AnalysedSignalSlices as much as
                         # possible by storing in temporary dictionary using
                         # time start and stop as the key
@@ -48,6 +73,19 @@ class Analysis(object):
                     self._requests[key] = req_signal
         self._objective_key = None
 
+    @classmethod
+    def _shifted_window(cls, signal, t_start, t_stop, t_offset):
+        """
+        Returns the window of the signal from t_start to t_stop after the
+        offset, as a signal starting at t_start
+        """
+        window = signal.slice(t_start + t_offset, t_stop + t_offset)
+        return AnalysedSignal(neo.core.AnalogSignal(
+                                        window.magnitude, units=signal.units,
+                                        t_start=t_start, copy=False,
+                                        sampling_period=signal.sampling_period,
+                                        name=signal.name))
+
     def get_signal(self, key=None):
         # If this is an objective specific analysis (i.e. one with an objective
         # key preset) prepend the objective key to the signal key for the
@@ -67,6 +105,111 @@ class Analysis(object):
         specific_analysis._objective_key = (objective_key,)
         return specific_analysis
 
+    def __copy__(self):
+        """
+        Shallow copies the analysis so the copy shares the same signals (and
+        their cached analysis), instead of going through __reduce__, which
+        rebuilds the signals from their encoding
+        """
+        cpy = object.__new__(self.__class__)
+        cpy.__dict__.update(self.__dict__)
+        return cpy
+
+    def __reduce__(self):
+        """
+        Pickles the analysis using the compact encoding of the recorded signals
+        (see encode_signal), dropping all cached analysis as it can be rebuilt
+        from the signals. This keeps analyses small enough to pass between MPI
+        processes and to save along with EvaluationExceptions.
+        """
+        encoded = [[encode_signal(sig, precision=self.ENCODING_PRECISION,
+                                  compress=self.ENCODING_COMPRESS)
+                    for sig in seg.analogsignals]
+                   for seg in self.recordings.segments]
+        return _unpickle_Analysis, (self.__class__, encoded,
+                                    self.recordings.name,
+                                    self.recordings.annotations,
+                                    self._simulation_setups,
+                                    self._objective_key)
+
+
+def _unpickle_Analysis(cls, encoded, name, annotations, simulation_setups,
+                       objective_key):
+    """
+    Rebuilds the recordings block from the encoded signals and reanalyses it
+    """
+    recordings = neo.core.Block(name=name, **annotations)
+    for encoded_signals in encoded:
+        seg = neo.core.Segment()
+        seg.analogsignals.extend(decode_signal(e) for e in encoded_signals)
+        recordings.segments.append(seg)
+    analysis = cls(recordings, simulation_setups)
+    analysis._objective_key = objective_key
+    return analysis
+
+
+# Identifies strings produced by encode_signal and the version of the encoding
+_ENCODING_MAGIC = 'NTAS'
+_ENCODING_VERSION = 1
+
+
+def encode_signal(signal, precision='float64', compress=True):
+    """
+    Encodes an analog signal into a compact binary string, consisting of a
+    small header followed by the raw buffer of samples. Any analysis cached
+    with an AnalysedSignal is dropped as it can be rebuilt from the samples.
+
+    `signal`    -- the signal to encode [neo.AnalogSignal]
+    `precision` -- the floating point type the samples are stored as, either
+                   'float32' or 'float64' [str]
+    `compress`  -- whether the sample buffer is compressed with zlib [bool]
+    """
+    if precision not in ('float32', 'float64'):
+        raise Exception("Unrecognised precision '{}', can be either 'float32' "
+                        "or 'float64'".format(precision))
+    time_units = signal.t_start.units
+    samples = numpy.ascontiguousarray(signal.magnitude,
+                                      dtype=precision).tostring()
+    if compress:
+        samples = zlib.compress(samples)
+    header = pkl.dumps((_ENCODING_VERSION, precision, bool(compress),
+                        signal.dimensionality.string,
+                        time_units.dimensionality.string,
+                        float(signal.t_start),
+                        float(signal.sampling_period.rescale(time_units)),
+                        signal.name), pkl.HIGHEST_PROTOCOL)
+    return (_ENCODING_MAGIC + struct.pack('<I', len(header)) + header +
+            samples)
+
+
+def decode_signal(encoded):
+    """
+    Decodes a signal encoded by encode_signal back into an AnalysedSignal
+
+    `encoded` -- the string returned by encode_signal [str]
+    """
+    if encoded[:len(_ENCODING_MAGIC)] != _ENCODING_MAGIC:
+        raise Exception("Provided string was not encoded by encode_signal")
+    offset = len(_ENCODING_MAGIC)
+    header_length = struct.unpack('<I', encoded[offset:offset + 4])[0]
+    offset += 4
+    (version, precision, compressed, units, time_units, t_start,
+     sampling_period, name) = pkl.loads(encoded[offset:offset +
+                                                header_length])
+    if version != _ENCODING_VERSION:
+        raise Exception("Unsupported signal encoding version {} (expected {})"
+                        .format(version, _ENCODING_VERSION))
+    samples = encoded[offset + header_length:]
+    if compressed:
+        samples = zlib.decompress(samples)
+    signal = neo.core.AnalogSignal(numpy.fromstring(samples, dtype=precision),
+                                   units=units, copy=False,
+                                   t_start=pq.Quantity(t_start, time_units),
+                                   sampling_period=pq.Quantity(sampling_period,
+                                                               time_units),
+                                   name=name)
+    return AnalysedSignal(signal)
+
 
 class AnalysedSignal(neo.core.AnalogSignal):
     """
@@ -75,6 +218,10 @@ class AnalysedSignal(neo.core.AnalogSignal):
     within a single more complex objective)
     """
 
+    # The fraction of a sampling period within which a time is considered to
+    # fall on a sample when converting times to indices
+    _TIME_INDEX_TOL = 1e-6
+
     @classmethod
     def _argkey(cls, kwargs):
         """
@@ -113,6 +260,7 @@ class AnalysedSignal(neo.core.AnalogSignal):
         obj._spike_periods = {}
         obj._spikes = {}
         obj._splines = {}
+        obj._features = {}
         return obj
 
     def __reduce__(self):
@@ -125,6 +273,21 @@ class AnalysedSignal(neo.core.AnalogSignal):
                                           self._spikes, self._dvdt,
                                           self._spike_periods, self._splines)
 
+    def encode(self, precision='float64', compress=True):
+        """
+        Returns the compact binary encoding of the signal without its cached
+        analysis (see encode_signal)
+        """
+        return encode_signal(self, precision=precision, compress=compress)
+
+    @classmethod
+    def decode(cls, encoded):
+        """
+        Recreates an AnalysedSignal from its compact binary encoding (see
+        decode_signal)
+        """
+        return decode_signal(encoded)
+
     def _base(self):
         """
         Uncovers the neo.core.AnalogSignal object beneath
@@ -143,19 +306,29 @@ class AnalysedSignal(neo.core.AnalogSignal):
                 self._spikes == other._spikes and
                 self._dvdt == other._dvdt)
 
+    @classmethod
+    def _smoothed_dvdt(cls, v, times):
+        """
+        Returns the rate of change of the samples `v` at `times` (both plain
+        arrays), from a smoothing spline fitted to the finite differences
+        between the samples, which is shared by AnalysedSignalBatch so that
+        the analysis of the batch matches that of its signals
+        """
+        dt = numpy.diff(times)
+        # Get the dvdt at the intervals between the samples
+        dvdt = numpy.diff(v) / dt
+        # Interpolate the dV/dt values back to the time points of the original
+        # time course.
+        spline = UnivariateSpline(times[:-1] + dt / 2.0, dvdt, s=1)
+        return numpy.hstack((dvdt[0], spline(times[1:-1]), dvdt[-1]))
+
     @property
     def dvdt(self):
         if self._dvdt is None:
-            dv = numpy.diff(self)
-            dt = numpy.diff(self.times)
-            # Get the dvdt at the intervals between the samples
-            dvdt = dv / dt
-            # Linearly interpolate the dV/dt values back to the time points of
-            # the original time course.
-            spline = UnivariateSpline(self.times[:-1] + dt / 2.0, dvdt, s=1)
-            self._dvdt = numpy.hstack((dvdt[0],
-                                       pq.Quantity(spline(self.times[1:-1]),
-                                                  units=dvdt.units), dvdt[-1]))
+            self._dvdt = pq.Quantity(
+                           self._smoothed_dvdt(self.magnitude,
+                                               self.times.magnitude),
+                           units=self.units / self.times.units)
         return self._dvdt
 
     def _spike_period_indices(self, threshold='dvdt', start=10.0, stop=-10.0,
@@ -198,27 +371,45 @@ class AnalysedSignal(neo.core.AnalogSignal):
                                          (self[:-1] < start))[0] + 1
                 stop_inds = numpy.where((self[1:] < stop) &
                                         (self[:-1] >= stop))[0] + 1
-            if len(start_inds) == 0 or len(stop_inds) == 0:
-                periods = numpy.array([])
-            else:
-                # If the recording period begins or ends with a threshold
-                # crossing trim them from the crossing periods so the start and
-                # stop inds are the same length
-                if start_inds[-1] > stop_inds[-1]:
-                    start_inds = start_inds[:-1]
-                if stop_inds[0] < start_inds[0]:
-                    stop_inds = stop_inds[1:]
-                assert len(start_inds) == len(stop_inds)
-                assert all(stop_inds > start_inds)
-                periods = numpy.array((start_inds, stop_inds)).T
-                if index_buffer:
-                    periods[:, 0] -= index_buffer
-                    periods[:, 1] += index_buffer
-                    periods[numpy.where(periods < 0)] = 0
-                    periods[numpy.where(periods > len(self))] = len(self)
+            periods = self._pair_crossings(start_inds, stop_inds,
+                                           index_buffer, len(self))
             self._spike_periods[argkey] = periods
             return periods
 
+    @classmethod
+    def _pair_crossings(cls, start_inds, stop_inds, index_buffer, length):
+        """
+        Pairs up the start and stop threshold crossings of a trace into
+        periods (see _spike_period_indices)
+
+        `start_inds`   -- the indices where the start threshold is crossed
+        `stop_inds`    -- the indices where the stop threshold is crossed
+        `index_buffer` -- the number of indices to pad the periods out by on
+                          either side of the spike
+        `length`       -- the length of the trace
+        """
+        # Pair each stop crossing with the first start crossing after the
+        # previous stop, so that repeated start crossings (eg. from a noisy
+        # dV/dt) are merged into a single period and stops without a preceding
+        # start (eg. at the beginning of the recording) are dropped
+        start_inds = numpy.asarray(start_inds)
+        stop_inds = numpy.asarray(stop_inds)
+        next_stop = numpy.searchsorted(stop_inds, start_inds)
+        first = numpy.ones(len(start_inds), dtype=bool)
+        first[1:] = next_stop[1:] != next_stop[:-1]
+        first &= next_stop < len(stop_inds)
+        if not first.any():
+            periods = numpy.array([])
+        else:
+            periods = numpy.array((start_inds[first],
+                                   stop_inds[next_stop[first]])).T
+            if index_buffer:
+                periods[:, 0] -= index_buffer
+                periods[:, 1] += index_buffer
+                periods[numpy.where(periods < 0)] = 0
+                periods[numpy.where(periods > length)] = length
+        return periods
+
     def spikes(self, **kwargs):
         # Get unique dictionary key from keyword arguments
         args_key = self._argkey(kwargs)
@@ -325,9 +516,45 @@ class AnalysedSignal(neo.core.AnalogSignal):
             spikes.append(spike)
         return spikes
 
+    def exponential_fit(self):
+        """
+        Fits an exponential approach to a steady state to the signal in closed
+        form (see exponential_step_fit) and returns the steady state, the
+        amplitude of the exponential at t_start and the time constant
+        """
+        y_inf, delta, tau = exponential_step_fit(self.magnitude)
+        return (pq.Quantity(y_inf[0], self.units),
+                pq.Quantity(delta[0], self.units),
+                tau[0] * self.sampling_period)
+
     def slice(self, t_start, t_stop):
         return AnalysedSignalSlice(self, t_start=t_start, t_stop=t_stop)
 
+    def _time_index(self, time, side='left'):
+        """
+        Returns the index of the given time in the (regularly sampled) signal,
+        matching numpy.searchsorted(self.times, time, side=side) but without
+        generating the time vector
+
+        `time` -- the time to find the index of [pq.Quantity(time)]
+        `side` -- if 'left' the index of the first sample at or after the
+                  time is returned, if 'right' the index after the last sample
+                  at or before it [str]
+        """
+        if not isinstance(time, pq.Quantity):
+            time = pq.Quantity(time, self.t_start.units)
+        position = float(((time - self.t_start) /
+                          self.sampling_period).simplified)
+        # Allow for rounding errors in the calculation of the position so that
+        # times that fall on a sample are treated as equal to it
+        if side == 'left':
+            index = int(math.ceil(position - self._TIME_INDEX_TOL))
+        elif side == 'right':
+            index = int(math.floor(position + self._TIME_INDEX_TOL)) + 1
+        else:
+            raise Exception("Unrecognised side '{}'".format(side))
+        return min(max(index, 0), len(self))
+
     def plot(self, show=True):
         from matplotlib import pyplot as plt
         plt.figure()
@@ -387,18 +614,35 @@ class AnalysedSignalSlice(AnalysedSignal):
         if t_start < signal.t_start:
             raise Exception("Slice t_start ({}) is before signal t_start ({})"
                             .format(t_start, signal.t_start))
-        if t_stop > signal.t_stop:
+        if t_stop is None:
+            t_stop = signal.t_stop
+        elif t_stop > signal.t_stop:
             raise Exception("Slice t_stop ({}) is after signal t_stop ({})"
                             .format(t_stop, signal.t_stop))
-        indices = numpy.where((signal.times >= t_start) &
-                              (signal.times <= t_stop))[0]
-        start_index = indices[0]
-        end_index = indices[-1] + 1
-        obj = AnalysedSignal.__new__(cls, signal[start_index:end_index])
-        obj.__class__ = AnalysedSignalSlice
+        # Equivalent to numpy.where((times >= t_start) & (times <= t_stop))
+        # but without having to generate and scan the full time vector
+        start_index = signal._time_index(t_start, side='left')
+        stop_index = signal._time_index(t_stop, side='right')
+        return cls._from_indices(signal, start_index, stop_index)
+
+    @classmethod
+    def _from_indices(cls, signal, start_index, stop_index):
+        """
+        Creates the slice directly from a pair of indices into the parent
+        signal. The data of the slice is a view onto that of the parent so no
+        copy of the signal is made.
+        """
+        # Slicing the parent returns a view of its data with the t_start
+        # updated to match the start index
+        obj = signal[start_index:stop_index].view(cls)
+        obj._dvdt = None
+        obj._spike_periods = {}
+        obj._spikes = {}
+        obj._splines = {}
+        obj._features = {}
         obj.parent = signal
         obj._start_index = start_index
-        obj._stop_index = end_index
+        obj._stop_index = stop_index
         return obj
 
     def __eq__(self, other):
@@ -407,37 +651,983 @@ class AnalysedSignalSlice(AnalysedSignal):
         '''
         return (super(AnalysedSignalSlice, self).__eq__(other) and
                 self.parent == other.parent and
-                self._indices == other._indices)
+                self._start_index == other._start_index and
+                self._stop_index == other._stop_index)
 
     def __reduce__(self):
         '''
         Reduce the sliced analysedSignal for pickling
         '''
-        return self.__class__, (self.parent, self.t_start, self.t_stop)
+        return _unpickle_AnalysedSignalSlice, (self.__class__, self.parent,
+                                               self._start_index,
+                                               self._stop_index)
 
     @property
     def dvdt(self):
         return self.parent.dvdt[self._start_index:self._stop_index]
 
     def spikes(self, **kwargs):
-        spikes = self.parent.spikes(**kwargs)
-        return spikes[numpy.where((spikes >= self.t_start) &
-                                  (spikes <= self.t_stop))]
+        args_key = self._argkey(kwargs)
+        try:
+            return self._spikes[args_key]
+        except KeyError:
+            spikes = self.parent.spikes(**kwargs)
+            # Spike times are sorted so the spikes within the slice can be
+            # found with a binary search
+            times = spikes.magnitude
+            start = numpy.searchsorted(
+                times, float(self.t_start.rescale(spikes.units)), side='left')
+            stop = numpy.searchsorted(
+                times, float(self.t_stop.rescale(spikes.units)), side='right')
+            spikes = spikes[start:stop]
+            self._spikes[args_key] = spikes
+            return spikes
 
     def _spike_period_indices(self, **kwargs):
-        periods = self.parent._spike_period_indices(**kwargs)
-        if len(periods):
-            return (periods[numpy.where((periods[:, 0] >= self._start_index) &
-                                        (periods[:, 1] <= self._stop_index))] -
-                    self._start_index)
-        else:
-            return numpy.array([])
+        args_key = self._argkey(kwargs)
+        try:
+            return self._spike_periods[args_key]
+        except KeyError:
+            periods = self.parent._spike_period_indices(**kwargs)
+            if len(periods):
+                # Both the start and stop indices of the periods are
+                # monotonically increasing so the periods that lie within the
+                # slice can be found with a binary search on each
+                start = numpy.searchsorted(periods[:, 0], self._start_index,
+                                           side='left')
+                stop = numpy.searchsorted(periods[:, 1], self._stop_index,
+                                          side='right')
+                periods = periods[start:max(start, stop)] - self._start_index
+            else:
+                periods = numpy.array([])
+            self._spike_periods[args_key] = periods
+            return periods
 
     def v_dvdt_splines(self, **kwargs):
         v, dvdt, s = self.parent.v_dvdt_splines(**kwargs)
         return (v, dvdt, s[self._start_index:self._stop_index])
 
 
+def _unpickle_AnalysedSignalSlice(cls, parent, start_index, stop_index):
+    '''
+    Recreates the slice from the indices into the parent signal, which (unlike
+    the slice times) map exactly back onto the same samples
+    '''
+    return cls._from_indices(parent, start_index, stop_index)
+
+
+class AnalysedSignalBatch(object):
+    """
+    A stack of equal-length, equally sampled signals (eg. the recordings of
+    all candidates in a generation or all sweeps of an experiment) held as the
+    rows of a 2-D array so that their analysis can be vectorized across the
+    rows instead of looping through each signal one at a time.
+
+    Individual rows can be accessed as AnalysedSignals by indexing the batch,
+    with the analysis already performed by the batch passed on to them, so
+    objectives can use either. The dV/dt of each row is calculated with the
+    same smoothing spline as AnalysedSignal.dvdt so the analysis passed on is
+    identical to that the AnalysedSignal would perform itself.
+    """
+
+    def __init__(self, data, sampling_period, t_start=0.0 * pq.ms,
+                 units='mV', names=None):
+        """
+        `data`            -- the signals, one per row [numpy.array((m, n))]
+        `sampling_period` -- the sampling period of the signals
+                             [pq.Quantity(time)]
+        `t_start`         -- the start time of the signals [pq.Quantity(time)]
+        `units`           -- the units of the signals [str or pq.Quantity]
+        `names`           -- the names of each of the signals [list(str)]
+        """
+        data = numpy.asarray(data, dtype=float)
+        if data.ndim != 2:
+            raise Exception("Batch data must be 2-D (found {} dimensions)"
+                            .format(data.ndim))
+        self.data = data
+        self.units = pq.Quantity(1.0, units).units
+        if not isinstance(t_start, pq.Quantity):
+            t_start = pq.Quantity(t_start, 'ms')
+        self.t_start = t_start
+        self.sampling_period = pq.Quantity(sampling_period,
+                                           self.t_start.units)
+        self.names = names if names is not None else [None] * len(data)
+        self._dvdt = None
+        self._spike_periods = {}
+        self._spikes = {}
+
+    @classmethod
+    def from_signals(cls, signals):
+        """
+        Stacks a list of signals with matching lengths, start times and
+        sampling periods into a batch
+
+        `signals` -- the signals to stack [list(neo.AnalogSignal or
+                     AnalysedSignal)]
+        """
+        if not len(signals):
+            raise Exception("No signals provided to stack into batch")
+        first = signals[0]
+        for sig in signals[1:]:
+            if (len(sig) != len(first) or sig.t_start != first.t_start or
+                    sig.sampling_rate != first.sampling_rate):
+                raise Exception("Signals in batch must have the same length, "
+                                "start time and sampling rate")
+        # AnalysedSignals can't be rescaled directly (as their constructor
+        # doesn't take units) so the neo signals beneath them are rescaled
+        data = numpy.array([numpy.asarray(
+                                (sig._base() if isinstance(sig, AnalysedSignal)
+                                 else sig).rescale(first.units))
+                            for sig in signals])
+        return cls(data, first.sampling_period.rescale(first.t_start.units),
+                   t_start=first.t_start, units=first.units,
+                   names=[sig.name for sig in signals])
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        """
+        Returns the ith signal of the batch as an AnalysedSignal, with the
+        dV/dt, spike periods and spikes already calculated by the batch
+        """
+        signal = AnalysedSignal(neo.core.AnalogSignal(
+                                         self.data[i], units=self.units,
+                                         t_start=self.t_start, copy=False,
+                                         sampling_period=self.sampling_period,
+                                         name=self.names[i]))
+        if self._dvdt is not None:
+            signal._dvdt = self.dvdt[i]
+        for argkey, periods in self._spike_periods.iteritems():
+            signal._spike_periods[argkey] = periods[i]
+        for args_key, spikes in self._spikes.iteritems():
+            signal._spikes[args_key] = spikes[i]
+        return signal
+
+    @property
+    def num_samples(self):
+        return self.data.shape[1]
+
+    @property
+    def t_stop(self):
+        return self.t_start + self.num_samples * self.sampling_period
+
+    @property
+    def sampling_rate(self):
+        return 1.0 / self.sampling_period
+
+    @property
+    def times(self):
+        # Calculated as neo does so the times match those of the signals
+        return (self.t_start +
+                numpy.arange(self.num_samples) / self.sampling_rate)
+
+    def slice(self, t_start, t_stop):
+        """
+        Returns a batch of the signals between t_start and t_stop, which
+        includes the same samples as slicing each of the signals would (see
+        AnalysedSignalSlice). The data of the slice is a view onto that of the
+        batch so no copy of the signals is made.
+        """
+        if t_start < self.t_start:
+            raise Exception("Slice t_start ({}) is before batch t_start ({})"
+                            .format(t_start, self.t_start))
+        if t_stop > self.t_stop:
+            raise Exception("Slice t_stop ({}) is after batch t_stop ({})"
+                            .format(t_stop, self.t_stop))
+        first = self[0]
+        start_index = first._time_index(t_start, side='left')
+        stop_index = first._time_index(t_stop, side='right')
+        return AnalysedSignalBatch(
+                           self.data[:, start_index:stop_index],
+                           self.sampling_period,
+                           t_start=(self.t_start +
+                                    start_index * self.sampling_period),
+                           units=self.units, names=self.names)
+
+    @property
+    def dvdt(self):
+        """
+        The rate of change of each signal, fitted with the smoothing spline of
+        AnalysedSignal.dvdt row-by-row (the spline can't be fitted across
+        rows) so that the threshold crossings and spikes detected across the
+        rows match those of the individual signals
+        """
+        if self._dvdt is None:
+            times = self.times.magnitude
+            self._dvdt = pq.Quantity(
+                           numpy.array([AnalysedSignal._smoothed_dvdt(v, times)
+                                        for v in self.data]),
+                           units=(self.units / self.t_start.units))
+        return self._dvdt
+
+    def _spike_period_indices(self, threshold='dvdt', start=10.0, stop=-10.0,
+                              index_buffer=0):
+        """
+        Find the spike periods of each signal in the batch, with the same
+        semantics as AnalysedSignal._spike_period_indices. The threshold
+        crossings are detected across all rows at once, leaving only the
+        pairing of the (few) crossings to be done row-by-row.
+
+        Returns a list of periods arrays, one for each signal in the batch
+        """
+        argkey = (threshold, start, stop, index_buffer)
+        try:
+            return self._spike_periods[argkey]
+        except KeyError:
+            if threshold not in ('dvdt', 'v'):
+                raise Exception("Unrecognised threshold type '{}'"
+                                .format(threshold))
+            if threshold == 'dvdt':
+                if stop > start:
+                    raise Exception("Stop threshold ({}) must be lower than "
+                                    "start threshold ({}) for dV/dt threshold "
+                                    " crossing detection" .format(stop, start))
+                trace = self.dvdt.magnitude
+                start_rows, start_inds = numpy.nonzero(
+                                                    (trace[:, 1:] >= start) &
+                                                    (trace[:, :-1] < start))
+                stop_rows, stop_inds = numpy.nonzero((trace[:, 1:] > stop) &
+                                                     (trace[:, :-1] <= stop))
+            else:
+                trace = self.data
+                start_rows, start_inds = numpy.nonzero(
+                                                    (trace[:, 1:] >= start) &
+                                                    (trace[:, :-1] < start))
+                stop_rows, stop_inds = numpy.nonzero((trace[:, 1:] < stop) &
+                                                     (trace[:, :-1] >= stop))
+            start_inds += 1
+            stop_inds += 1
+            # Get the boundaries between the rows in the (row-sorted) crossings
+            row_bounds = numpy.arange(len(self) + 1)
+            start_bounds = numpy.searchsorted(start_rows, row_bounds)
+            stop_bounds = numpy.searchsorted(stop_rows, row_bounds)
+            periods = [AnalysedSignal._pair_crossings(
+                                 start_inds[start_bounds[i]:start_bounds[i + 1]],
+                                 stop_inds[stop_bounds[i]:stop_bounds[i + 1]],
+                                 index_buffer, self.num_samples)
+                       for i in xrange(len(self))]
+            self._spike_periods[argkey] = periods
+            return periods
+
+    def spikes(self, **kwargs):
+        """
+        Returns the spike times of each signal in the batch as a list of
+        neo.SpikeTrains, with the same semantics as AnalysedSignal.spikes
+        """
+        args_key = AnalysedSignal._argkey(kwargs)
+        try:
+            return self._spikes[args_key]
+        except KeyError:
+            periods = self._spike_period_indices(**kwargs)
+            counts = [len(p) for p in periods]
+            dvdt = self.dvdt.magnitude
+            time_units = self.t_start.units
+            if sum(counts):
+                rows = numpy.repeat(numpy.arange(len(self)), counts)
+                periods = numpy.vstack([p for p in periods if len(p)])
+                # Get the indices before dV/dt crosses 0 in the flattened
+                # array of (n - 1) length rows
+                row_length = self.num_samples - 1
+                crossings = numpy.nonzero(((dvdt[:, :-1] >= 0) &
+                                           (dvdt[:, 1:] < 0)).ravel())[0]
+                offsets = rows * row_length
+                first = numpy.searchsorted(crossings, offsets + periods[:, 0])
+                last = numpy.searchsorted(crossings,
+                                          offsets + periods[:, 1] - 1)
+                if any((last - first) != 1):
+                    raise Exception("One dV/dt zero crossing expected in "
+                                    "spike period")
+                inds = crossings[first] - offsets
+                before = dvdt[rows, inds]
+                after = dvdt[rows, inds + 1]
+                # Calculate the exact spike time by interpolating between
+                # the points straddling the zero crossing
+                times = self.times.magnitude
+                spike_times = (times[inds] + (times[inds + 1] - times[inds]) *
+                               (before / (before - after)))
+                spike_times = numpy.split(spike_times,
+                                          numpy.cumsum(counts)[:-1])
+            else:
+                spike_times = [[]] * len(self)
+            spikes = [neo.SpikeTrain(s, self.t_stop, units=time_units)
+                      for s in spike_times]
+            self._spikes[args_key] = spikes
+            return spikes
+
+    def spike_frequency(self, **kwargs):
+        """
+        The average spike frequency of each signal in the batch (see
+        AnalysedSignal.spike_frequency)
+        """
+        freqs = numpy.empty(len(self))
+        duration = float((self.t_stop - self.t_start).rescale('s'))
+        for i, spikes in enumerate(self.spikes(**kwargs)):
+            if len(spikes) >= 2:
+                freqs[i] = ((len(spikes) - 1) /
+                            float((spikes[-1] - spikes[0]).rescale('s')))
+            elif len(spikes) == 1:
+                freqs[i] = 1.0 / duration
+            else:
+                freqs[i] = 0.0
+        return pq.Quantity(freqs, 'Hz')
+
+    def phase_plane_hist(self, num_bins, bounds):
+        """
+        Returns the v-dV/dt histograms of each signal in the batch, equivalent
+        to calling numpy.histogram2d(v, dvdt, num_bins, bounds) on each row
+        but binned for all rows in a single pass
+
+        `num_bins` -- the number of bins along the v and dV/dt axes
+                      [tuple[2](int)]
+        `bounds`   -- the bounds of the v and dV/dt axes
+                      [tuple[2](tuple[2](float))]
+        """
+        num_bins = numpy.asarray(num_bins, dtype=int)
+        bin_inds = []
+        in_range = numpy.ones(self.data.shape, dtype=bool)
+        for trace, n, (lower, upper) in zip((self.data, self.dvdt.magnitude),
+                                            num_bins, bounds):
+            inds, within = histogram_bin_indices(trace, n, lower, upper)
+            in_range &= within
+            bin_inds.append(inds)
+        rows = numpy.repeat(numpy.arange(len(self)), self.num_samples)
+        flat = ((rows * num_bins[0] + bin_inds[0].ravel()) * num_bins[1] +
+                bin_inds[1].ravel())
+        hists = numpy.bincount(flat[in_range.ravel()],
+                               minlength=len(self) * num_bins.prod())
+        return hists.reshape((len(self), num_bins[0],
+                              num_bins[1])).astype(float)
+
+    def exponential_fit(self):
+        """
+        Fits an exponential approach to a steady state to every signal in
+        the batch in closed form (see exponential_step_fit) and returns the
+        steady state, the amplitude of the exponential at t_start and the
+        time constant of each
+        """
+        y_inf, delta, tau = exponential_step_fit(self.data)
+        return (pq.Quantity(y_inf, self.units),
+                pq.Quantity(delta, self.units),
+                tau * self.sampling_period)
+
+
+def histogram_bin_indices(values, num_bins, lower, upper):
+    """
+    Returns the indices of the histogram bins the values fall into, matching
+    the binning of numpy.histogram (in which the upper edge is included in the
+    last bin), along with a mask of the values that fall within the bounds
+
+    `values`   -- the values to bin [numpy.array(float)]
+    `num_bins` -- the number of bins [int]
+    `lower`    -- the lower edge of the first bin [float]
+    `upper`    -- the upper edge of the last bin [float]
+    """
+    values = numpy.asarray(values)
+    # Search the same edges as numpy.histogram rather than scaling the values,
+    # which can round values onto the wrong side of an edge
+    edges = numpy.linspace(lower, upper, num_bins + 1)
+    inds = numpy.searchsorted(edges, values, 'right') - 1
+    inds[values == edges[-1]] = num_bins - 1
+    in_range = (values >= lower) & (values <= upper)
+    return inds, in_range
+
+
+def bincount_histogram2d(x, y, num_bins, bounds):
+    """
+    Equivalent to numpy.histogram2d(x, y, bins=num_bins, range=bounds)[0] but
+    binned with a single integer bincount
+
+    `x`        -- the values along the first axis [numpy.array(float)]
+    `y`        -- the values along the second axis [numpy.array(float)]
+    `num_bins` -- the number of bins along each axis [tuple[2](int)]
+    `bounds`   -- the bounds of each axis [tuple[2](tuple[2](float))]
+    """
+    x_inds, x_in_range = histogram_bin_indices(x, num_bins[0], *bounds[0])
+    y_inds, y_in_range = histogram_bin_indices(y, num_bins[1], *bounds[1])
+    in_range = x_in_range & y_in_range
+    flat = x_inds[in_range] * num_bins[1] + y_inds[in_range]
+    hist = numpy.bincount(flat, minlength=num_bins[0] * num_bins[1])
+    return hist.reshape(num_bins).astype(float)
+
+
+def exponential_step_fit(data):
+    """
+    Fits y = y_inf + delta * exp(-k / tau) (where k is the sample index) to
+    each row of the data in closed form. The exponential satisfies
+    dy/dk = (y_inf - y) / tau, so integrating both sides gives the linear
+    relation y[k] = y[0] + (y_inf * k - Y[k]) / tau, where Y is the
+    cumulative integral of y, and the fit reduces to a single linear
+    regression per row. Being based on the integral of the trace the fit is
+    insensitive to sample noise. Returns the arrays (y_inf, delta, tau) with
+    tau in samples, where rows that don't decay towards a steady state have a
+    tau of inf
+
+    `data` -- the traces to fit, one per row [numpy.array((m, n))]
+    """
+    data = numpy.atleast_2d(numpy.asarray(data, dtype=float))
+    num_samples = data.shape[1]
+    k = numpy.arange(num_samples, dtype=float)
+    # Cumulative trapezoidal integral of each row
+    integral = numpy.zeros(data.shape)
+    numpy.cumsum((data[:, 1:] + data[:, :-1]) * 0.5, axis=1,
+                 out=integral[:, 1:])
+    # Regress the (centred) traces against the sample index and the integral,
+    # y = c + slope_k * k + slope_int * Y, solving the 2x2 normal equations of
+    # every row at once
+    k_centred = k - k.mean()
+    integral_mean = integral.mean(axis=1)
+    integral -= integral_mean[:, numpy.newaxis]
+    y_mean = data.mean(axis=1)
+    y_centred = data - y_mean[:, numpy.newaxis]
+    kk = numpy.dot(k_centred, k_centred)
+    ki = integral.dot(k_centred)
+    ii = numpy.einsum('ij,ij->i', integral, integral)
+    ky = y_centred.dot(k_centred)
+    iy = numpy.einsum('ij,ij->i', integral, y_centred)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        det = kk * ii - ki ** 2
+        slope_k = (ii * ky - ki * iy) / det
+        slope_int = (kk * iy - ki * ky) / det
+        decays = slope_int < 0.0
+        tau = numpy.where(decays, -1.0 / slope_int, numpy.inf)
+        y_inf = numpy.where(decays, slope_k * tau, y_mean)
+        # The intercept of the regression is the fitted value of the first
+        # sample (where both k and Y are 0)
+        y_start = y_mean - slope_k * k.mean() - slope_int * integral_mean
+        delta = numpy.where(decays, y_start - y_inf, 0.0)
+    return y_inf, delta, tau
+
+
+class StreamingSpikeDetector(object):
+    """
+    Detects spikes in recordings that are too long to be loaded into memory
+    (or analysed) as a whole, by processing them incrementally in chunks.
+    Only a bounded amount of state is carried over between chunks, namely the
+    last samples, the current threshold-crossing state and the dV/dt zero
+    crossings that may still fall within the (buffered) period of a spike.
+
+    The spike periods follow the semantics of
+    AnalysedSignal._spike_period_indices. However, AnalysedSignal.dvdt fits a
+    smoothing spline to the whole recording, which can't be done a chunk at a
+    time, so the dV/dt is instead calculated from the finite differences
+    either side of each sample. The spike times therefore deviate from those
+    of AnalysedSignal.spikes by up to half a sampling period (as both
+    interpolate the dV/dt zero crossing within the sampling interval
+    straddling the peak) and the dV/dt threshold crossings (but not the
+    voltage threshold crossings) by up to one sample, while being independent
+    of how the recording is split into chunks.
+    """
+
+    def __init__(self, sampling_period, t_start=0.0 * pq.ms, threshold='dvdt',
+                 start=10.0, stop=-10.0, index_buffer=0):
+        """
+        `sampling_period` -- the sampling period of the recording
+                             [pq.Quantity(time)]
+        `t_start`         -- the start time of the recording
+                             [pq.Quantity(time)]
+        `threshold`       -- can be either 'dvdt' or 'v', which determines the
+                             type of threshold used to classify the spike
+                             start/stop
+        `start`           -- the starting dV/dt or v threshold of the spike
+        `stop`            -- the stopping threshold, which needs to be crossed
+                             in the positive direction for dV/dt and negative
+                             for V
+        `index_buffer`    -- the number of indices to pad the periods out by on
+                             either side of the spike
+        """
+        if threshold not in ('dvdt', 'v'):
+            raise Exception("Unrecognised threshold type '{}'"
+                            .format(threshold))
+        if threshold == 'dvdt' and stop > start:
+            raise Exception("Stop threshold ({}) must be lower than start "
+                            "threshold ({}) for dV/dt threshold crossing "
+                            "detection".format(stop, start))
+        if not isinstance(t_start, pq.Quantity):
+            t_start = pq.Quantity(t_start, 'ms')
+        self.t_start = t_start
+        self.sampling_period = pq.Quantity(sampling_period, t_start.units)
+        self.threshold = threshold
+        self.start = start
+        self.stop = stop
+        self.index_buffer = index_buffer
+        self.periods = []
+        self.spike_times = []
+        # The number of samples received and the number of samples for which
+        # the dV/dt has been calculated (lags by one sample)
+        self._num_samples = 0
+        self._num_analysed = 0
+        self._last_sample = None
+        self._last_diff = None
+        self._last_v = None
+        self._last_dvdt = None
+        # Threshold-crossing state
+        self._period_start = None
+        self._unresolved = deque()
+        self._zero_crossings = deque()
+        self._finished = False
+
+    @classmethod
+    def detect(cls, chunks, sampling_period, t_start=0.0 * pq.ms, **kwargs):
+        """
+        Detects the spikes in a recording provided as an iterable of chunks
+        (eg. read one at a time from file)
+
+        `chunks`          -- an iterable of 1-D arrays of consecutive samples
+        `sampling_period` -- the sampling period of the recording
+                             [pq.Quantity(time)]
+        `t_start`         -- the start time of the recording
+                             [pq.Quantity(time)]
+        `kwargs`          -- thresholds passed to the detector constructor
+
+        Returns the spikes as a neo.SpikeTrain
+        """
+        detector = cls(sampling_period, t_start=t_start, **kwargs)
+        for chunk in chunks:
+            detector.process(chunk)
+        detector.finish()
+        return detector.spikes()
+
+    @classmethod
+    def iter_chunks(cls, samples, chunk_size=2 ** 20):
+        """
+        Splits an array (typically a numpy.memmap of a recording on disk) into
+        chunks to be passed to the detector, only reading each chunk into
+        memory as it is required
+        """
+        for i in xrange(0, len(samples), chunk_size):
+            yield numpy.asarray(samples[i:i + chunk_size], dtype=float)
+
+    @property
+    def t_stop(self):
+        return self.t_start + self._num_samples * self.sampling_period
+
+    def spikes(self):
+        """
+        Returns the spikes detected so far as a neo.SpikeTrain
+        """
+        return neo.SpikeTrain(self.spike_times, self.t_stop,
+                              units=self.t_start.units)
+
+    def process(self, chunk):
+        """
+        Processes the next chunk of the recording, returning the times of the
+        spikes that could be completed with it
+
+        `chunk` -- the next consecutive samples of the recording
+                   [numpy.array(float)]
+        """
+        if self._finished:
+            raise Exception("Cannot process chunks after the detector has "
+                            "been finished")
+        chunk = numpy.asarray(chunk, dtype=float)
+        if not len(chunk):
+            return []
+        if self._last_sample is None:
+            samples = chunk
+        else:
+            samples = numpy.concatenate(([self._last_sample], chunk))
+        self._num_samples += len(chunk)
+        diffs = numpy.diff(samples) / float(self.sampling_period)
+        if not len(diffs):
+            self._last_sample = samples[-1]
+            return []
+        # Calculate the dV/dt for all but the last sample (which requires the
+        # following sample), averaging the differences either side of each
+        # sample
+        if self._last_diff is None:
+            dvdt = numpy.empty(len(diffs))
+            dvdt[0] = diffs[0]
+            dvdt[1:] = diffs[:-1]
+            dvdt[1:] += diffs[1:]
+            dvdt[1:] *= 0.5
+        else:
+            dvdt = numpy.concatenate(([self._last_diff], diffs[:-1]))
+            dvdt += diffs
+            dvdt *= 0.5
+        self._last_sample = samples[-1]
+        self._last_diff = diffs[-1]
+        return self._analyse(samples[:-1], dvdt)
+
+    def finish(self):
+        """
+        Signals the end of the recording, returning the times of any spikes
+        that could only be completed at the end of the recording
+        """
+        if self._finished:
+            return []
+        self._finished = True
+        new_spikes = []
+        if self._last_sample is not None:
+            last_dvdt = (self._last_diff if self._last_diff is not None
+                         else 0.0)
+            new_spikes = self._analyse(numpy.array([self._last_sample]),
+                                       numpy.array([last_dvdt]))
+        # Resolve the remaining periods, clipping their buffers to the end of
+        # the recording
+        new_spikes.extend(self._resolve(final=True))
+        return new_spikes
+
+    def _analyse(self, v, dvdt):
+        """
+        Updates the threshold-crossing state with the next consecutive samples
+        for which the dV/dt has been calculated
+        """
+        offset = self._num_analysed
+        self._num_analysed += len(v)
+        if self._last_v is not None:
+            v = numpy.concatenate(([self._last_v], v))
+            dvdt = numpy.concatenate(([self._last_dvdt], dvdt))
+            offset -= 1
+        self._last_v = v[-1]
+        self._last_dvdt = dvdt[-1]
+        # Record the dV/dt zero crossings, which are used to calculate the
+        # exact spike times
+        zero_inds = numpy.nonzero((dvdt[:-1] >= 0) & (dvdt[1:] < 0))[0]
+        self._zero_crossings.extend(
+               (offset + i, dvdt[i] / (dvdt[i] - dvdt[i + 1]))
+               for i in zero_inds)
+        # Detect the start and stop threshold crossings
+        if self.threshold == 'dvdt':
+            starts = numpy.nonzero((dvdt[1:] >= self.start) &
+                                   (dvdt[:-1] < self.start))[0]
+            stops = numpy.nonzero((dvdt[1:] > self.stop) &
+                                  (dvdt[:-1] <= self.stop))[0]
+        else:
+            starts = numpy.nonzero((v[1:] >= self.start) &
+                                   (v[:-1] < self.start))[0]
+            stops = numpy.nonzero((v[1:] < self.stop) &
+                                  (v[:-1] >= self.stop))[0]
+        events = sorted([(offset + i + 1, True) for i in starts] +
+                        [(offset + i + 1, False) for i in stops])
+        for index, is_start in events:
+            # Repeated start crossings before a stop are merged into the same
+            # period and stops without a preceding start are dropped (see
+            # AnalysedSignal._pair_crossings)
+            if is_start:
+                if self._period_start is None:
+                    self._period_start = index
+            elif self._period_start is not None:
+                self._unresolved.append((self._period_start, index))
+                self._period_start = None
+        return self._resolve()
+
+    def _resolve(self, final=False):
+        """
+        Calculates the spike times of the periods whose (buffered) extent has
+        been completely analysed and discards the zero crossings that can no
+        longer fall within a period
+        """
+        new_spikes = []
+        while self._unresolved:
+            start, stop = self._unresolved[0]
+            lower = max(start - self.index_buffer, 0)
+            upper = stop + self.index_buffer
+            if upper > self._num_analysed:
+                if not final:
+                    break
+                upper = self._num_analysed
+            self._unresolved.popleft()
+            crossings = [c for c in self._zero_crossings
+                         if c[0] >= lower and c[0] < upper - 1]
+            if len(crossings) != 1:
+                raise Exception("One dV/dt zero crossing expected in spike "
+                                "period {}-{} ({} found)"
+                                .format(lower, upper, len(crossings)))
+            index, fraction = crossings[0]
+            spike_time = (float(self.t_start) +
+                          (index + fraction) * float(self.sampling_period))
+            self.periods.append((lower, upper))
+            self.spike_times.append(spike_time)
+            new_spikes.append(spike_time)
+        # Drop zero crossings before the earliest index that an unresolved or
+        # future period can extend back to
+        if self._unresolved:
+            earliest = self._unresolved[0][0]
+        elif self._period_start is not None:
+            earliest = self._period_start
+        else:
+            earliest = self._num_analysed
+        earliest -= self.index_buffer
+        while self._zero_crossings and self._zero_crossings[0][0] < earliest:
+            self._zero_crossings.popleft()
+        return new_spikes
+
+
+class FeatureExtractor(object):
+    """
+    Plans and performs the extraction of a set of declared features from a
+    signal. Features are computed from shared intermediates (dV/dt, threshold
+    crossings, peaks and troughs), each of which is computed at most once per
+    signal and cached with it, so extracting several features costs little
+    more than extracting the most expensive of them. As the cache is held by
+    the signal, it is also shared between different objectives that extract
+    features from the same signal with the same settings.
+
+    The available features are
+
+        spike_times       -- the spike times (see AnalysedSignal.spikes)
+        spike_frequency   -- the average spike frequency (see
+                             AnalysedSignal.spike_frequency)
+        isis              -- the interspike intervals
+        peak_values       -- the maximum voltage of each spike
+        peak_times        -- the time of the maximum voltage of each spike
+        trough_values     -- the minimum voltage between consecutive peaks
+        trough_times      -- the time of the minimum voltage between peaks
+        ahp_depths        -- the depth of the after-hyperpolarisation of each
+                             spike (bar the last) below its onset voltage
+        widths            -- the width of each spike at half the height between
+                             its onset and its peak
+        phase_plane_loops -- the v-dV/dt loops of each spike (see
+                             AnalysedSignal.spike_v_dvdt)
+    """
+
+    # Maps each feature/intermediate onto the features/intermediates it is
+    # calculated from
+    DEPENDENCIES = {'dvdt': (),
+                    'periods': ('dvdt',),
+                    'spike_times': ('periods',),
+                    'spike_frequency': ('spike_times',),
+                    'isis': ('spike_times',),
+                    'peak_indices': ('periods',),
+                    'peak_values': ('peak_indices',),
+                    'peak_times': ('peak_indices',),
+                    'trough_indices': ('peak_indices',),
+                    'trough_values': ('trough_indices',),
+                    'trough_times': ('trough_indices',),
+                    'onset_values': ('periods',),
+                    'ahp_depths': ('onset_values', 'trough_values'),
+                    'widths': ('periods', 'peak_indices', 'onset_values'),
+                    'phase_plane_loops': ('periods',)}
+
+    FEATURES = ('spike_times', 'spike_frequency', 'isis', 'peak_values', 'peak_times',
+                'trough_values', 'trough_times', 'ahp_depths', 'widths',
+                'phase_plane_loops')
+
+    def __init__(self, features, threshold='dvdt', start=10.0, stop=-10.0,
+                 loop_samples=100, dvdt2v_scale=0.25, interp_order=3):
+        """
+        `features`     -- the names of the features to extract [list(str)]
+        `threshold`    -- the type of threshold used to detect spikes, either
+                          'dvdt' or 'v' (see
+                          AnalysedSignal._spike_period_indices) [str]
+        `start`        -- the start threshold of the spikes [float]
+        `stop`         -- the stop threshold of the spikes [float]
+        `loop_samples` -- the number of samples in each phase-plane loop [int]
+        `dvdt2v_scale` -- the scale used to compare the v and dV/dt traces
+                          when interpolating the phase-plane loops [float]
+        `interp_order` -- the order of the spline interpolation used for the
+                          phase-plane loops [int]
+        """
+        unrecognised = [f for f in features if f not in self.FEATURES]
+        if unrecognised:
+            raise Exception("Unrecognised feature(s) '{}' (can be any of '{}')"
+                            .format("', '".join(unrecognised),
+                                    "', '".join(self.FEATURES)))
+        self.features = tuple(features)
+        self.threshold = threshold
+        self.start = start
+        self.stop = stop
+        self.loop_samples = loop_samples
+        self.dvdt2v_scale = dvdt2v_scale
+        self.interp_order = interp_order
+        self.plan = self._plan(self.features)
+
+    @property
+    def settings(self):
+        return (self.threshold, self.start, self.stop, self.loop_samples,
+                self.dvdt2v_scale, self.interp_order)
+
+    @classmethod
+    def _plan(cls, features):
+        """
+        Orders the features and all the intermediates they depend on so that
+        each is calculated after its dependencies and only once
+        """
+        plan = []
+
+        def add(name):
+            if name not in plan:
+                for dependency in cls.DEPENDENCIES[name]:
+                    add(dependency)
+                plan.append(name)
+        for feature in features:
+            add(feature)
+        return plan
+
+    def __call__(self, signal):
+        """
+        Extracts the features from the signal, returning them in a dictionary
+
+        `signal` -- the signal to extract the features from [AnalysedSignal]
+        """
+        signal = AnalysedSignal(signal)
+        results = {}
+        for name in self.plan:
+            key = (name, self.settings)
+            try:
+                results[name] = signal._features[key]
+            except KeyError:
+                results[name] = getattr(self, '_' + name)(signal, results)
+                signal._features[key] = results[name]
+        return dict((f, results[f]) for f in self.features)
+
+    def _dvdt(self, signal, results):  # @UnusedVariable
+        return numpy.asarray(signal.dvdt)
+
+    def _periods(self, signal, results):  # @UnusedVariable
+        periods = signal._spike_period_indices(threshold=self.threshold,
+                                               start=self.start,
+                                               stop=self.stop)
+        return numpy.reshape(periods, (-1, 2)).astype(int)
+
+    def _spike_times(self, signal, results):  # @UnusedVariable
+        return signal.spikes(threshold=self.threshold, start=self.start,
+                             stop=self.stop)
+
+    def _spike_frequency(self, signal, results):  # @UnusedVariable
+        # Calculated from the spike times cached with the signal
+        return signal.spike_frequency(threshold=self.threshold,
+                                      start=self.start, stop=self.stop)
+
+    def _isis(self, signal, results):  # @UnusedVariable
+        return numpy.diff(results['spike_times'])
+
+    def _peak_indices(self, signal, results):
+        periods = results['periods']
+        return _segment_arg_extrema(numpy.asarray(signal), periods[:, 0],
+                                    periods[:, 1], numpy.maximum)
+
+    def _peak_values(self, signal, results):
+        return numpy.asarray(signal)[results['peak_indices']]
+
+    def _peak_times(self, signal, results):
+        return self._index_times(signal, results['peak_indices'])
+
+    def _trough_indices(self, signal, results):
+        peaks = results['peak_indices']
+        return _segment_arg_extrema(numpy.asarray(signal), peaks[:-1],
+                                    peaks[1:], numpy.minimum)
+
+    def _trough_values(self, signal, results):
+        return numpy.asarray(signal)[results['trough_indices']]
+
+    def _trough_times(self, signal, results):
+        return self._index_times(signal, results['trough_indices'])
+
+    def _onset_values(self, signal, results):
+        return numpy.asarray(signal)[results['periods'][:, 0]]
+
+    def _ahp_depths(self, signal, results):  # @UnusedVariable
+        return results['onset_values'][:-1] - results['trough_values']
+
+    def _widths(self, signal, results):
+        v = numpy.asarray(signal)
+        periods = results['periods']
+        peaks = results['peak_indices']
+        half_heights = (results['onset_values'] + v[peaks]) / 2.0
+        # The falling phase of each spike is searched until the onset of the
+        # next spike or the end of the signal
+        ends = numpy.append(periods[1:, 0], len(v))
+        dt = float(signal.sampling_period.rescale(signal.t_start.units))
+        # The last sample below the half-height on the rising phase and the
+        # first sample below it on the falling phase
+        j = _segment_first_below(v, half_heights, periods[:, 0], peaks,
+                                 last=True)
+        k = _segment_first_below(v, half_heights, peaks, ends)
+        widths = numpy.empty(len(peaks))
+        widths.fill(float('nan'))
+        valid = (j >= 0) & (k >= 0)
+        j, k, half = j[valid], k[valid], half_heights[valid]
+        # Linearly interpolate the exact half-height crossings
+        rise = j + (half - v[j]) / (v[j + 1] - v[j])
+        fall = k - 1 + (v[k - 1] - half) / (v[k - 1] - v[k])
+        widths[valid] = (fall - rise) * dt
+        return widths
+
+    def _phase_plane_loops(self, signal, results):  # @UnusedVariable
+        return signal.spike_v_dvdt(self.loop_samples,
+                                   dvdt2v_scale=self.dvdt2v_scale,
+                                   interp_order=self.interp_order,
+                                   start_thresh=self.start,
+                                   stop_thresh=self.stop)
+
+    @classmethod
+    def _index_times(cls, signal, indices):
+        return (float(signal.t_start) + indices *
+                float(signal.sampling_period.rescale(signal.t_start.units)))
+
+
+def _segment_arg_extrema(values, starts, stops, ufunc):
+    """
+    Returns the index of the first extremum of the values within each of the
+    given (non-empty) segments without looping over the segments
+
+    `values` -- the array of values [numpy.array(float)]
+    `starts` -- the start indices of the segments [numpy.array(int)]
+    `stops`  -- the stop indices of the segments [numpy.array(int)]
+    `ufunc`  -- either numpy.maximum or numpy.minimum
+    """
+    starts = numpy.asarray(starts, dtype=int)
+    stops = numpy.asarray(stops, dtype=int)
+    if not len(starts):
+        return numpy.array([], dtype=int)
+    lengths = stops - starts
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+    # Get the indices of the values in all segments concatenated together
+    indices = (numpy.arange(lengths.sum()) -
+               numpy.repeat(offsets - starts, lengths))
+    segment_values = values[indices]
+    extrema = ufunc.reduceat(segment_values, offsets)
+    labels = numpy.repeat(numpy.arange(len(starts)), lengths)
+    is_extremum = numpy.nonzero(segment_values == extrema[labels])[0]
+    first = is_extremum[numpy.searchsorted(labels[is_extremum],
+                                           numpy.arange(len(starts)))]
+    return indices[first]
+
+
+def _segment_first_below(values, thresholds, starts, stops, last=False):
+    """
+    Returns the index of the first (or last) of the values within each of the
+    given segments that is below the threshold of the segment, or -1 if none
+    of them are, without looping over the segments
+
+    `values`     -- the array of values [numpy.array(float)]
+    `thresholds` -- the threshold of each segment [numpy.array(float)]
+    `starts`     -- the start indices of the segments [numpy.array(int)]
+    `stops`      -- the stop indices of the segments [numpy.array(int)]
+    `last`       -- whether to return the last value below the threshold
+                    instead of the first [bool]
+    """
+    starts = numpy.asarray(starts, dtype=int)
+    lengths = numpy.maximum(numpy.asarray(stops, dtype=int) - starts, 0)
+    result = numpy.empty(len(starts), dtype=int)
+    result.fill(-1)
+    if not lengths.sum():
+        return result
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+    # Get the indices of the values in all segments concatenated together
+    indices = (numpy.arange(lengths.sum()) -
+               numpy.repeat(offsets - starts, lengths))
+    labels = numpy.repeat(numpy.arange(len(starts)), lengths)
+    below = numpy.nonzero(values[indices] <
+                          numpy.asarray(thresholds)[labels])[0]
+    segments = numpy.arange(len(starts))
+    if last:
+        pos = numpy.searchsorted(labels[below], segments, side='right') - 1
+    else:
+        pos = numpy.searchsorted(labels[below], segments, side='left')
+    # Segments without any values below their threshold are left as -1
+    found = (pos >= 0) & (pos < len(below))
+    found[found] = labels[below[pos[found]]] == segments[found]
+    result[found] = indices[below[pos[found]]]
+    return result
+
+
 def smooth(x, window_len=11, window='hanning'):
     """Smooth the data using a window with requested size.
     
@@ -752,7 +1942,7 @@ def single_spike_width(y, t, baseline):
     return width
 
 
-def spike_widths(y, t, baseline=0, delta=0):
+def spike_widths(y, t, baseline=0, delta=0, max_min_dictionary=None):
     """
     Find the widths of each spike at a fixed height in a train of spikes.
     
@@ -764,13 +1954,16 @@ def spike_widths(y, t, baseline=0, delta=0):
     :param y: voltage trace (array) corresponding to the spike train
     :param t: time value array corresponding to y
     :param baseline: the height (voltage) where the width is to be measured.
+    :param max_min_dictionary: the turning points of the trace previously
+        returned by max_min(y, t, delta), to avoid rescanning the trace
         
     :return: width of spike at height defined by baseline
     
     """
 
     # first get the max and min data:
-    max_min_dictionary = max_min(y, t, delta)
+    if max_min_dictionary is None:
+        max_min_dictionary = max_min(y, t, delta)
 
     max_num = max_min_dictionary['maxima_number']
 #     maxima_locations=max_min_dictionary['maxima_locations']
@@ -1100,7 +2293,7 @@ def pptd_error(t_model, v_model, t_target, v_target, dvdt_threshold=None):
 
     return error
 
-def minima_phases(t, y, delta=0):
+def minima_phases(t, y, delta=0, max_min_dictionary=None):
     """
     Find the phases of minima.
     
@@ -1116,11 +2309,14 @@ def minima_phases(t, y, delta=0):
     :param t: time-vector
     :param delta: the value by which a peak or trough has to exceed its
         neighbours to be considered "outside of the noise"
+    :param max_min_dictionary: the turning points of the trace previously
+        returned by max_min(y, t, delta), to avoid rescanning the trace
         
     :return: phase of minimum relative to peaks.
     
     """
-    max_min_dictionary = max_min(y, t, delta)
+    if max_min_dictionary is None:
+        max_min_dictionary = max_min(y, t, delta)
 
     minima_num = max_min_dictionary['minima_number']
     maxima_times = max_min_dictionary['maxima_times']
@@ -1319,9 +2515,14 @@ class IClampAnalysis(TraceAnalysis):
             analysis_results['mean_spike_frequency'] = mean_spike_frequency(max_min_dictionary['maxima_times'])
             analysis_results['interspike_time_covar'] = spike_covar(max_min_dictionary['maxima_times'])
             analysis_results['first_spike_time'] = max_min_dictionary['maxima_times'][0]
-            trough_phases = minima_phases(self.t, self.v, delta=self.delta)
+            # minima_phases and spike_widths use the default peak threshold
+            # so they can share a single scan of the turning points
+            default_max_min = max_min(self.v, self.t, self.delta)
+            trough_phases = minima_phases(self.t, self.v, delta=self.delta,
+                                       max_min_dictionary=default_max_min)
             analysis_results['trough_phase_adaptation'] = exp_fit(trough_phases[0], trough_phases[1])
-            spike_width_list = spike_widths(self.v, self.t, self.baseline, self.delta)
+            spike_width_list = spike_widths(self.v, self.t, self.baseline, self.delta,
+                                            max_min_dictionary=default_max_min)
             analysis_results['spike_width_adaptation'] = exp_fit(spike_width_list[0], spike_width_list[1])
             spike_frequency_list = spike_frequencies(max_min_dictionary['maxima_times'])
             analysis_results['peak_decay_exponent'] = three_spike_adaptation(max_min_dictionary['maxima_times'], max_min_dictionary['maxima_values'])
@@ -1,8 +1,13 @@
 from __future__ import absolute_import
 from abc import ABCMeta  # Metaclass for abstract base classes
+import os
+import errno
+import hashlib
+from copy import copy
 import numpy
 import quantities as pq
 from ..simulation.__init__ import RecordingRequest
+from ..analysis import FeatureExtractor
 
 
 class Objective(object):
@@ -13,6 +18,21 @@ class Objective(object):
     # Declare this class abstract to avoid accidental construction
     __metaclass__ = ABCMeta
 
+    # The names of the features the objective requires from its recordings
+    # and the settings used to extract them (see analysis.FeatureExtractor)
+    required_features = ()
+    feature_settings = {}
+
+    # Whether the fitness method accepts a 'cutoff' argument, above which it
+    # can return a lower bound on the fitness instead of the exact value (see
+    # multi.WeightedSumObjective.fitness)
+    accepts_cutoff = False
+
+    # The directory in which preprocessed reference artifacts (histograms,
+    # loops, spike times, etc...) are cached between runs and processes. If
+    # None the artifacts are recomputed every time the objective is created
+    reference_cache_dir = os.environ.get('NEUROTUNE_REFERENCE_CACHE', None)
+
     def __init__(self, time_start=500.0 * pq.ms, time_stop=2000.0 * pq.ms,
                  exp_conditions=None, record_sites=[None]):
         """
@@ -38,6 +58,140 @@ class Objective(object):
                                   "implement fitness method"
                                   .format(self.__class__.__name__))
 
+    def at_fidelity(self, fidelity=None):
+        """
+        Returns the objective to evaluate recordings simulated at the given
+        fidelity with. Only the leading fraction of the objective window is
+        simulated at reduced fidelities (see Simulation.setups_at), so a copy
+        of the objective is returned that compares it against the same
+        fraction of the reference. Objectives that can't be truncated raise an
+        exception for time fractions less than 1
+
+        `fidelity` -- the fidelity of the simulations, full fidelity if None
+                      [simulation.Fidelity]
+        """
+        if fidelity is None or fidelity.time_fraction == 1.0:
+            return self
+        try:
+            reduced_copies = self._reduced_copies
+        except AttributeError:
+            reduced_copies = self._reduced_copies = {}
+        try:
+            return reduced_copies[fidelity.time_fraction]
+        except KeyError:
+            pass
+        reduced = copy(self)
+        reduced._reduced_copies = {}
+        reduced._truncate(fidelity)
+        reduced_copies[fidelity.time_fraction] = reduced
+        return reduced
+
+    def _truncate(self, fidelity):
+        """
+        Truncates the window of a reduced copy of the objective to the
+        fraction of it simulated at the given fidelity (see at_fidelity)
+        """
+        self.time_stop = (self.time_start + fidelity.time_fraction *
+                          (self.time_stop - self.time_start))
+        self._truncate_reference()
+
+    def _truncate_reference(self):
+        """
+        Recomputes whatever the objective derives from the reference over its
+        window after the window has been truncated
+        """
+        raise Exception("'{}' objectives can't be evaluated at reduced "
+                        "fractions of their time window"
+                        .format(self.__class__.__name__))
+
+    def extract_features(self, analysis, key=None):
+        """
+        Extracts the features declared in 'required_features' from the
+        requested signal in a single planned pass, sharing the intermediate
+        analysis with any other objectives that extract features from the
+        same signal
+
+        `analysis` -- The analysis object containing all recordings and
+                      analysis of them [analysis.Analysis]
+        `key`      -- the key of the requested recording
+        """
+        try:
+            extractor = self._feature_extractor
+        except AttributeError:
+            extractor = self._feature_extractor = FeatureExtractor(
+                               self.required_features, **self.feature_settings)
+        return extractor(analysis.get_signal(key))
+
+    def _cached_reference(self, name, settings, compute):
+        """
+        Returns a (memory-mapped) array computed from the reference, which is
+        loaded from the reference cache directory if it has been computed
+        previously with the same reference and settings, or otherwise computed
+        and saved there for subsequent runs
+
+        `name`     -- the name of the artifact [str]
+        `settings` -- the reference trace(s) and all settings that the
+                      artifact depends on [tuple]
+        `compute`  -- a function that takes no arguments and computes the
+                      artifact when it isn't in the cache [function]
+        """
+        if not self.reference_cache_dir:
+            return numpy.asarray(compute())
+        path = os.path.join(self.reference_cache_dir, '{}-{}-{}.npy'.format(
+                                       type(self).__name__, name,
+                                       self._reference_hash((name,) +
+                                                            tuple(settings))))
+        try:
+            # Return a plain array view of the memory map so that the results
+            # of arithmetic with it are not memory maps as well
+            return numpy.load(path, mmap_mode='r').view(numpy.ndarray)
+        except IOError:
+            pass
+        artifact = numpy.asarray(compute())
+        try:
+            os.makedirs(self.reference_cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file and then move it into place so that
+        # processes starting at the same time never load partial files
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            numpy.save(f, artifact)
+        os.rename(tmp_path, path)
+        return artifact
+
+    @classmethod
+    def _reference_hash(cls, settings):
+        """
+        Returns a hash of the contents of the reference traces and settings an
+        artifact is computed from
+
+        `settings` -- a nested tuple of arrays, quantities and other objects
+                      with a repr that identifies them [tuple]
+        """
+        sha = hashlib.sha1()
+
+        def update(obj):
+            if isinstance(obj, (tuple, list)):
+                sha.update('({}:'.format(len(obj)))
+                for o in obj:
+                    update(o)
+                sha.update(')')
+            elif isinstance(obj, numpy.ndarray):
+                arr = numpy.ascontiguousarray(obj)
+                sha.update('{}{}{}'.format(arr.dtype.str, arr.shape,
+                                           getattr(obj, 'dimensionality', '')))
+                # Signals also need their timing to be identified
+                for attr in ('t_start', 'sampling_period'):
+                    if hasattr(obj, attr):
+                        update(getattr(obj, attr))
+                sha.update(arr.tostring())
+            else:
+                sha.update(repr(obj))
+        update(settings)
+        return sha.hexdigest()
+
     def get_recording_requests(self):
         """
         Returns a RecordingRequest object or a dictionary of RecordingRequest
@@ -65,3 +219,6 @@ class DummyObjective(Objective):
 
     def fitness(self, recordings):  # @UnusedVariable
         return 1
+
+    def _truncate_reference(self):
+        pass
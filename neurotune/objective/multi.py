@@ -1,4 +1,5 @@
 from __future__ import absolute_import
+from time import time
 from .__init__ import Objective
 
 
@@ -31,10 +32,31 @@ class MultiObjective(Objective):
         order the objectives were passed to the __init__ method
         """
         fitnesses = []
-        for obj in self.objectives:
-            fitnesses.append(obj.fitness(analysis.objective_specific(obj)))
+        for i, obj in enumerate(self.objectives):
+            fitnesses.append(obj.fitness(
+                                analysis.objective_specific(self._key(i))))
         return fitnesses
 
+    def _truncate(self, fidelity):
+        """
+        Reduces each of the sub-objectives to the given fidelity. Their
+        recordings are still requested under the full sub-objectives, which
+        are kept as the keys to the recordings (see get_recording_requests)
+        """
+        self._full_objectives = self.objectives
+        self.objectives = [obj.at_fidelity(fidelity)
+                           for obj in self.objectives]
+
+    def _key(self, index):
+        """
+        Returns the key the recordings of the sub-objective at the given index
+        were requested under
+        """
+        try:
+            return self._full_objectives[index]
+        except AttributeError:
+            return self.objectives[index]
+
     def get_recording_requests(self):
         # Zip the recording requests keys with objective object in a tuple to
         # guarantee unique keys
@@ -54,20 +76,86 @@ class WeightedSumObjective(MultiObjective):
     Useful for optimization algorithms that require a single objective
     """
 
+    # The fitness can be cut off early (see fitness)
+    accepts_cutoff = True
+
+    # The weighting given to the latest timing when updating the running
+    # estimate of the cost of each objective
+    COST_SMOOTHING = 0.2
+
     def __init__(self, *weighted_objectives):
         """
         `weighted_objectives` -- a list of weight-objective pairs
                                  [list((float, Objective))]
         """
         self.weights, self.objectives = zip(*weighted_objectives)
+        # Running estimates of the time taken to evaluate each objective
+        # (None until it has been measured)
+        self.costs = [None] * len(self.objectives)
 
-    def fitness(self, analysis):
+    def fitness(self, analysis, cutoff=None):
         """
-        Returns a inspyred.ec.emo.Pareto list of the fitness functions in the
-        order the objectives were passed to the __init__ method
+        Returns the weighted sum of the fitness functions. If a cutoff is
+        provided the objectives are evaluated from the cheapest to the most
+        expensive and if the partial sum exceeds the cutoff before all of them
+        have been evaluated the partial sum is returned instead, which is a
+        lower bound on the full sum provided the weights and fitnesses are
+        non-negative. The cutoff is passed with each candidate by algorithms
+        that only need to know whether the fitness is below it (see
+        Tuner._evaluator)
+
+        `analysis` -- The analysis object containing all recordings and
+                      analysis of them [analysis.Analysis]
+        `cutoff`   -- the value above which the evaluation can be stopped
+                      [float]
+        """
+        weighted = [None] * len(self.objectives)
+        partial_sum = 0.0
+        for position, i in enumerate(self._evaluation_order(
+                                                       cutoff is not None)):
+            weight, obj = self.weights[i], self.objectives[i]
+            start_time = time()
+            weighted[i] = weight * obj.fitness(
+                                    analysis.objective_specific(self._key(i)))
+            # The first objective evaluated also pays for the analysis shared
+            # between the objectives (eg. the dV/dt and spikes), so its timing
+            # is only used if it hasn't been timed before
+            if position or self.costs[i] is None:
+                self._update_cost(i, time() - start_time)
+            partial_sum += weighted[i]
+            if (cutoff is not None and partial_sum > cutoff and
+                    position + 1 < len(weighted)):
+                return partial_sum
+        # Sum in the order the objectives were passed to the __init__ method
+        # so the full sum doesn't depend on the order of evaluation
+        return sum(weighted)
+
+    def _truncate(self, fidelity):
+        super(WeightedSumObjective, self)._truncate(fidelity)
+        # The costs of the reduced objectives are estimated separately
+        self.costs = [None] * len(self.objectives)
+
+    def _evaluation_order(self, by_cost):
+        """
+        Returns the indices of the objectives in the order they should be
+        evaluated. Without a cutoff the order they were passed to the __init__
+        method is kept, otherwise the objectives that haven't been timed yet
+        go first followed by the rest from the cheapest to the most expensive
+
+        `by_cost` -- whether to order the objectives by their cost [bool]
+        """
+        if not by_cost:
+            return range(len(self.objectives))
+        return sorted(range(len(self.objectives)),
+                      key=lambda i: (self.costs[i] is not None,
+                                     self.costs[i]))
+
+    def _update_cost(self, index, duration):
+        """
+        Updates the running estimate of the cost of an objective
         """
-        weighted_sum = 0.0
-        for weight, obj in zip(self.weights, self.objectives):
-            weighted_sum += (weight *
-                             obj.fitness(analysis.objective_specific(obj)))
-        return weighted_sum
+        if self.costs[index] is None:
+            self.costs[index] = duration
+        else:
+            self.costs[index] += self.COST_SMOOTHING * (duration -
+                                                        self.costs[index])
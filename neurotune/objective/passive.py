@@ -1,19 +1,37 @@
 from __future__ import absolute_import
 from abc import ABCMeta  # Metaclass for abstract base classes
+import numpy
 import quantities as pq
 import neo.io
 from .__init__ import Objective
+from ..analysis import AnalysedSignal, AnalysedSignalBatch
 from ..simulation import RecordingRequest, ExperimentalConditions, \
                          StepCurrentSource
 
 
 class PassivePropertiesObjective(Objective):
+    """
+    Base class of objectives that compare passive properties fitted to the
+    response to a current step, which are fitted in closed form (see
+    analysis.exponential_step_fit) so they can be evaluated cheaply for large
+    numbers of candidates
+    """
 
     __metaclass__ = ABCMeta
 
     def __init__(self, reference_trace, injected_current,
                  record_variable=None, time_start=500.0 * pq.ms,
                  time_stop=2000.0 * pq.ms):
+        """
+        `reference_trace`  -- the response of the reference to the current
+                              step (in Neo format) [neo.AnalogSignal]
+        `injected_current` -- the amplitude of the current step injected from
+                              'time_start' [float (nA) or pq.Quantity]
+        `record_variable`  -- the recording site [str]
+        `time_start`       -- the time the current step starts and from which
+                              the response is fitted
+        `time_stop`        -- the length of the recording
+        """
         super(PassivePropertiesObjective, self).__init__(time_start, time_stop)
         # Save reference trace(s) as a list, converting if a single trace or
         # loading from file if a valid filename
@@ -23,12 +41,32 @@ class PassivePropertiesObjective(Objective):
             self.reference_traces = seg.analogsignals[0]
         elif isinstance(reference_trace, neo.AnalogSignal):
             self.reference_traces = reference_trace
+        else:
+            raise Exception("Unrecognised format for reference trace ({}), "
+                            "must be either path-to-file or neo.AnalogSignal"
+                            .format(type(reference_trace)))
         # Save members
         self.record_variable = record_variable
         self.injected_current = injected_current
         step_source = StepCurrentSource([0, injected_current],
                                         [0.0, time_start])
-        self.exp_conditions = ExperimentalConditions(clamps=step_source)
+        self.exp_conditions = ExperimentalConditions(clamps=[step_source])
+        self._fit_reference()
+
+    def _truncate_reference(self):
+        self._fit_reference()
+
+    def _fit_reference(self):
+        """
+        Fits the response of the reference over the same window as the
+        recordings
+        """
+        reference = AnalysedSignal(self.reference_traces)
+        if (self.time_start > reference.t_start or
+                self.time_stop < reference.t_stop):
+            reference = reference.slice(self.time_start, self.time_stop)
+        self.reference_value = self._property(
+                                        *reference.exponential_fit())
 
     def get_recording_requests(self):
         """
@@ -39,12 +77,66 @@ class PassivePropertiesObjective(Objective):
                                 time_stop=self.time_stop,
                                 conditions=self.exp_conditions)
 
+    def fitness(self, analysis):
+        """
+        Calculates the squared difference between the passive property of the
+        reference and the recorded trace
+
+        `analysis` -- The analysis object containing all recordings and
+                      analysis of them [analysis.Analysis]
+        """
+        signal = analysis.get_signal()
+        value = self._property(*signal.exponential_fit())
+        return float((self.reference_value - value) ** 2)
+
+    def batch_fitness(self, batch):
+        """
+        Calculates the fitness of many recorded sweeps at once, fitting all of
+        them in a single vectorized pass
+
+        `batch` -- the recorded sweeps, which are fitted over the window of
+                   the objective [analysis.AnalysedSignalBatch or
+                   list(neo.AnalogSignal)]
+        """
+        if not isinstance(batch, AnalysedSignalBatch):
+            batch = AnalysedSignalBatch.from_signals(batch)
+        # Fit the sweeps over the same window as the reference
+        if (self.time_start > batch.t_start or
+                self.time_stop < batch.t_stop):
+            batch = batch.slice(self.time_start, self.time_stop)
+        values = self._property(*batch.exponential_fit())
+        return numpy.asarray((self.reference_value - values) ** 2)
+
+    def _property(self, v_inf, delta, tau):
+        """
+        Returns the passive property from the fitted steady-state voltage,
+        the amplitude of the exponential at the start of the step and the time
+        constant
+        """
+        raise NotImplementedError("Derived PassivePropertiesObjective class "
+                                  "'{}' does not implement _property method"
+                                  .format(self.__class__.__name__))
+
 
 class TimeConstantObjective(PassivePropertiesObjective):
+    """
+    Compares the membrane time constant of the response to the current step
+    """
 
-    pass
+    def _property(self, v_inf, delta, tau):  # @UnusedVariable
+        return tau.rescale(pq.ms)
 
 
 class PeakConductanceObjective(PassivePropertiesObjective):
+    """
+    Compares the input conductance (the injected current divided by the
+    steady-state change in voltage) of the response to the current step
+    """
 
-    pass
+    def _property(self, v_inf, delta, tau):  # @UnusedVariable
+        current = self.injected_current
+        if not isinstance(current, pq.Quantity):
+            current = pq.Quantity(current, 'nA')
+        # The voltage change between the start of the step and steady state
+        # is the negative of the amplitude of the exponential
+        return (current / -delta).rescale(pq.uS)
@@ -6,7 +6,7 @@ import scipy.signal
 import quantities as pq
 import neo.io
 from . import Objective
-from ..analysis import AnalysedSignal
+from ..analysis import AnalysedSignal, bincount_histogram2d
 
 
 class PhasePlaneObjective(Objective):
@@ -69,6 +69,19 @@ class PhasePlaneObjective(Objective):
         self.interp_order = interp_order
         self.dvdt2v_scale = dvdt2v_scale
 
+    def _truncate_reference(self):
+        self.reference = self.reference.slice(self.time_start, self.time_stop)
+        self._process_reference()
+
+    def _process_reference(self):
+        """
+        Generates whatever the simulated data is compared against from the
+        reference trace
+        """
+        raise NotImplementedError("Derived PhasePlaneObjective class '{}' "
+                                  "does not implement _process_reference "
+                                  "method".format(self.__class__.__name__))
+
 
 class PhasePlaneHistObjective(PhasePlaneObjective):
     """
@@ -78,10 +91,13 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
 
     BOUND_DEFAULT = 0.5
 
+    CONVOLUTION_METHODS = ('direct', 'separable', 'fft')
+
     def __init__(self, reference, num_bins=(150, 150),
                  v_bounds=(-100.0, 80.0), dvdt_bounds=(-300.0, 400.0),
                  resample_ratio=3.0, kernel_stdev=(10.0, 40.0),
-                 kernel_cutoff=(3.5, 3.5), **kwargs):
+                 kernel_cutoff=(3.5, 3.5), convolution='direct',
+                 spectral_diff=False, **kwargs):
         """
         Creates a phase plane histogram from the reference traces and compares
         that with the histograms from the simulated traces
@@ -107,9 +123,34 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
                               no convolution is performed [tuple[2](float)]
         `kernel_cutoff`    -- the number of standard deviations the Gaussian
                               kernel is truncated at
+        `convolution`      -- the method used to bin and convolve the
+                              histograms, either 'direct' (numpy.histogram2d
+                              and scipy.signal.convolve2d), 'separable'
+                              (integer bincount then the Gaussian applied as
+                              two 1-D passes) or 'fft' (integer bincount then
+                              multiplication by the precomputed transform of
+                              the kernel). The fast methods match 'direct' up
+                              to rounding error [str]
+        `spectral_diff`    -- calculate the squared difference from the
+                              reference directly in the frequency domain
+                              (requires convolution='fft'). Note that this
+                              difference includes the tails of the kernel that
+                              extend beyond the bounds of the histogram, so it
+                              only matches 'direct' up to rounding error when
+                              the convolved histograms lie within the bounds
+                              and is otherwise larger [bool]
         """
         super(PhasePlaneHistObjective, self).__init__(reference,
                                                       **kwargs)
+        if convolution not in self.CONVOLUTION_METHODS:
+            raise Exception("Unrecognised convolution method '{}', can be one "
+                            "of '{}'".format(convolution, "', '".join(
+                                                self.CONVOLUTION_METHODS)))
+        if spectral_diff and convolution != 'fft':
+            raise Exception("Spectral difference can only be used with 'fft' "
+                            "convolution")
+        self.convolution = convolution
+        self.spectral_diff = spectral_diff
         self.num_bins = numpy.asarray(num_bins, dtype=int)
         self._set_bounds(v_bounds, dvdt_bounds)
         if resample_ratio:
@@ -133,9 +174,36 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
                            numpy.exp(-mesh[1] ** 2) /
                            (2 * numpy.pi * self.kernel_stdev[0] *
                             self.kernel_stdev[1]))
-        # Generate the reference phase plane the simulated data will be
-        # compared against
-        self.ref_hist = self._generate_hist(self.reference)
+            if convolution == 'separable':
+                self._prepare_separable(mesh)
+            elif convolution == 'fft':
+                self._prepare_fft()
+        else:
+            self.kernel = None
+            if spectral_diff:
+                raise Exception("Spectral difference requires a convolution "
+                                "kernel")
+        # The settings the reference phase plane depends on along with the
+        # reference trace
+        self._reference_settings = (self.num_bins, self.bounds,
+                                    self.resample_length, kernel_stdev,
+                                    kernel_cutoff, convolution,
+                                    self.dvdt2v_scale, self.interp_order)
+        self._process_reference()
+
+    def _process_reference(self):
+        """
+        Generates the reference phase plane the simulated data will be
+        compared against
+        """
+        settings = (self.reference,) + self._reference_settings
+        if self.spectral_diff:
+            self._ref_spectrum = self._cached_reference(
+                            'ref_spectrum', settings,
+                            lambda: self._spectrum(self._bin(self.reference)))
+        self.ref_hist = self._cached_reference(
+                                 'ref_hist', settings,
+                                 lambda: self._generate_hist(self.reference))
 
     @property
     def range(self):
@@ -151,6 +219,13 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
         assert((signal.t_stop - signal.t_start) == (self.reference.t_stop -
                                                     self.reference.t_start)), \
                "Attempting to compare traces of different lengths"
+        if self.spectral_diff:
+            # Use Parseval's theorem to get the sum of squared differences
+            # between the (fully) convolved histograms from their transforms
+            diff = self._ref_spectrum - self._spectrum(self._bin(signal))
+            diff = diff.real ** 2 + diff.imag ** 2
+            return (numpy.dot(diff.sum(axis=0), self._parseval_weights) /
+                    self._fft_shape.prod())
         phase_plane_hist = self._generate_hist(signal)
         # Get the root-mean-square difference between the reference and
         # simulated histograms
@@ -177,13 +252,16 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
         # For both v and dV/dt bounds and see if any are None and therefore
         # require a default value to be calculated.
         self.bounds = []
-        for bounds, trace in ((v_bounds, self.reference),
-                              (dvdt_bounds, self.reference.dvdt)):
+        # The traces are accessed through functions so the (spline) dV/dt of
+        # the reference is only calculated if it is required
+        for bounds, get_trace in ((v_bounds, lambda: self.reference),
+                                  (dvdt_bounds, lambda: self.reference.dvdt)):
             if bounds is None:
                 # Calculate the bounds of the reference traces
-                trace = numpy.array(trace)
-                min_trace = numpy.min(trace)
-                max_trace = numpy.max(trace)
+                min_trace, max_trace = self._cached_reference(
+                    'trace_bounds', (self.reference, len(self.bounds)),
+                    lambda: (numpy.min(numpy.array(get_trace())),
+                             numpy.max(numpy.array(get_trace()))))
                 # Extend the bounds by the fraction in DEFAULT_RANGE_EXTEND
                 range_extend = (max_trace - min_trace) * self.BOUND_DEFAULT
                 bounds = (numpy.floor(min_trace - range_extend),
@@ -200,19 +278,98 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
 
         returns 2D histogram
         """
+        hist = self._bin(trace)
+        if self.kernel is not None:
+            # Convolve the histogram with the precalculated Gaussian kernel
+            if self.convolution == 'separable':
+                hist = self._v_conv_matrix.dot(hist).dot(
+                                                     self._dvdt_conv_matrix.T)
+            elif self.convolution == 'fft':
+                hist = numpy.fft.irfftn(self._spectrum(hist),
+                                        self._fft_shape)[self._fft_crop]
+            else:
+                hist = scipy.signal.convolve2d(hist, self.kernel, mode='same')
+        return hist
+
+    def _bin(self, trace):
+        """
+        Bins the (optionally resampled) v-dV/dt trace into the unconvolved
+        histogram
+
+        `trace` -- a voltage trace [AnalysedSignal]
+        """
         if self.resample_length:
             v, dvdt = trace.evenly_sampled_v_dvdt(self.resample_length,
                                                   self.dvdt2v_scale,
                                                   self.interp_order)
         else:
             v, dvdt = trace, trace.dvdt
-        hist = numpy.histogram2d(v, dvdt, bins=self.num_bins,
-                                 range=self.bounds, normed=False)[0]
-        if self.kernel is not None:
-            # Convolve the histogram with the precalculated Gaussian kernel
-            hist = scipy.signal.convolve2d(hist, self.kernel, mode='same')
+        if self.convolution == 'direct':
+            hist = numpy.histogram2d(v, dvdt, bins=self.num_bins,
+                                     range=self.bounds, normed=False)[0]
+        else:
+            hist = bincount_histogram2d(numpy.asarray(v), numpy.asarray(dvdt),
+                                        self.num_bins, self.bounds)
         return hist
 
+    def _prepare_separable(self, mesh):
+        """
+        Precomputes the matrices that apply the 1-D factors of the (separable)
+        Gaussian kernel along each axis, so that the 'same' 2-D convolution
+        becomes two matrix products
+
+        `mesh` -- the open mesh the kernel was evaluated over
+        """
+        v_factor = numpy.exp(-mesh[0][:, 0] ** 2)
+        dvdt_factor = (numpy.exp(-mesh[1][0, :] ** 2) /
+                       (2 * numpy.pi * self.kernel_stdev[0] *
+                        self.kernel_stdev[1]))
+        self._v_conv_matrix = self._same_conv_matrix(self.num_bins[0],
+                                                     v_factor)
+        self._dvdt_conv_matrix = self._same_conv_matrix(self.num_bins[1],
+                                                        dvdt_factor)
+
+    @classmethod
+    def _same_conv_matrix(cls, length, factor):
+        """
+        Returns the (banded Toeplitz) matrix that convolves a vector of the
+        given length with the 1-D factor, cropped to the central part of the
+        same length as in scipy.signal.convolve2d(..., mode='same')
+        """
+        offset = (len(factor) - 1) // 2
+        # The index into the factor for each element of the matrix
+        inds = (numpy.arange(length)[:, numpy.newaxis] + offset -
+                numpy.arange(length)[numpy.newaxis, :])
+        valid = (inds >= 0) & (inds < len(factor))
+        matrix = numpy.zeros((length, length))
+        matrix[valid] = factor[inds[valid]]
+        return matrix
+
+    def _prepare_fft(self):
+        """
+        Precomputes the transform of the kernel, zero-padded so the product
+        of transforms gives the full linear (rather than circular) convolution
+        """
+        kernel_shape = numpy.array(self.kernel.shape)
+        self._fft_shape = self.num_bins + kernel_shape - 1
+        self._kernel_spectrum = numpy.fft.rfftn(self.kernel, self._fft_shape)
+        offsets = (kernel_shape - 1) // 2
+        self._fft_crop = tuple(slice(o, o + n)
+                               for o, n in zip(offsets, self.num_bins))
+        # The real transform only contains the non-negative frequencies of
+        # the last axis, so the others need to be counted twice
+        self._parseval_weights = numpy.empty(self._fft_shape[1] // 2 + 1)
+        self._parseval_weights.fill(2.0)
+        self._parseval_weights[0] = 1.0
+        if self._fft_shape[1] % 2 == 0:
+            self._parseval_weights[-1] = 1.0
+
+    def _spectrum(self, hist):
+        """
+        Returns the transform of the histogram convolved with the kernel
+        """
+        return numpy.fft.rfftn(hist, self._fft_shape) * self._kernel_spectrum
+
     def plot_hist(self, trace_or_hist=None, min_max=None, diff=False,
                   show=True):
         """
@@ -308,8 +465,15 @@ class PhasePlaneHistObjective(PhasePlaneObjective):
 
 class PhasePlanePointwiseObjective(PhasePlaneObjective):
 
+    DISTANCE_METHODS = ('broadcast', 'blas')
+
+    # The maximum number of elements in the intermediate difference array
+    # used by the 'broadcast' method before it is split into blocks of rows
+    MAX_BROADCAST_SIZE = 2 ** 22
+
     def __init__(self, reference, num_points=100, dvdt_thresholds=(10, -10),
-                 no_spike_reference=(-100, 0.0), **kwargs):
+                 no_spike_reference=(-100, 0.0), distance_method='broadcast',
+                 **kwargs):
         """
         Creates a phase plane histogram from the reference traces and compares
         that with the histograms from the simulated traces
@@ -323,20 +487,48 @@ class PhasePlanePointwiseObjective(PhasePlaneObjective):
         `no_spike_reference` -- the reference point which is used to compare
                                 the reference spikes to when there are no
                                 recorded spikes
+        `distance_method`    -- the method used to find the nearest loops,
+                                either 'broadcast' (element-wise differences
+                                between all pairs of loops), 'blas' (pairwise
+                                distances from a single matrix product, which
+                                is faster but can lose precision for very
+                                close loops) [str]
         """
         super(PhasePlanePointwiseObjective, self).__init__(reference, **kwargs)
+        if distance_method not in self.DISTANCE_METHODS:
+            raise Exception("Unrecognised distance method '{}', can be one of "
+                            "'{}'".format(distance_method, "', '".join(
+                                                     self.DISTANCE_METHODS)))
+        self.distance_method = distance_method
         self.thresh = dvdt_thresholds
         if self.thresh[0] < 0.0 or self.thresh[1] > 0.0:
             raise Exception("Start threshold must be above 0 and end threshold"
                             " must be below 0 (found {})".format(self.thresh))
         self.num_points = num_points
         self.no_spike_reference = no_spike_reference
-        self.reference_loops = self.reference.spike_v_dvdt(
+        self._process_reference()
+
+    def _process_reference(self):
+        """
+        Extracts the reference loops the recorded loops will be compared
+        against
+        """
+        self.reference_loops = self._cached_reference(
+                    'reference_loops',
+                    (self.reference, self.num_points, self.dvdt2v_scale,
+                     self.interp_order, self.thresh),
+                    lambda: self.reference.spike_v_dvdt(
                                            self.num_points, self.dvdt2v_scale,
                                            self.interp_order, self.thresh[0],
-                                           self.thresh[1])
+                                           self.thresh[1]))
         if len(self.reference_loops) == 0:
             raise Exception("No loops found in reference signal")
+        # Flatten the reference loops into the rows of a single array so they
+        # can be compared with all the recorded loops at once
+        self._ref_loop_mat = self._loop_matrix(self.reference_loops)
+        if self.distance_method == 'blas':
+            self._ref_sq_norms = numpy.einsum('ij,ij->i', self._ref_loop_mat,
+                                              self._ref_loop_mat)
 
     def fitness(self, analysis):
         """
@@ -358,12 +550,10 @@ class PhasePlanePointwiseObjective(PhasePlaneObjective):
             recorded_loops = [numpy.empty((2, self.num_points))]
             recorded_loops[0][0, :] = self.no_spike_reference[0]
             recorded_loops[0][1, :] = self.no_spike_reference[1]
+        rec_loop_mat = self._loop_matrix(recorded_loops)
         # Create matrix of sum-squared-differences between recorded to
         # reference loops
-        fit_mat = numpy.empty((len(recorded_loops), len(self.reference_loops)))
-        for rec_loop, row in zip(recorded_loops, fit_mat):
-            for i, ref_loop in enumerate(self.reference_loops):
-                row[i] = numpy.sum((rec_loop - ref_loop) ** 2)
+        fit_mat = self._sq_distance_matrix(rec_loop_mat)
         # Get the minimum along every row and every colum and sum them together
         # for the nearest loop difference for every recorded loop to every
         # reference loop and vice-versa
@@ -371,3 +561,46 @@ class PhasePlanePointwiseObjective(PhasePlaneObjective):
                     numpy.sum(numpy.amin(fit_mat, axis=1))) /
                    (fit_mat.shape[0] + fit_mat.shape[1]))
         return fitness
+
+    def _sq_distance_matrix(self, rec_loop_mat):
+        """
+        Returns the matrix of sum-squared-differences between every recorded
+        loop (rows) and every reference loop (columns)
+
+        `rec_loop_mat` -- the recorded loops flattened into the rows of an
+                          array [numpy.array(float)]
+        """
+        if self.distance_method == 'blas':
+            # Expand |a - b|^2 = |a|^2 + |b|^2 - 2a.b so the bulk of the
+            # calculation is a single matrix product
+            fit_mat = rec_loop_mat.dot(self._ref_loop_mat.T)
+            fit_mat *= -2.0
+            fit_mat += numpy.einsum('ij,ij->i', rec_loop_mat,
+                                    rec_loop_mat)[:, numpy.newaxis]
+            fit_mat += self._ref_sq_norms
+            # Rounding error can push the distances of near identical loops
+            # slightly below zero
+            numpy.maximum(fit_mat, 0.0, out=fit_mat)
+        else:
+            num_ref = self._ref_loop_mat.shape[0]
+            fit_mat = numpy.empty((rec_loop_mat.shape[0], num_ref))
+            # Split the recorded loops into blocks so the intermediate array
+            # of differences stays a manageable size
+            block_size = max(
+                self.MAX_BROADCAST_SIZE // self._ref_loop_mat.size, 1)
+            for start in xrange(0, rec_loop_mat.shape[0], block_size):
+                block = rec_loop_mat[start:start + block_size]
+                diff = block[:, numpy.newaxis, :] - self._ref_loop_mat
+                diff **= 2
+                fit_mat[start:start + block_size] = diff.sum(axis=2)
+        return fit_mat
+
+    @classmethod
+    def _loop_matrix(cls, loops):
+        """
+        Flattens a list of v-dV/dt loops into the rows of a single array
+
+        `loops` -- a list of loops as returned by AnalysedSignal.spike_v_dvdt
+                   [list(numpy.array(float))]
+        """
+        return numpy.array([numpy.ravel(loop) for loop in loops])
@@ -1,8 +1,9 @@
 from __future__ import absolute_import
+from abc import ABCMeta  # Metaclass for abstract base classes
 import numpy
 import quantities as pq
 import neo.core
-from ..analysis import AnalysedSignal
+from ..analysis import AnalysedSignal, AnalysedSignalBatch
 from . import Objective
 
 
@@ -12,6 +13,8 @@ class SpikeFrequencyObjective(Objective):
     frequencies
     """
 
+    required_features = ('spike_frequency',)
+
     def __init__(self, frequency, time_start=500.0 * pq.ms,
                  time_stop=2000.0 * pq.ms):
         """
@@ -21,10 +24,18 @@ class SpikeFrequencyObjective(Objective):
         """
         super(SpikeFrequencyObjective, self).__init__(time_start, time_stop)
         if isinstance(frequency, neo.core.AnalogSignal):
-            self.frequency = AnalysedSignal(frequency).spike_frequency()
+            units = 1.0 / frequency.times.units
+            self.frequency = pq.Quantity(self._cached_reference(
+                    'frequency', (frequency,),
+                    lambda: AnalysedSignal(frequency).spike_frequency()
+                                                     .rescale(units)), units)
         else:
             self.frequency = pq.Quantity(frequency, units='Hz')
 
+    def _truncate_reference(self):
+        # The frequency is a rate so it is compared as is
+        pass
+
     def fitness(self, analysis):
         """
         Calculates the sum squared difference between the reference freqency
@@ -33,8 +44,7 @@ class SpikeFrequencyObjective(Objective):
         `analysis` -- The analysis object containing all recordings and
                       analysis of them [analysis.Analysis]
         """
-        signal = analysis.get_signal()
-        frequency = signal.spike_frequency()
+        frequency = self.extract_features(analysis)['spike_frequency']
         return float((self.frequency - frequency) ** 2)
 
 
@@ -44,6 +54,8 @@ class SpikeTimesObjective(Objective):
     nearest spike in the reference set and vice versa.
     """
 
+    required_features = ('spike_times',)
+
     def __init__(self, reference, time_start=500.0 * pq.ms,
                  time_stop=2000.0 * pq.ms, time_buffer=250 * pq.ms):
         """
@@ -56,23 +68,43 @@ class SpikeTimesObjective(Objective):
                         with but which won't be compared with the inner spikes
         """
         super(SpikeTimesObjective, self).__init__(time_start, time_stop)
-        if time_stop - time_start - time_buffer * 2 <= 0:
-            raise Exception("Buffer time ({}) exceeds half of spike train "
-                            "time ({}) and therefore the inner window is "
-                            "empty".format(buffer, (time_stop - time_start)))
         if isinstance(reference, neo.core.SpikeTrain):
             self.ref_spikes = reference
         elif isinstance(reference, neo.core.AnalogSignal):
-            self.ref_spikes = AnalysedSignal(reference).spikes()
+            self.ref_spikes = neo.SpikeTrain(
+                self._cached_reference(
+                    'ref_spikes', (reference,),
+                    lambda: AnalysedSignal(reference).spikes().magnitude),
+                reference.t_stop, units=reference.times.units)
         else:
             raise Exception("Spikes must be a neo.core.SpikeTrain object not "
                             "{}".format(type(reference)))
         self.time_buffer = time_buffer
-        self.ref_inner = reference[numpy.where(
-                                    (reference >= (time_start + time_buffer)) &
-                                    (reference <= (time_stop - time_buffer)))]
+        # Store the reference spike times as sorted plain arrays so the
+        # nearest spikes can be found with a binary search
+        self._ref_units = self.ref_spikes.units
+        self._ref_times = numpy.sort(self.ref_spikes.magnitude)
+        self._set_inner_window()
+
+    def _truncate_reference(self):
+        self._set_inner_window()
+
+    def _set_inner_window(self):
+        """
+        Selects the reference spikes within the inner window, away from the
+        edges of the time window by the time buffer
+        """
+        if self.time_stop - self.time_start - self.time_buffer * 2 <= 0:
+            raise Exception("Buffer time ({}) exceeds half of spike train "
+                            "time ({}) and therefore the inner window is "
+                            "empty".format(self.time_buffer,
+                                           (self.time_stop - self.time_start)))
+        self.ref_inner = self.ref_spikes[numpy.where(
+              (self.ref_spikes >= (self.time_start + self.time_buffer)) &
+              (self.ref_spikes <= (self.time_stop - self.time_buffer)))]
         if not len(self.ref_inner):
             raise Exception("Inner window does not contain any spikes")
+        self._ref_inner_times = numpy.sort(self.ref_inner.magnitude)
 
     def fitness(self, analysis):
         """
@@ -83,7 +115,7 @@ class SpikeTimesObjective(Objective):
         `analysis` -- The analysis object containing all recordings and
                       analysis of them [analysis.Analysis]
         """
-        spikes = analysis.get_signal().spikes()
+        spikes = self.extract_features(analysis)['spike_times']
         inner = spikes[numpy.where(
                              (spikes >= (self.time_start + self.time_buffer)) &
                              (spikes <= (self.time_stop - self.time_buffer)))]
@@ -93,9 +125,269 @@ class SpikeTimesObjective(Objective):
         if len(spikes) == 0:
             spike_t = self.time_stop + self.time_start
             spikes = neo.SpikeTrain([spike_t], spike_t, units=spike_t.units)
-        fitness = 0.0
-        for spike in inner:
-            fitness += float(numpy.square(self.ref_spikes - spike).min())
-        for ref_spike in self.ref_inner:
-            fitness += float(numpy.square(spikes - ref_spike).min())
+        # Find the nearest reference spike to each inner spike (in the units
+        # of the reference) and vice-versa (in the units of the signal)
+        inner_times = inner.rescale(self._ref_units).magnitude
+        spike_times = numpy.sort(spikes.magnitude)
+        ref_inner_times = pq.Quantity(self._ref_inner_times,
+                                      self._ref_units).rescale(spikes.units)
+        fitness = float(numpy.sum(nearest_sq_diffs(inner_times,
+                                                   self._ref_times)))
+        fitness += float(numpy.sum(nearest_sq_diffs(ref_inner_times.magnitude,
+                                                    spike_times)))
         return fitness
+
+
+class SpikeTrainDistanceObjective(Objective):
+    """
+    Base class of objectives based on a distance between the spike train of
+    the recording and the reference spike train within the time window
+    """
+
+    # Declare this class abstract to avoid accidental construction
+    __metaclass__ = ABCMeta
+
+    required_features = ('spike_times',)
+
+    def __init__(self, reference, time_start=500.0 * pq.ms,
+                 time_stop=2000.0 * pq.ms):
+        """
+        `reference`  -- reference signal or spike train
+                        [neo.AnalogSignal or neo.SpikeTrain]
+        `time_start` -- time from which to start including spikes [float]
+        `time_stop`  -- length of time to run the simulation [float]
+        """
+        super(SpikeTrainDistanceObjective, self).__init__(time_start,
+                                                          time_stop)
+        if isinstance(reference, neo.core.SpikeTrain):
+            ref_times = reference.rescale(pq.ms).magnitude
+        elif isinstance(reference, neo.core.AnalogSignal):
+            ref_times = self._cached_reference(
+                'ref_spikes', (reference,),
+                lambda: AnalysedSignal(reference).spikes().rescale(pq.ms)
+                                                          .magnitude)
+        else:
+            raise Exception("Spikes must be a neo.core.SpikeTrain object not "
+                            "{}".format(type(reference)))
+        # The distances are calculated on sorted plain arrays of spike times
+        # (in ms) within the time window
+        self.ref_times = self._window(ref_times)
+
+    def _truncate_reference(self):
+        self.ref_times = self._window(self.ref_times)
+
+    def fitness(self, analysis):
+        """
+        Calculates the distance between the spike train of the recorded
+        signal and the reference spike train
+
+        `analysis` -- The analysis object containing all recordings and
+                      analysis of them [analysis.Analysis]
+        """
+        spikes = self.extract_features(analysis)['spike_times']
+        return self.distance(self._window(spikes.rescale(pq.ms).magnitude))
+
+    def batch_fitness(self, spike_trains):
+        """
+        Calculates the distances of many recorded spike trains (eg. from all
+        the candidates of a generation) from the reference at once
+
+        `spike_trains` -- the recorded signals or their spike trains
+                          [analysis.AnalysedSignalBatch or
+                           list(neo.SpikeTrain)]
+        """
+        if isinstance(spike_trains, AnalysedSignalBatch):
+            spike_trains = spike_trains.spikes()
+        return numpy.array([self.distance(self._window(
+                                          st.rescale(pq.ms).magnitude))
+                            for st in spike_trains])
+
+    def distance(self, times):
+        """
+        Returns the distance between the (sorted) spike times and the
+        reference spike times
+
+        `times` -- the spike times in ms [numpy.array(float)]
+        """
+        raise NotImplementedError("Derived SpikeTrainDistanceObjective class "
+                                  "'{}' does not implement distance method"
+                                  .format(self.__class__.__name__))
+
+    def _window(self, times):
+        """
+        Returns the sorted spike times (in ms) within the time window
+        """
+        times = numpy.sort(numpy.asarray(times, dtype=float))
+        start = numpy.searchsorted(
+                times, float(self.time_start.rescale(pq.ms)), side='left')
+        stop = numpy.searchsorted(
+                times, float(self.time_stop.rescale(pq.ms)), side='right')
+        return times[start:stop]
+
+
+class VictorPurpuraObjective(SpikeTrainDistanceObjective):
+    """
+    The Victor-Purpura distance between the recorded and reference spike
+    trains, the minimum cost of transforming one spike train into the other
+    where inserting or deleting a spike costs 1 and shifting a spike costs
+    'cost' per unit time (Victor and Purpura 1996)
+    """
+
+    def __init__(self, reference, cost=0.1 / pq.ms, **kwargs):
+        """
+        `reference` -- reference signal or spike train
+                       [neo.AnalogSignal or neo.SpikeTrain]
+        `cost`      -- the cost of shifting a spike per unit time
+                       [pq.Quantity(1/time)]
+        `kwargs`    -- passed to SpikeTrainDistanceObjective
+        """
+        super(VictorPurpuraObjective, self).__init__(reference, **kwargs)
+        if not isinstance(cost, pq.Quantity):
+            cost = pq.Quantity(cost, 1.0 / pq.ms)
+        self.cost = cost
+
+    def distance(self, times):
+        return victor_purpura_distance(
+                            times, self.ref_times,
+                            float(self.cost.rescale(1.0 / pq.ms)))
+
+
+class VanRossumObjective(SpikeTrainDistanceObjective):
+    """
+    The van Rossum distance between the recorded and reference spike trains,
+    the (normalised) L2 distance between the spike trains after convolving
+    them with a causal exponential kernel (van Rossum 2001)
+    """
+
+    def __init__(self, reference, tau=10.0 * pq.ms, **kwargs):
+        """
+        `reference` -- reference signal or spike train
+                       [neo.AnalogSignal or neo.SpikeTrain]
+        `tau`       -- the time constant of the exponential kernel
+                       [pq.Quantity(time)]
+        `kwargs`    -- passed to SpikeTrainDistanceObjective
+        """
+        super(VanRossumObjective, self).__init__(reference, **kwargs)
+        if not isinstance(tau, pq.Quantity):
+            tau = pq.Quantity(tau, pq.ms)
+        self.tau = tau
+        # The reference term of the distance only needs to be calculated once
+        self._ref_overlap = _exp_overlap(self.ref_times, self.ref_times,
+                                         float(self.tau.rescale(pq.ms)))
+
+    def _truncate_reference(self):
+        super(VanRossumObjective, self)._truncate_reference()
+        self._ref_overlap = _exp_overlap(self.ref_times, self.ref_times,
+                                         float(self.tau.rescale(pq.ms)))
+
+    def distance(self, times):
+        tau = float(self.tau.rescale(pq.ms))
+        sq_dist = 0.5 * (_exp_overlap(times, times, tau) + self._ref_overlap -
+                         2.0 * _exp_overlap(times, self.ref_times, tau))
+        # Rounding error can make identical trains slightly negative
+        return numpy.sqrt(max(sq_dist, 0.0))
+
+
+def victor_purpura_distance(times1, times2, cost):
+    """
+    Returns the Victor-Purpura distance between two spike trains. The dynamic
+    program is evaluated a row at a time, where the insertions within a row
+    (the only sequential dependency) become a cumulative minimum, so the cost
+    is O(n * m) with the inner loop vectorised
+
+    `times1` -- the first spike train [numpy.array(float)]
+    `times2` -- the second spike train [numpy.array(float)]
+    `cost`   -- the cost of shifting a spike per unit time (in the inverse of
+                the units of the spike times) [float]
+    """
+    times1 = numpy.asarray(times1, dtype=float)
+    times2 = numpy.asarray(times2, dtype=float)
+    # Keep the rows as long as possible to get the most out of vectorisation
+    if len(times1) > len(times2):
+        times1, times2 = times2, times1
+    offsets = numpy.arange(len(times2) + 1, dtype=float)
+    # The distances between the first i spikes of times1 and first j spikes
+    # of times2 for the current row i
+    row = offsets.copy()
+    for i, t in enumerate(times1, 1):
+        # Cost of deleting spike i or shifting it onto each spike of times2
+        prev = row
+        row = numpy.empty_like(prev)
+        row[0] = i
+        row[1:] = numpy.minimum(prev[1:] + 1.0,
+                                prev[:-1] + cost * numpy.abs(times2 - t))
+        # Inserting spikes of times2 adds 1 per spike, so
+        # row[j] = min_k(row[k] + (j - k)), a cumulative minimum
+        row = numpy.minimum.accumulate(row - offsets) + offsets
+    return row[-1]
+
+
+# The largest span (in time constants) that exponentials are accumulated over
+# before rescaling to avoid overflow
+_MAX_EXP_SPAN = 600.0
+
+
+def _decayed_counts(times, sources, tau):
+    """
+    Returns, for each of the times, the sum of exp(-(t - s) / tau) over the
+    sources s that precede it, in O(n + m) after a binary search of the
+    (sorted) sources
+
+    `times`   -- the times to evaluate the sums at [numpy.array(float)]
+    `sources` -- the sorted times of the sources [numpy.array(float)]
+    `tau`     -- the decay time constant [float]
+    """
+    result = numpy.zeros(len(times))
+    if not len(times) or not len(sources):
+        return result
+    scaled = sources / tau
+    # The decayed count of the sources up to and including each source,
+    # accumulated in blocks short enough for the exponentials not to overflow
+    counts = numpy.empty(len(sources))
+    start = 0
+    while start < len(sources):
+        origin = scaled[start]
+        stop = numpy.searchsorted(scaled, origin + _MAX_EXP_SPAN,
+                                  side='right')
+        offsets = scaled[start:stop] - origin
+        carry = (counts[start - 1] * numpy.exp(scaled[start - 1] - origin)
+                 if start else 0.0)
+        counts[start:stop] = (numpy.exp(-offsets) *
+                              (numpy.cumsum(numpy.exp(offsets)) + carry))
+        start = stop
+    # Decay the count of the last source before each time to that time
+    inds = numpy.searchsorted(sources, times, side='left') - 1
+    valid = inds >= 0
+    result[valid] = (counts[inds[valid]] *
+                     numpy.exp((sources[inds[valid]] - times[valid]) / tau))
+    return result
+
+
+def _exp_overlap(times1, times2, tau):
+    """
+    Returns the sum of exp(-|t1 - t2| / tau) over all pairs of spikes from
+    the two (sorted) spike trains in O(n + m) time
+    """
+    # Coincident spikes aren't included in either of the decayed counts
+    coincident = (numpy.searchsorted(times2, times1, side='right') -
+                  numpy.searchsorted(times2, times1, side='left')).sum()
+    return (_decayed_counts(times1, times2, tau).sum() +
+            _decayed_counts(times2, times1, tau).sum() + coincident)
+
+
+def nearest_sq_diffs(times, targets):
+    """
+    Returns the squared difference between each time and the nearest of the
+    target times, using a binary search of the targets so the cost is
+    O((n + m) log m) rather than O(n * m)
+
+    `times`   -- the times to find the nearest targets for [numpy.array(float)]
+    `targets` -- the (non-empty) times to match against, which must be sorted
+                 [numpy.array(float)]
+    """
+    inds = numpy.searchsorted(targets, times)
+    # The nearest target is either the one immediately before or after the
+    # insertion point
+    before = targets[numpy.maximum(inds - 1, 0)]
+    after = targets[numpy.minimum(inds, len(targets) - 1)]
+    return numpy.minimum((times - before) ** 2, (times - after) ** 2)
@@ -0,0 +1,211 @@
+from __future__ import absolute_import
+import numpy
+import quantities as pq
+import neo.io
+from . import Objective
+from ..analysis import AnalysedSignal
+
+
+class TraceDistanceObjective(Objective):
+    """
+    The distance between the simulated and reference voltage traces over the
+    objective window, optionally after aligning the traces, either by a
+    constant shift found from their cross-correlation or by dynamic time
+    warping within a Sakoe-Chiba band
+    """
+
+    ALIGNMENTS = (None, 'shift', 'dtw')
+
+    def __init__(self, reference, time_start=500.0 * pq.ms,
+                 time_stop=2000.0 * pq.ms, alignment=None,
+                 max_shift=10.0 * pq.ms, band_width=5.0 * pq.ms, decimate=1,
+                 record_variable=None, exp_conditions=None):
+        """
+        `reference`       -- the reference trace (in Neo format) or the path
+                             to a file containing it [neo.AnalogSignal or str]
+        `time_start`      -- the start of the window the traces are compared
+                             over [pq.Quantity(time)]
+        `time_stop`       -- the end of the window the traces are compared
+                             over [pq.Quantity(time)]
+        `alignment`       -- how the traces are aligned before they are
+                             compared, either None (compared sample by
+                             sample), 'shift' (the shift that minimises the
+                             mean squared difference, found by FFT
+                             cross-correlation) or 'dtw' (dynamic time
+                             warping within a Sakoe-Chiba band) [str]
+        `max_shift`       -- the largest shift considered by 'shift'
+                             alignment [pq.Quantity(time)]
+        `band_width`      -- the half-width of the Sakoe-Chiba band used by
+                             'dtw' alignment, the cost of which is
+                             O(num_samples * band_width) [pq.Quantity(time)]
+        `decimate`        -- the factor the traces are decimated by (by
+                             averaging blocks of samples) before they are
+                             compared [int]
+        `record_variable` -- the recording site [str]
+        `exp_conditions`  -- the required experimental conditions
+                             [neurotune.simulation.ExperimentalConditions]
+        """
+        super(TraceDistanceObjective, self).__init__(
+                        time_start, time_stop, exp_conditions=exp_conditions,
+                        record_sites=[record_variable])
+        if alignment not in self.ALIGNMENTS:
+            raise Exception("Unrecognised alignment '{}', can be one of '{}'"
+                            .format(alignment, "', '".join(
+                                         str(a) for a in self.ALIGNMENTS)))
+        if int(decimate) < 1:
+            raise Exception("Decimation factor must be a positive integer "
+                            "(found {})".format(decimate))
+        if isinstance(reference, str):
+            seg = neo.io.PickleIO(reference).read_segment()
+            try:
+                reference = seg.analogsignals[0]
+            except IndexError:
+                raise Exception("No analog signals were loaded from file '{}'"
+                                .format(reference))
+        if not isinstance(reference, neo.AnalogSignal):
+            raise Exception("Unrecognised format for reference trace ({}), "
+                            "must be either path-to-file, neo.AnalogSignal or "
+                            "AnalysedSignal".format(type(reference)))
+        reference = AnalysedSignal(reference)
+        if (time_start > reference.t_start or
+                time_stop < reference.t_stop):
+            reference = reference.slice(time_start, time_stop)
+        self.reference = reference
+        self.alignment = alignment
+        self.decimate = int(decimate)
+        self.max_shift = max_shift
+        self.band_width = band_width
+        self._ref_trace = self._prepare(reference)
+
+    def _truncate_reference(self):
+        self.reference = self.reference.slice(self.time_start, self.time_stop)
+        self._ref_trace = self._prepare(self.reference)
+
+    def fitness(self, analysis):
+        """
+        Calculates the mean squared difference between the (aligned)
+        simulated and reference traces
+
+        `analysis` -- The analysis object containing all recordings and
+                      analysis of them [analysis.Analysis]
+        """
+        signal = analysis.get_signal(self.record_sites[0])
+        assert signal.sampling_period == self.reference.sampling_period, \
+            "Attempting to compare traces with different sampling periods"
+        trace = self._prepare(signal)
+        if self.alignment == 'shift':
+            return float(shifted_sq_diffs(trace, self._ref_trace,
+                                          self._num_samples(self.max_shift)
+                                          ).min())
+        elif self.alignment == 'dtw':
+            return float(dtw_distance(trace, self._ref_trace,
+                                      self._num_samples(self.band_width)))
+        length = min(len(trace), len(self._ref_trace))
+        diff = trace[:length] - self._ref_trace[:length]
+        return float(numpy.dot(diff, diff) / length)
+
+    def _prepare(self, signal):
+        """
+        Returns the magnitude of the signal (in mV) decimated by the
+        decimation factor
+        """
+        scale = float(pq.Quantity(1.0, signal.units).rescale(pq.mV))
+        trace = numpy.asarray(signal.magnitude, dtype=float) * scale
+        if self.decimate > 1:
+            length = len(trace) // self.decimate
+            trace = trace[:length * self.decimate].reshape(
+                                        (length, self.decimate)).mean(axis=1)
+        return trace
+
+    def _num_samples(self, duration):
+        """
+        Converts a duration into a number of (decimated) samples
+        """
+        return int(round(float(duration / (self.reference.sampling_period *
+                                           self.decimate))))
+
+
+def shifted_sq_diffs(x, y, max_shift):
+    """
+    Returns the mean squared difference between x shifted by each of the
+    shifts from -max_shift to max_shift (in samples) and y over the samples
+    where they overlap. The cross terms for all shifts are calculated at once
+    from the FFT cross-correlation and the energies of the overlapping
+    sections from cumulative sums, so the cost is O(n log n)
+
+    `x`         -- the trace to shift [numpy.array(float)]
+    `y`         -- the trace to compare against [numpy.array(float)]
+    `max_shift` -- the largest shift (in samples) in either direction [int]
+    """
+    length = min(len(x), len(y))
+    x = numpy.asarray(x[:length], dtype=float)
+    y = numpy.asarray(y[:length], dtype=float)
+    max_shift = min(int(max_shift), length - 1)
+    shifts = numpy.arange(-max_shift, max_shift + 1)
+    # Pad to a power of 2 long enough to avoid circular wrapping
+    fft_len = 1 << int(numpy.ceil(numpy.log2(length + max_shift)))
+    corr = numpy.fft.irfft(numpy.fft.rfft(x, fft_len) *
+                           numpy.conj(numpy.fft.rfft(y, fft_len)), fft_len)
+    # corr[s] = sum_k x[k + s] * y[k], with negative shifts wrapped around
+    cross = corr[shifts % fft_len]
+    # Cumulative energies so the energy of any overlapping section is a
+    # difference of two entries
+    x_energy = numpy.concatenate(([0.0], numpy.cumsum(x ** 2)))
+    y_energy = numpy.concatenate(([0.0], numpy.cumsum(y ** 2)))
+    overlap = length - numpy.abs(shifts)
+    pos = numpy.maximum(shifts, 0)
+    neg = numpy.maximum(-shifts, 0)
+    # x[s:length] overlaps y[0:length - s] for positive shifts and
+    # x[0:length + s] overlaps y[-s:length] for negative shifts
+    x_overlap = x_energy[pos + overlap] - x_energy[pos]
+    y_overlap = y_energy[neg + overlap] - y_energy[neg]
+    sq_diffs = (x_overlap + y_overlap - 2.0 * cross) / overlap
+    # Rounding error can make near identical sections slightly negative
+    return numpy.maximum(sq_diffs, 0.0)
+
+
+def dtw_distance(x, y, band_width):
+    """
+    Returns the dynamic time warping distance (the sum of squared differences
+    along the optimal warping path divided by the length of the longest
+    trace) between two traces, with the warping path constrained to a
+    Sakoe-Chiba band of the given half-width. Each row of the band is
+    evaluated in a vectorised step, in which the steps along the row (the
+    only sequential dependency) reduce to a cumulative minimum, so the cost
+    is O(n * band_width)
+
+    `x`          -- the first trace [numpy.array(float)]
+    `y`          -- the second trace [numpy.array(float)]
+    `band_width` -- the maximum distance (in samples) of the warping path from
+                    the diagonal [int]
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    n, m = len(x), len(y)
+    # The band needs to be at least wide enough to reach the end of both
+    w = max(int(band_width), abs(n - m))
+    width = 2 * w + 1
+    # The costs of the previous row of the band (indexed by j - i + w), with
+    # an extra entry past the end so the cell above the last can be indexed
+    prev = numpy.empty(width + 1)
+    prev.fill(numpy.inf)
+    for i in xrange(n):
+        lo = max(0, w - i)
+        hi = min(width, m - i + w)
+        cost = (x[i] - y[lo + i - w:hi + i - w]) ** 2
+        # The best of arriving from the cell above or diagonally above
+        if i:
+            above = numpy.minimum(prev[lo + 1:hi + 1], prev[lo:hi])
+        else:
+            above = numpy.empty(hi - lo)
+            above.fill(numpy.inf)
+            above[0] = 0.0
+        # row[j] = cost[j] + min(above[j], row[j - 1]) expands to
+        # min_k(above[k] + sum(cost[k:j + 1])), a cumulative minimum
+        cum_cost = numpy.cumsum(cost)
+        row = numpy.empty(width + 1)
+        row.fill(numpy.inf)
+        row[lo:hi] = cum_cost + numpy.minimum.accumulate(above - cum_cost +
+                                                         cost)
+        prev = row
+    return prev[m - 1 - (n - 1) + w] / max(n, m)
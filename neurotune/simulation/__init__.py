@@ -32,7 +32,43 @@ class RecordingRequest(object):
         self.conditions = conditions
         self.tuner = None
 
-RequestRef = namedtuple('RequestRef', 'key time_start time_stop')
+class RequestRef(namedtuple('RequestRef',
+                            'key time_start time_stop time_offset')):
+    """
+    References a request from the recording of the variable it requested.
+    `time_offset` is the offset of the requested window within the recording
+    when the protocol of the request has been concatenated with others into
+    a single simulation (see ProtocolConcatenator)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, key, time_start, time_stop, time_offset=0.0 * pq.ms):
+        return super(RequestRef, cls).__new__(cls, key, time_start, time_stop,
+                                              time_offset)
+
+
+class Fidelity(namedtuple('Fidelity', 'time_fraction timestep_factor')):
+    """
+    A reduced fidelity at which candidates can be screened cheaply, in which
+    only the first `time_fraction` of each requested recording window is
+    simulated and the simulation timestep is multiplied by `timestep_factor`.
+    The objectives compare the simulated fraction of their windows against the
+    same fraction of their references (see Objective.at_fidelity)
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, time_fraction=1.0, timestep_factor=1):
+        if not 0.0 < time_fraction <= 1.0:
+            raise Exception("Fraction of recording windows to simulate ({}) "
+                            "must be in the range (0, 1]"
+                            .format(time_fraction))
+        return super(Fidelity, cls).__new__(cls, float(time_fraction),
+                                            timestep_factor)
+
+
+FULL_FIDELITY = Fidelity()
 
 
 class Setup(object):
@@ -42,11 +78,12 @@ class Setup(object):
     """
 
     def __init__(self, record_time, conditions, record_variables,
-                 var_request_refs):
+                 var_request_refs, timestep_factor=1):
         self.record_time = record_time
         self.conditions = conditions
         self.record_variables = record_variables
         self.var_request_refs = var_request_refs
+        self.timestep_factor = timestep_factor
 
 
 class ExperimentalConditions(object):
@@ -65,7 +102,8 @@ class ExperimentalConditions(object):
         self.clamps = set(clamps)
 
     def __eq__(self, other):
-        return (self.initial_v == other.initial_v and
+        return (isinstance(other, ExperimentalConditions) and
+                self.initial_v == other.initial_v and
                 self.clamps == other.clamps)
 
 
@@ -76,10 +114,118 @@ class StepCurrentSource(object):
         self.times = times
 
     def __eq__(self, other):
-        return (self.amplitudes == other.amplitudes and
+        return (isinstance(other, StepCurrentSource) and
+                self.amplitudes == other.amplitudes and
                 self.times == other.times)
 
 
+class ProtocolConcatenator(object):
+    """
+    Plans simulation setups so that setups with compatible protocols (current
+    steps from the same initial conditions) are run one after the other in a
+    single, longer simulation, separated by recovery periods in which no
+    current is injected. Each request is then handed back its own window of
+    the recording, shifted back to the times it requested. This replaces the
+    initialisation and run of a simulation per protocol with a single one
+    (eg. for F-I curves), at the cost of the later protocols starting from
+    the state reached at the end of the preceding recovery period rather
+    than the initial state, so the recovery time should be long enough for
+    the cell to return to rest
+    """
+
+    def __init__(self, recovery_time=500.0 * pq.ms):
+        """
+        `recovery_time` -- the time between the end of one protocol and the
+                           start of the next [pq.Quantity(time)]
+        """
+        self.recovery_time = pq.Quantity(recovery_time, 'ms')
+
+    def plan(self, setups):
+        """
+        Returns the planned setups, in which compatible setups have been
+        concatenated
+
+        `setups` -- the setups of the distinct experimental conditions
+                    [list(Setup)]
+        """
+        planned = []
+        compatible = {}
+        for setup in setups:
+            key = self._compatibility_key(setup.conditions)
+            if key is None:
+                planned.append(setup)
+            else:
+                compatible.setdefault(key, []).append(setup)
+        for group in compatible.itervalues():
+            if len(group) > 1:
+                planned.append(self._concatenate(group))
+            else:
+                planned.extend(group)
+        return planned
+
+    @classmethod
+    def _compatibility_key(cls, conditions):
+        """
+        Returns a key that is shared by the conditions whose protocols can be
+        concatenated, or None if the conditions can't be concatenated (i.e.
+        they contain clamps other than a single step current source)
+        """
+        if conditions is None:
+            return (None,)
+        if (len(conditions.clamps) > 1 or
+            any(not isinstance(c, StepCurrentSource)
+                for c in conditions.clamps)):
+            return None
+        initial_v = conditions.initial_v
+        if initial_v is not None:
+            initial_v = float(pq.Quantity(initial_v, 'mV'))
+        return (initial_v,)
+
+    def _concatenate(self, setups):
+        """
+        Concatenates the setups into a single setup with the step current
+        sources shifted to the start of each protocol and the request
+        references offset accordingly
+        """
+        amplitudes = []
+        times = []
+        record_variables = []
+        var_request_refs = []
+        offset = 0.0 * pq.ms
+        for setup in setups:
+            record_time = pq.Quantity(setup.record_time, 'ms')
+            if setup.conditions is not None and setup.conditions.clamps:
+                source = next(iter(setup.conditions.clamps))
+                amplitudes.extend(source.amplitudes)
+                times.extend(pq.Quantity(t, 'ms') + offset
+                             for t in source.times)
+            else:
+                amplitudes.append(0.0)
+                times.append(offset)
+            for var, refs in zip(setup.record_variables,
+                                 setup.var_request_refs):
+                try:
+                    var_refs = var_request_refs[record_variables.index(var)]
+                except ValueError:
+                    record_variables.append(var)
+                    var_refs = []
+                    var_request_refs.append(var_refs)
+                var_refs.extend(ref._replace(time_offset=(
+                                  pq.Quantity(ref.time_offset, 'ms') + offset))
+                                for ref in refs)
+            # Stop injecting current while the cell recovers
+            amplitudes.append(0.0)
+            times.append(offset + record_time)
+            offset = offset + record_time + self.recovery_time
+        initial_v = next((s.conditions.initial_v for s in setups
+                          if s.conditions is not None), None)
+        conditions = ExperimentalConditions(
+                              initial_v=initial_v,
+                              clamps=[StepCurrentSource(amplitudes, times)])
+        return Setup(offset - self.recovery_time, conditions,
+                     record_variables, var_request_refs)
+
+
 class Simulation():
     "Base class of Simulation objects"
 
@@ -88,6 +234,10 @@ class Simulation():
 
     supported_clamp_types = []
 
+    # An optional planner (eg. ProtocolConcatenator) that rearranges the
+    # setups after the requests have been grouped by experimental conditions
+    protocol_planner = None
+
     def _process_requests(self, recording_requests):
         """
         Merge recording requests so that the same recording/simulation doesn't
@@ -106,6 +256,7 @@ class Simulation():
                                     key=lambda x: x[1].conditions)
         # Merge the common requests into simulation setups
         self._simulation_setups = []
+        self._reduced_setups = {}
         for conditions, requests_iter in common_conditions:
             if conditions is not None:
                 for c in conditions.clamps:
@@ -132,6 +283,9 @@ class Simulation():
             self._simulation_setups.append(Setup(record_time, conditions,
                                                  list(record_variables),
                                                  req_refs))
+        if self.protocol_planner is not None:
+            self._simulation_setups = self.protocol_planner.plan(
+                                                      self._simulation_setups)
         # Do initial preparation for simulation (how much preparation can be
         # done depends on whether the same experimental conditions are used
         # throughout the evaluation process.
@@ -145,6 +299,44 @@ class Simulation():
             raise Exception("Simulations have not been requested by objective "
                             "function yet")
 
+    def setups_at(self, fidelity=None):
+        """
+        Returns the simulation setups at the given fidelity, in which the
+        requested recording windows are truncated to the fraction of them
+        that is simulated
+
+        `fidelity` -- the fidelity of the simulations, full fidelity if None
+                      [Fidelity]
+        """
+        if fidelity is None or fidelity == FULL_FIDELITY:
+            return self.setups
+        try:
+            return self._reduced_setups[fidelity]
+        except KeyError:
+            pass
+        reduced_setups = []
+        for setup in self.setups:
+            var_request_refs = [
+                [ref._replace(time_stop=(ref.time_start +
+                                         fidelity.time_fraction *
+                                         (ref.time_stop - ref.time_start)))
+                 for ref in request_refs]
+                for request_refs in setup.var_request_refs]
+            record_time = max(float(pq.Quantity(ref.time_offset, 'ms')) +
+                              float(pq.Quantity(ref.time_stop, 'ms'))
+                              for request_refs in var_request_refs
+                              for ref in request_refs)
+            record_time = min(record_time,
+                              float(pq.Quantity(setup.record_time, 'ms')))
+            reduced_setups.append(Setup(record_time * pq.ms, setup.conditions,
+                                        setup.record_variables,
+                                        var_request_refs,
+                                        timestep_factor=(
+                                            setup.timestep_factor *
+                                            fidelity.timestep_factor)))
+        self._reduced_setups[fidelity] = reduced_setups
+        return reduced_setups
+
     def _get_requested_recordings(self, candidate):
         """
         Return the recordings in a dictionary to be returned to the objective
@@ -179,18 +371,20 @@ class Simulation():
         """
         self.tune_parameters = tune_parameters
 
-    def run_all(self, candidate):
+    def run_all(self, candidate, fidelity=None):
         """
         Runs all simulations reuquired by the requested simulation setups
 
         `candidate`         -- a list of parameters [list(float)]
+        `fidelity`          -- the fidelity of the simulations, full fidelity
+                               if None [Fidelity]
         """
         recordings_name = ','.join(['{}={}'.format(p.name, c)
                                     for p, c in zip(self.tune_parameters,
                                                     candidate)])
         recordings = neo.Block(name=recordings_name,
                                candidate=candidate)
-        for setup in self.setups:
+        for setup in self.setups_at(fidelity):
             recordings.segments.append(self.run(candidate, setup))
         return recordings
 
@@ -1,18 +1,26 @@
 from __future__ import absolute_import
 import quantities as pq
 import neo.core
+from neuron import h
 from nineline.cells.neuron import NineCellMetaClass, \
                                   simulation_controller as nineline_controller
-from .__init__ import Simulation
+from .__init__ import Simulation, StepCurrentSource
 
 
 class NineLineSimulation(Simulation):
     "A simulation class for 9ml descriptions"
 
-    def __init__(self, cell_9ml, build_mode='lazy'):
+    supported_clamp_types = [StepCurrentSource]
+
+    def __init__(self, cell_9ml, build_mode='lazy', timestep=None):
         """
         `cell_9ml`    -- A 9ml file [str]
+        `timestep`    -- the simulation timestep (in ms), which is required to
+                         run the reduced fidelity simulations with coarser
+                         timesteps. The default timestep of the simulation
+                         controller is used if None [float]
         """
+        self.timestep = timestep
         # Generate the NineLine class from the nineml file and initialise a
         # single cell from it
         self.cell_9ml = cell_9ml
@@ -84,7 +92,17 @@ class NineLineSimulation(Simulation):
         # Convert requested record time to ms
         record_time = float(pq.Quantity(setup.record_time, units='ms'))
         # Run simulation
-        nineline_controller.run(record_time)
+        if setup.timestep_factor != 1:
+            if self.timestep is None:
+                raise Exception("The timestep needs to be provided to "
+                                "NineLineSimulation to run simulations with "
+                                "coarser timesteps")
+            nineline_controller.run(record_time, timestep=(
+                                    self.timestep * setup.timestep_factor))
+        elif self.timestep is not None:
+            nineline_controller.run(record_time, timestep=self.timestep)
+        else:
+            nineline_controller.run(record_time)
         # Return neo Segment object with all recordings
         seg = neo.core.Segment()
         recordings = self.cell.get_recording(*zip(*setup.record_variables))
@@ -108,6 +126,30 @@ class NineLineSimulation(Simulation):
         self.cell = self.celltype()
         for rec in simulation_setup.record_variables:
             self.cell.record(*rec)
+        # Inject the current clamps into the source section. The clamps are
+        # kept so they (and the vectors played into them) persist until the
+        # cell is prepared again
+        self._clamps = []
+        if simulation_setup.conditions is not None:
+            for clamp in simulation_setup.conditions.clamps:
+                self._clamps.append(self._step_current(clamp))
+
+    def _step_current(self, source):
+        """
+        Injects a step current into the source section of the cell, by playing
+        the amplitudes into an IClamp that is on for the whole simulation
+
+        `source` -- the step current source [StepCurrentSource]
+        """
+        iclamp = h.IClamp(0.5, sec=self.cell.source_section)
+        iclamp.delay = 0.0
+        iclamp.dur = 1e9
+        amplitudes = h.Vector([float(pq.Quantity(a, 'nA'))
+                               for a in source.amplitudes])
+        times = h.Vector([float(pq.Quantity(t, 'ms')) for t in source.times])
+        # Played without interpolation so the amplitude steps at each time
+        amplitudes.play(iclamp._ref_amp, times, 0)
+        return iclamp, amplitudes, times
 
     def _set_candidate_params(self, candidate):
         """
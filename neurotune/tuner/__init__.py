@@ -3,6 +3,8 @@ import os
 import collections
 import traceback
 import cPickle as pkl
+from cStringIO import StringIO
+import numpy
 import neo.io
 from ..analysis import Analysis
 
@@ -26,8 +28,11 @@ class EvaluationException(Exception):
                 .format(self.candidate, self.traceback))
 
     def save(self, filename):
-        with open(filename, 'w') as f:
-            pkl.dump((self.objective, self.candidate, self.analysis), f)
+        # The analysis is pickled in its compact binary encoding so a binary
+        # pickle protocol is used to avoid escaping it
+        with open(filename, 'wb') as f:
+            pkl.dump((self.objective, self.candidate, self.analysis), f,
+                     pkl.HIGHEST_PROTOCOL)
         print ("Saving failed candidate along with objective and analysis "
                "to file at '{}'".format(filename))
 
@@ -126,7 +131,8 @@ class Tuner(object):
         """
         return self.algorithm.optimize(self._evaluator, **kwargs)
 
-    def _evaluator(self, candidates, args=None):  # @UnusedVariable
+    def _evaluator(self, candidates, args=None,  # @UnusedVariable
+                   fidelity=None, cutoffs=None):
         """
         Evaluate each candidate and return the evaluations in a numpy array. To
         be passed to inspyred optimisation algorithm (overridden in MPI derived
@@ -135,17 +141,26 @@ class Tuner(object):
         `candidates` -- a list of candidates (themselves an iterable of float
                         parameters) [list(list(float))]
         `args`       -- unused but provided to match inspyred API
+        `fidelity`   -- the fidelity the candidates are simulated at, full
+                        fidelity if None [simulation.Fidelity]
+        `cutoffs`    -- for each candidate, the value above which the exact
+                        fitness isn't required and a lower bound on it can be
+                        returned instead, if the objective accepts a cutoff
+                        [list(float)]
         """
-        return [self._evaluate_candidate(c) for c in candidates]
+        if cutoffs is None:
+            cutoffs = [None] * len(candidates)
+        return [self._evaluate_candidate(c, fidelity, cutoff)
+                for c, cutoff in zip(candidates, cutoffs)]
 
-    def _evaluate_candidate(self, candidate):
+    def _evaluate_candidate(self, candidate, fidelity=None, cutoff=None):
         """
         Evaluate the fitness of a single candidate
         """
         if self.verbose:
             print "Evaluating candidate {}".format(candidate)
         try:
-            recordings = self.simulation.run_all(candidate)
+            recordings = self.simulation.run_all(candidate, fidelity)
             if self.save_recordings:
                 fname = (self.save_recordings.prefix +
                          ','.join(['{}={}'.format(p.name, c)
@@ -156,8 +171,15 @@ class Tuner(object):
                 if os.path.exists(fpath):
                     os.remove(fpath)
                 self.save_recordings.io(fpath).write(recordings)
-            analysis = Analysis(recordings, self.simulation.setups)
-            fitness = self.objective.fitness(analysis)
+            analysis = Analysis(recordings,
+                                self.simulation.setups_at(fidelity))
+            # The objective compares the simulated fraction of its window
+            # against the same fraction of the reference
+            objective = self.objective.at_fidelity(fidelity)
+            if cutoff is not None and objective.accepts_cutoff:
+                fitness = objective.fitness(analysis, cutoff=cutoff)
+            else:
+                fitness = objective.fitness(analysis)
         except BadCandidateException:
             print ("WARNING! Candidate {} caused a BadCandidateException. "
                    "This typically means there was an instability in the "
@@ -173,7 +195,9 @@ class Tuner(object):
             if self.num_processes == 1 and __debug__:
                 raise
             else:
-                raise EvaluationException(self.objective, candidate,
+                raise EvaluationException(locals().get('objective',
+                                                       self.objective),
+                                          candidate,
                                           locals().get('analysis', None))
         return fitness
 
@@ -183,3 +207,83 @@ class Tuner(object):
         Provided for convenient interoperability with the MPITuner class
         """
         return True
+
+    @classmethod
+    def broadcast_setup(cls, build, **kwargs):  # @UnusedVariable
+        """
+        Provided for convenient interoperability with the MPITuner class,
+        where the (expensive) setup is only built on the master node and then
+        broadcast to the other nodes
+
+        `build` -- a function that takes no arguments and returns the
+                   objective (or any other picklable setup) [function]
+        """
+        return build()
+
+    @classmethod
+    def release_setup(cls):
+        """
+        Provided for convenient interoperability with the MPITuner class,
+        where the memory shared between the nodes by broadcast_setup is freed
+        """
+        pass
+
+
+# The minimum size (in bytes) of the arrays that are separated from the pickle
+# by dumps_out_of_band
+MIN_OUT_OF_BAND_SIZE = 2 ** 16
+
+
+def dumps_out_of_band(obj, arrays, min_size=MIN_OUT_OF_BAND_SIZE):
+    """
+    Pickles an object, separating out the data of any large numpy arrays
+    within it so they can be transferred as raw buffers. Array subclasses
+    (e.g. quantities and neo signals) are reconstructed from a view of the
+    buffer and their instance dictionary
+
+    `obj`      -- the object to pickle
+    `arrays`   -- a list to which the contiguous arrays holding the data are
+                  appended [list(numpy.ndarray)]
+    `min_size` -- the minimum size (in bytes) of the arrays to separate [int]
+    """
+    indices = {}
+
+    def persistent_id(o):
+        if (not isinstance(o, numpy.ndarray) or o.nbytes < min_size or
+                o.dtype.hasobject):
+            return None
+        try:
+            index = indices[id(o)]
+        except KeyError:
+            index = indices[id(o)] = len(arrays)
+            arrays.append(numpy.ascontiguousarray(o.view(numpy.ndarray)))
+        # Memory maps are loaded as plain arrays as their instance dictionary
+        # holds the open file
+        if type(o) is numpy.ndarray or isinstance(o, numpy.memmap):
+            return (index, None, None)
+        return (index, type(o), o.__dict__)
+    f = StringIO()
+    pickler = pkl.Pickler(f, pkl.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(obj)
+    return f.getvalue()
+
+
+def loads_out_of_band(payload, arrays):
+    """
+    Unpickles an object pickled with dumps_out_of_band given the arrays
+    holding the separated data (which can be views of shared memory)
+
+    `payload` -- the pickled object [str]
+    `arrays`  -- the arrays holding the separated data [list(numpy.ndarray)]
+    """
+    def persistent_load(pid):
+        index, array_type, state = pid
+        array = arrays[index]
+        if array_type is not None:
+            array = array.view(array_type)
+            array.__dict__.update(state)
+        return array
+    unpickler = pkl.Unpickler(StringIO(payload))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
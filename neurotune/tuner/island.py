@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+import errno
+import os.path
+from copy import deepcopy
+from itertools import chain
+from mpi4py import MPI
+from .mpi import MPITuner
+
+
+class IslandMPITuner(MPITuner):
+    """
+    A tuner that splits the MPI processes into islands, each of which runs its
+    own population of the (inspyred) algorithm with its own master and slave
+    nodes, so the messaging of each generation stays within the island. The
+    best individuals of each island periodically migrate to the next island
+    (asynchronously) and the final populations are gathered onto the master
+    node of the first island
+    """
+
+    MIGRATION_MSG = 3  # Signifies that the message contains migrants
+
+    def set(self, *args, **kwargs):
+        """
+        `num_islands`        -- the number of islands the processes are split
+                                into [int]
+        `migration_interval` -- the number of generations between migrations
+                                [int]
+        `num_migrants`       -- the number of best individuals that migrate
+                                each time [int]
+        """
+        num_islands = kwargs.pop('num_islands', 2)
+        migration_interval = kwargs.pop('migration_interval', 5)
+        num_migrants = kwargs.pop('num_migrants', 1)
+        world = MPITuner.comm
+        if num_islands > MPITuner.num_processes:
+            raise Exception("Number of islands ({}) cannot be greater than "
+                            "the number of processes ({})"
+                            .format(num_islands, MPITuner.num_processes))
+        # Split the processes into contiguous blocks
+        self.num_islands = num_islands
+        self.island = MPITuner.rank * num_islands // MPITuner.num_processes
+        self.comm = world.Split(self.island, key=MPITuner.rank)
+        self.rank = self.comm.Get_rank()
+        self.num_processes = self.comm.Get_size()
+        # The masters of the islands communicate with each other to migrate
+        # individuals
+        self.migration_comm = world.Split(
+            0 if self._is_local_master() else MPI.UNDEFINED, key=self.island)
+        super(IslandMPITuner, self).set(*args, **kwargs)
+        algorithm = self.algorithm
+        if not hasattr(algorithm, 'ea_attributes'):
+            raise Exception("Island tuning requires an inspyred algorithm "
+                            "('{}' provided)"
+                            .format(algorithm.__class__.__name__))
+        # Give each island its own random sequence and output directory
+        algorithm.jump_random_state(self.island)
+        algorithm.output_dir = self._island_dir(algorithm.output_dir)
+        if self._is_local_master():
+            self.migrator = MPIMigrator(self.migration_comm,
+                                        migration_interval, num_migrants,
+                                        tag=self.MIGRATION_MSG)
+            algorithm.ea_attributes['migrator'] = self.migrator
+
+    def tune(self, **kwargs):
+        """
+        Runs the algorithm on each island and returns the final populations of
+        all the islands (sorted from best to worst) and the evolutionary
+        computation of the first island on the master node
+        """
+        if 'output_dir' in kwargs:
+            kwargs['output_dir'] = self._island_dir(kwargs['output_dir'])
+        pop, ea = super(IslandMPITuner, self).tune(**kwargs)
+        if not self._is_local_master():
+            return (None, None)
+        self.migrator.finish()
+        populations = self.migration_comm.gather(pop, root=0)
+        if self.island:
+            return (None, None)
+        return (sorted(chain.from_iterable(populations), reverse=True), ea)
+
+    def _island_dir(self, output_dir):
+        island_dir = os.path.join(output_dir, 'island{}'.format(self.island))
+        # Every process of the island creates the directory concurrently
+        try:
+            os.makedirs(island_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        return island_dir
+
+
+class MPIMigrator(object):
+    """
+    An inspyred migrator that sends copies of the best individuals of the
+    population to the next island every migration_interval generations
+    without waiting for them to be received, and replaces the worst
+    individuals of the population with any migrants that have arrived from
+    the previous island
+    """
+
+    def __init__(self, comm, migration_interval=5, num_migrants=1, tag=3):
+        """
+        `comm`               -- the communicator between the masters of the
+                                islands [mpi4py.MPI.Comm]
+        `migration_interval` -- the number of generations between migrations
+                                [int]
+        `num_migrants`       -- the number of best individuals that migrate
+                                each time [int]
+        `tag`                -- the tag of the migration messages [int]
+        """
+        self.comm = comm
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+        self.tag = tag
+        self.destination = (comm.Get_rank() + 1) % comm.Get_size()
+        self.num_generations = 0
+        self.num_sent = 0
+        self.num_received = 0
+        self._requests = []
+        self.__name__ = self.__class__.__name__
+
+    def __call__(self, random, population, args):  # @UnusedVariable
+        self.num_generations += 1
+        if self.comm.Get_size() == 1:
+            return population
+        if not self.num_generations % self.migration_interval:
+            migrants = deepcopy(sorted(population,
+                                       reverse=True)[:self.num_migrants])
+            self._requests.append(self.comm.isend(migrants,
+                                                  dest=self.destination,
+                                                  tag=self.tag))
+            self.num_sent += 1
+        # Free the requests of the migrants that have been received
+        self._requests = [r for r in self._requests if not r.Test()]
+        immigrants = []
+        while self.comm.Iprobe(source=MPI.ANY_SOURCE, tag=self.tag):
+            immigrants.extend(self.comm.recv(source=MPI.ANY_SOURCE,
+                                             tag=self.tag))
+            self.num_received += 1
+        if immigrants:
+            immigrants = sorted(immigrants, reverse=True)[:len(population)]
+            population = sorted(population)
+            population[:len(immigrants)] = immigrants
+        return population
+
+    def finish(self):
+        """
+        Receives (and discards) the migrants that are still in flight once the
+        evolution has finished and waits for all the migrants sent to be
+        received, so no messages are left pending
+        """
+        num_sent = self.comm.allgather(self.num_sent)
+        expected = num_sent[(self.comm.Get_rank() - 1) % self.comm.Get_size()]
+        while self.num_received < expected:
+            self.comm.recv(source=MPI.ANY_SOURCE, tag=self.tag)
+            self.num_received += 1
+        MPI.Request.Waitall(self._requests)
+        self._requests = []
@@ -1,9 +1,11 @@
 from __future__ import absolute_import
-import sys
+import cPickle as pkl
 from collections import deque
 from itertools import chain
+import numpy
 from mpi4py import MPI
-from . import Tuner, EvaluationException
+from . import (Tuner, EvaluationException, dumps_out_of_band,
+               loads_out_of_band)
 
 
 class MPITuner(Tuner):
@@ -17,10 +19,26 @@ class MPITuner(Tuner):
     COMMAND_MSG = 1  # Signifies that the message is a command to a slave node
     DATA_MSG = 2  # Signifies that the message is data returned by a slave node
     ANY_SOURCE = MPI.ANY_SOURCE
+    # The maximum size (in bytes) of the pickled analysis passed back to the
+    # master with an evaluation exception
+    MAX_EXCEPTION_ANALYSIS_SIZE = 2 ** 24
+
+    # The alignment (in bytes) of the arrays placed in the shared memory
+    # windows by broadcast_setup
+    SHARED_ALIGNMENT = 64
+    # The maximum number of bytes broadcast in a single message (MPI counts
+    # are 32-bit integers)
+    MAX_MESSAGE_SIZE = 2 ** 30
+    # The ways the grid can be split between the processes when the
+    # algorithm's work is known in advance (see _tune_static)
+    STATIC_PARTITIONS = ('strided', 'contiguous')
 
     comm = MPI.COMM_WORLD  # The MPI communicator object
     rank = comm.Get_rank()  # The ID of the current process
     num_processes = comm.Get_size()  # The number of processes available
+    # The shared memory windows holding the broadcast setups, which need to
+    # be kept alive as long as the arrays that are views of them
+    _shared_windows = []
 
     def set(self, *args, **kwargs):
         if self.num_processes == 1:
@@ -29,6 +47,13 @@ class MPITuner(Tuner):
             self.evaluate_on_master = kwargs.pop('evaluate_on_master',
                                                  self.num_processes < 10)
         self.mpi_verbose = kwargs.pop('verbose', True)
+        self.static_partition = kwargs.pop('static_partition', None)
+        if (self.static_partition is not None and
+                self.static_partition not in self.STATIC_PARTITIONS):
+            raise Exception("Unrecognised static partition '{}', can be one "
+                            "of '{}'".format(self.static_partition,
+                                             "', '".join(
+                                                 self.STATIC_PARTITIONS)))
         super(MPITuner, self).set(*args, **kwargs)
 
     @classmethod
@@ -38,6 +63,123 @@ class MPITuner(Tuner):
         """
         return cls.rank == cls.MASTER
 
+    def _is_local_master(self):
+        """
+        Checks if the current processing node is the master of the nodes the
+        tuner's communicator spans (all of them unless it has been split by a
+        subclass)
+        """
+        return self.rank == self.MASTER
+
+    @classmethod
+    def broadcast_setup(cls, build, shared_memory=True):
+        """
+        Builds the setup (typically the objective, including its reference
+        signals and preprocessed artifacts) on the master node only and
+        broadcasts it to the other nodes. The data of the large arrays within
+        the setup is broadcast as raw buffers and, if 'shared_memory' is set,
+        placed in MPI-3 shared memory windows that are shared (read-only)
+        between the processes on the same node instead of being copied into
+        each of them
+
+        `build`         -- a function that takes no arguments and returns the
+                           objective (or any other picklable setup) [function]
+        `shared_memory` -- whether the arrays are shared between processes on
+                           the same node [bool]
+        """
+        if cls.is_master():
+            arrays = []
+            payload = dumps_out_of_band(build(), arrays)
+            layout = [(a.dtype.str, a.shape) for a in arrays]
+        else:
+            arrays = None
+            payload = layout = None
+        payload, layout = cls.comm.bcast((payload, layout), root=cls.MASTER)
+        if shared_memory:
+            arrays = cls._broadcast_shared_arrays(arrays, layout)
+        else:
+            if not cls.is_master():
+                arrays = [numpy.empty(shape, dtype=dtype)
+                          for dtype, shape in layout]
+            for array in arrays:
+                cls._bcast_bytes(cls.comm, array.reshape(-1).view(numpy.uint8),
+                                 cls.MASTER)
+        # The master also reloads the setup so that all nodes hold identical
+        # copies (and the master's arrays are shared with its node as well)
+        return loads_out_of_band(payload, arrays)
+
+    @classmethod
+    def release_setup(cls):
+        """
+        Frees the shared memory windows holding the broadcast setups. This is
+        a collective call, which needs to be made on all nodes once tuning has
+        finished (and before MPI is finalized), after which the arrays of the
+        setups can no longer be used
+        """
+        for win in cls._shared_windows:
+            win.Free()
+        del cls._shared_windows[:]
+
+    @classmethod
+    def _broadcast_shared_arrays(cls, arrays, layout):
+        """
+        Broadcasts the arrays to a shared memory window on each node and
+        returns read-only views of them
+
+        `arrays` -- the arrays to broadcast on the master node (ignored on
+                    the other nodes) [list(numpy.ndarray)]
+        `layout` -- the dtype and shape of each array [list((str, tuple))]
+        """
+        if not layout:
+            return []
+        # Place the arrays one after another in a single aligned block
+        offsets = []
+        size = 0
+        for dtype, shape in layout:
+            offsets.append(size)
+            nbytes = numpy.dtype(dtype).itemsize * int(numpy.prod(shape))
+            size += -(-nbytes // cls.SHARED_ALIGNMENT) * cls.SHARED_ALIGNMENT
+        # Split the processes into those that share memory (ensuring the
+        # master is the first process on its node) and then those that are
+        # the first process on their node
+        key = 0 if cls.is_master() else cls.rank + 1
+        node_comm = cls.comm.Split_type(MPI.COMM_TYPE_SHARED, key=key)
+        is_leader = node_comm.Get_rank() == 0
+        leader_comm = cls.comm.Split(0 if is_leader else MPI.UNDEFINED,
+                                     key=key)
+        win = MPI.Win.Allocate_shared(size if is_leader else 0, 1,
+                                      comm=node_comm)
+        cls._shared_windows.append(win)
+        buf = win.Shared_query(0)[0]
+        block = numpy.ndarray(buffer=buf, dtype=numpy.uint8, shape=(size,))
+        views = []
+        for (dtype, shape), offset in zip(layout, offsets):
+            nbytes = numpy.dtype(dtype).itemsize * int(numpy.prod(shape))
+            views.append(block[offset:offset + nbytes].view(dtype).reshape(
+                                                                      shape))
+        if is_leader:
+            if cls.is_master():
+                for view, array in zip(views, arrays):
+                    view[...] = array
+            # Broadcast the block between the nodes
+            cls._bcast_bytes(leader_comm, block, 0)
+            leader_comm.Free()
+        # Wait for the block to be filled before it is read on the node
+        node_comm.Barrier()
+        node_comm.Free()
+        for view in views:
+            view.flags.writeable = False
+        return views
+
+    @classmethod
+    def _bcast_bytes(cls, comm, data, root):
+        """
+        Broadcasts a byte array in place, split into messages no larger than
+        MAX_MESSAGE_SIZE
+        """
+        for start in xrange(0, len(data), cls.MAX_MESSAGE_SIZE):
+            comm.Bcast(data[start:start + cls.MAX_MESSAGE_SIZE], root=root)
+
     def tune(self, **kwargs):
         """
         Runs the optimisation algorithm and returns the final population and
@@ -53,8 +195,9 @@ class MPITuner(Tuner):
         `kwargs`          -- optional arguments to be passed to the
                              optimisation algorithm
         """
-
-        if self.is_master():
+        if self.static_partition is not None:
+            return self._tune_static()
+        if self._is_local_master():
             try:
                 result = self.algorithm.optimize(self._evaluator, **kwargs)
             finally:
@@ -64,6 +207,90 @@ class MPITuner(Tuner):
             result = (None, None)
         return result
 
+    def _tune_static(self):
+        """
+        Run on all nodes when the work of the algorithm is known in advance
+        (i.e. for grid algorithms), each node evaluates its own fixed
+        partition of the candidates without any messaging with the master,
+        after which the fitnesses are gathered onto the master in a single
+        collective call
+        """
+        if not hasattr(self.algorithm, 'evaluate_partition'):
+            raise Exception("Algorithm '{}' does not support static "
+                            "partitioning of its candidates"
+                            .format(self.algorithm.__class__.__name__))
+        exception = None
+        try:
+            indices, fitnesses = self.algorithm.evaluate_partition(
+                self._evaluate_candidates, self.rank, self.num_processes,
+                contiguous=(self.static_partition == 'contiguous'))
+        except EvaluationException as e:
+            exception = self._exception_message(e)
+        # Gather all bad candidates onto the master node
+        bad_list = self.comm.gather(self.bad_candidates, root=self.MASTER)
+        if self._is_local_master():
+            self.bad_candidates = list(chain.from_iterable(bad_list))
+        # If any of the nodes failed raise the exception on the master
+        if self.comm.allreduce(exception is not None, op=MPI.LOR):
+            exceptions = self.comm.gather(exception, root=self.MASTER)
+            if self._is_local_master():
+                raise EvaluationException(*next(e for e in exceptions
+                                                if e is not None))
+            return (None, None)
+        # Agree on the number of objectives (-1 if no candidates were
+        # evaluated and 0 for a single objective)
+        if len(indices):
+            num_objectives = fitnesses.shape[1] if fitnesses.ndim == 2 else 0
+        else:
+            num_objectives = -1
+        num_objectives = self.comm.allreduce(num_objectives, op=MPI.MAX)
+        width = max(num_objectives, 1)
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        fitnesses = numpy.ascontiguousarray(fitnesses,
+                                            dtype=float).reshape(-1)
+        counts = self.comm.gather(len(indices), root=self.MASTER)
+        if self._is_local_master():
+            displs = [int(d) for d in numpy.cumsum([0] + counts[:-1])]
+            all_indices = numpy.empty(sum(counts), dtype=numpy.int64)
+            all_fitnesses = numpy.empty(sum(counts) * width)
+            indices_buf = [all_indices, (counts, displs), MPI.INT64_T]
+            fitnesses_buf = [all_fitnesses,
+                             ([c * width for c in counts],
+                              [d * width for d in displs]), MPI.DOUBLE]
+        else:
+            indices_buf = fitnesses_buf = None
+        self.comm.Gatherv(indices, indices_buf, root=self.MASTER)
+        self.comm.Gatherv(fitnesses, fitnesses_buf, root=self.MASTER)
+        if not self._is_local_master():
+            return (None, None)
+        if num_objectives > 0:
+            all_fitnesses = all_fitnesses.reshape((-1, num_objectives))
+        return self.algorithm.assemble_partitions(all_indices, all_fitnesses)
+
+    def _evaluate_candidates(self, candidates):
+        """
+        Evaluates a list of candidates on the current node
+        """
+        evaluations = []
+        for candidate in candidates:
+            if self.mpi_verbose:
+                print ("Evaluating candidate: {} on process {}"
+                       .format(candidate, self.rank))
+            evaluations.append(self._evaluate_candidate(candidate))
+        return evaluations
+
+    def _exception_message(self, e):
+        """
+        Converts an evaluation exception into a tuple that can be passed back
+        to the master over MPI
+        """
+        # Check to see that the size of the (compactly encoded) analysis isn't
+        # very large before attempting to pass it back over MPI
+        if (len(pkl.dumps(e.analysis, pkl.HIGHEST_PROTOCOL)) >
+                self.MAX_EXCEPTION_ANALYSIS_SIZE):
+            e.analysis = 'Too large to pass over MPI'
+        return (e.objective, e.candidate, e.analysis, e.traceback)
+
     def __del__(self):
         """
         Calls MPI finalize, so care should be taken not to let MPITuner objects
@@ -73,7 +300,8 @@ class MPITuner(Tuner):
         """
         MPI.Finalize()
 
-    def _evaluator(self, candidates, args=None):  # @UnusedVariable
+    def _evaluator(self, candidates, args=None,  # @UnusedVariable
+                   fidelity=None, cutoffs=None):
         """
         Run on the master node, this method distributes candidates to to the
         slave nodes to be evaluated then collates their results into a single
@@ -82,10 +310,19 @@ class MPITuner(Tuner):
         `candidates`  -- candidates to be evaluated
         `args`        -- unused but supplied for compatibility with inspyred
                          library
+        `fidelity`    -- the fidelity the candidates are simulated at, full
+                         fidelity if None [simulation.Fidelity]
+        `cutoffs`     -- the cutoff passed with each candidate (see
+                         Tuner._evaluator) [list(float)]
         """
-        assert self.is_master(), "Distribution of candidate jobs should only "\
-                                 "be performed by master node"
-        candidate_jobs = list(enumerate(candidates))
+        assert self._is_local_master(), ("Distribution of candidate jobs "
+                                         "should only be performed by master "
+                                         "node")
+        if cutoffs is None:
+            cutoffs = [None] * len(candidates)
+        candidate_jobs = [(jobID, candidate, fidelity, cutoff)
+                          for jobID, (candidate, cutoff) in enumerate(
+                                                  zip(candidates, cutoffs))]
         free_processes = (deque(xrange(1, self.num_processes))
                           if self.num_processes > 1 else [0])
         # Create a list of None values the same length as the candidate list
@@ -111,11 +348,12 @@ class MPITuner(Tuner):
                 # master node and if it equals the number of processes evaluate
                 # another candidate on the master node
                 if self.evaluate_on_master and until_master_eval == 0:
-                    jobID, candidate = candidate_jobs.pop()
+                    jobID, candidate, fidelity, cutoff = candidate_jobs.pop()
                     if self.mpi_verbose:
                         print ("Evaluating jobID: {}, candidate: {} on Process"
                                " {}".format(jobID, candidate, self.rank))
-                    evaluations[jobID] = self._evaluate_candidate(candidate)
+                    evaluations[jobID] = self._evaluate_candidate(
+                                                   candidate, fidelity, cutoff)
                     remaining_evaluations -= 1
                     until_master_eval = self.num_processes - 1
             # Once all slave processes are busy wait for them to finish and
@@ -139,25 +377,22 @@ class MPITuner(Tuner):
         Run on the slave nodes, this method receives candidates to evaluate
         from the master node, evaluates them and sends back the master
         """
-        assert not self.is_master(), "Evaluation of candidates should only be"\
-                                     " performed by slave nodes"
+        assert not self._is_local_master(), ("Evaluation of candidates should "
+                                             "only be performed by slave "
+                                             "nodes")
         command = self.comm.recv(source=self.MASTER, tag=self.COMMAND_MSG)
         while command != 'stop':
-            jobID, candidate = command
+            jobID, candidate, fidelity, cutoff = command
             if self.mpi_verbose:
                 print ("Evaluating jobID: {}, candidate: {} on process {}"
                        .format(jobID, candidate, self.rank))
             try:
-                evaluation = self._evaluate_candidate(candidate)
+                evaluation = self._evaluate_candidate(candidate, fidelity,
+                                                      cutoff)
             except EvaluationException as e:
-                # Check to see that the size of the recordings isn't very large
-                # before attempting to pass it back over MPI
-                if sys.getsizeof(e.analysis) > 100000:
-                    e.analysis = 'Too large to pass over MPI'
                 # This will tell the master node to raise an
                 # EvaluationException and release all slaves
-                self.comm.send((e.objective, e.candidate, e.analysis,
-                                e.traceback),
+                self.comm.send(self._exception_message(e),
                                dest=self.MASTER, tag=self.DATA_MSG)
                 break
             self.comm.send((self.rank, jobID, evaluation),
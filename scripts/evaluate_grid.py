@@ -23,8 +23,10 @@ from neurotune.simulation.nineline import NineLineSimulation
 from neurotune.analysis import AnalysedSignal
 try:
     from neurotune.tuner.mpi import MPITuner as Tuner
+    mpi_available = True
 except ImportError:
     from neurotune.tuner import Tuner  # @Reimport
+    mpi_available = False
 
 parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument('cell_9ml', type=str,
@@ -55,6 +57,11 @@ parser.add_argument('--plot_saved', nargs='*', default=[],
                     help="Plot a file that has been saved to file already")
 parser.add_argument('--verbose', action='store_true', default=False,
                     help="Print out which candidates are being evaluated")
+parser.add_argument('--static_partition', type=str, default=None,
+                    choices=('strided', 'contiguous'),
+                    help="Split the grid between the MPI processes in advance "
+                         "instead of distributing the candidates from the "
+                         "master process one at a time")
 parser.add_argument('--save_recordings', type=outputpath, default=None,
                     metavar='DIRECTORY',
                     help="Save recordings to file")
@@ -68,7 +75,7 @@ objective_names = ['Phase-plane Histogram', 'Phase-plane Pointwise',
                    'Spike Frequency', 'Spike Times']
 
 
-def run(parameters, args):
+def _get_objective(args):
     # Generate the reference trace from the original class
     cell = NineCellMetaClass(args.cell_9ml)()
     cell.record('v')
@@ -77,20 +84,29 @@ def run(parameters, args):
     reference = AnalysedSignal(cell.get_recording('v'))
     sliced_reference = reference.slice(500 * pq.ms, 2000 * pq.ms)
     # Instantiate the multi-objective objective from 3 phase-plane objectives
-    objective = MultiObjective(PhasePlaneHistObjective(reference),
-                               PhasePlanePointwiseObjective(reference, 100,
-                                                            (20, -20)),
-                               SpikeFrequencyObjective(sliced_reference.\
-                                                       spike_frequency()),
-                               SpikeTimesObjective(sliced_reference.\
-                                                   spikes()))
+    return MultiObjective(PhasePlaneHistObjective(reference),
+                          PhasePlanePointwiseObjective(reference, 100,
+                                                       (20, -20)),
+                          SpikeFrequencyObjective(sliced_reference.\
+                                                  spike_frequency()),
+                          SpikeTimesObjective(sliced_reference.spikes()))
+
+
+def run(parameters, args):
+    # Only simulate the reference and build the objective on the master node
+    # and share it with the other nodes
+    objective = Tuner.broadcast_setup(lambda: _get_objective(args))
     # Instantiate the tuner
+    kwargs = {}
+    if args.static_partition:
+        kwargs['static_partition'] = args.static_partition
     tuner = Tuner(parameters,
                   objective,
                   GridAlgorithm(num_steps=[p[3] for p in args.parameter]),
                   NineLineSimulation(args.cell_9ml),
                   verbose=args.verbose,
-                  save_recordings=args.save_recordings)
+                  save_recordings=args.save_recordings,
+                  **kwargs)
     # Run the tuner
     try:
         pop, grid = tuner.tune()
@@ -98,6 +114,9 @@ def run(parameters, args):
         e.save(os.path.join(os.path.dirname(args.output),
                             'evaluation_exception.pkl'))
         raise
+    finally:
+        # The objective isn't needed once the tuning has finished
+        Tuner.release_setup()
     # Save the file if the tuner is the master
     if tuner.is_master():
         print "Fittest candidate {}".format(pop)
@@ -213,6 +232,9 @@ if __name__ == '__main__':
     if not args.parameter:
         raise Exception("At least one parameter argument '--parameter' needs "
                         "to be supplied")
+    if args.static_partition and not mpi_available:
+        raise Exception("'--static_partition' requires the MPI tuner, which "
+                        "could not be imported (is mpi4py installed?)")
     parameters = [Parameter(name, 'S/cm^2', lbound, ubound, False)
                   for name, lbound, ubound, _, log_scale in args.parameter]
     if args.plot_saved:
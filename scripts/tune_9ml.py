@@ -181,7 +181,9 @@ def run(args):
     # Instantiate the tuner
     parameters = _get_parameters(args)
     algorithm = _get_algorithm(args)
-    objective = _get_objective(args)
+    # Only simulate the reference and build the objective on the master node
+    # and share it with the other nodes
+    objective = Tuner.broadcast_setup(lambda: _get_objective(args))
     simulation = _get_simulation(args)
     tuner = Tuner(parameters,
                   objective,
@@ -196,6 +198,9 @@ def run(args):
         e.save(os.path.join(os.path.dirname(args.output),
                             'evaluation_exception.pkl'))
         raise
+    finally:
+        # The objective isn't needed once the tuning has finished
+        Tuner.release_setup()
     # Save the file if the tuner is the master
     if tuner.is_master():
         fittest_individual = min(pop, key=lambda c: c.fitness)
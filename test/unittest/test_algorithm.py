@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the algorithms against cheap analytical fitness functions
+"""
+
+# needed for python 3 compatibility
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import numpy
+from neurotune import Parameter
+from neurotune.algorithm import Algorithm
+from neurotune.algorithm.cmaes import CMAESAlgorithm
+from neurotune.algorithm.grid import GridAlgorithm, AdaptiveGridAlgorithm
+from neurotune.algorithm.inspyred import EDAAlgorithm
+from neurotune.algorithm.sampler import QuasiRandomAlgorithm
+from neurotune.algorithm.successive_halving import SuccessiveHalvingAlgorithm
+from neurotune.algorithm.surrogate import SurrogateAssistedAlgorithm
+from neurotune.algorithm.tempering import ParallelTemperingAlgorithm
+from neurotune.simulation import Fidelity
+
+
+def sphere(candidates, centre=0.25):
+    """
+    The squared distance of each candidate from the point with every parameter
+    equal to centre
+    """
+    return numpy.sum((numpy.asarray(candidates) - centre) ** 2, axis=1)
+
+
+class CountingEvaluator(object):
+    """
+    Evaluates the sphere function, counting the candidates it evaluates and
+    optionally failing after a given number of calls to simulate a run being
+    interrupted
+    """
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.num_calls = 0
+        self.evaluated = []
+
+    def __call__(self, candidates):
+        if self.fail_after is not None and self.num_calls >= self.fail_after:
+            raise KeyboardInterrupt
+        self.num_calls += 1
+        self.evaluated.extend(tuple(c) for c in candidates)
+        return sphere(candidates)
+
+
+class TestGridAlgorithm(unittest.TestCase):
+
+    num_parts = 3
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.parameters = [Parameter('p{}'.format(i), 'nA', -1.0, 1.0)
+                           for i in xrange(2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def grid(self):
+        grid = GridAlgorithm(9, chunk_size=4, results_path=os.path.join(
+                                            self.results_dir, 'grid.npy'))
+        grid.set_tune_parameters(self.parameters)
+        return grid
+
+    def test_partition_resume(self):
+        reference = GridAlgorithm(9, chunk_size=4)
+        reference.set_tune_parameters(self.parameters)
+        expected_candidate, expected_grid = reference.optimize(sphere)
+        for contiguous in (False, True):
+            # Each partition is interrupted after its second chunk
+            interrupted = []
+            for part in xrange(self.num_parts):
+                evaluator = CountingEvaluator(fail_after=2)
+                with self.assertRaises(KeyboardInterrupt):
+                    self.grid().evaluate_partition(evaluator, part,
+                                                   self.num_parts, contiguous)
+                interrupted.append(set(evaluator.evaluated))
+            # The chunks completed before the interruption are written to the
+            # files of the partitions
+            self.assertEqual(len(os.listdir(self.results_dir)),
+                             2 * self.num_parts)
+            indices = []
+            fitnesses = []
+            for part in xrange(self.num_parts):
+                evaluator = CountingEvaluator()
+                part_indices, part_fitnesses = self.grid().evaluate_partition(
+                                   evaluator, part, self.num_parts, contiguous)
+                self.assertFalse(interrupted[part] & set(evaluator.evaluated))
+                indices.append(part_indices)
+                fitnesses.append(part_fitnesses)
+            indices = numpy.concatenate(indices)
+            self.assertEqual(sorted(indices), range(81))
+            candidate, grid = self.grid().assemble_partitions(
+                                    indices, numpy.concatenate(fitnesses))
+            self.assertTrue(numpy.array_equal(grid, expected_grid))
+            self.assertTrue(numpy.array_equal(candidate, expected_candidate))
+            # Only the assembled results remain and nothing is reevaluated
+            self.assertEqual(sorted(os.listdir(self.results_dir)),
+                             ['grid.done.npy', 'grid.npy'])
+            evaluator = CountingEvaluator()
+            part_indices, _ = self.grid().evaluate_partition(
+                                  evaluator, 0, self.num_parts, contiguous)
+            self.assertEqual(len(part_indices), 0)
+            self.assertEqual(evaluator.num_calls, 0)
+            for path in os.listdir(self.results_dir):
+                os.remove(os.path.join(self.results_dir, path))
+
+
+class TestAdaptiveGridAlgorithm(unittest.TestCase):
+
+    def test_refinement(self):
+        # A non-square grid with the minimum of the sphere between the points
+        # of the coarse lattice along the first dimension
+        num_steps = [17, 9]
+        parameters = [Parameter('p{}'.format(i), 'nA', -1.0, 1.0)
+                      for i in xrange(2)]
+        reference = GridAlgorithm(num_steps)
+        reference.set_tune_parameters(parameters)
+        expected_candidate, expected_grid = reference.optimize(sphere)
+        # Only the cells around the minimum are refined
+        algorithm = AdaptiveGridAlgorithm(num_steps, num_levels=3,
+                                          refine_fraction=0.0, chunk_size=5)
+        algorithm.set_tune_parameters(parameters)
+        evaluator = CountingEvaluator()
+        candidate, grid = algorithm.optimize(evaluator)
+        # Each point is evaluated at most once and only 61 of the 153 are
+        self.assertEqual(len(set(evaluator.evaluated)),
+                         len(evaluator.evaluated))
+        self.assertEqual(algorithm.num_evaluations, len(evaluator.evaluated))
+        self.assertEqual(algorithm.num_evaluations, 61)
+        self.assertTrue(numpy.array_equal(candidate, expected_candidate))
+        self.assertEqual(grid.shape, expected_grid.shape)
+        # The evaluated points keep their exact fitnesses in the grid, in the
+        # same layout as GridAlgorithm
+        all_candidates = GridAlgorithm.grid_candidates(
+                                      numpy.arange(expected_grid.size),
+                                      algorithm._param_ranges(
+                                                   numpy.array(num_steps)))
+        evaluated = set(evaluator.evaluated)
+        indices = [i for i, c in enumerate(all_candidates)
+                   if tuple(c) in evaluated]
+        self.assertEqual(len(indices), algorithm.num_evaluations)
+        self.assertTrue(numpy.array_equal(grid.ravel()[indices],
+                                          expected_grid.ravel()[indices]))
+        self.assertFalse(numpy.isnan(grid).any())
+
+
+class TestQuasiRandomAlgorithm(unittest.TestCase):
+
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+        self.parameters = [Parameter('p{}'.format(i), 'nA', 0.0, 1.0)
+                           for i in xrange(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def test_sobol_stratification(self):
+        num_dims = len(QuasiRandomAlgorithm.SOBOL_DIRECTIONS) + 1
+        for k in xrange(8):
+            points = QuasiRandomAlgorithm.sobol(numpy.arange(2 ** k), num_dims)
+            self.assertTrue(((points >= 0.0) & (points < 1.0)).all())
+            # Every dimension has exactly one point in each of the 2^k
+            # intervals of the unit interval
+            strata = numpy.sort(numpy.floor(points * 2 ** k), axis=0)
+            self.assertTrue((strata ==
+                             numpy.arange(2 ** k)[:, None]).all())
+        # The first two dimensions form a (0, k, 2)-net, with exactly one
+        # point in each of the elementary rectangles of area 2^-k
+        k = 6
+        points = QuasiRandomAlgorithm.sobol(numpy.arange(2 ** k), 2)
+        for a in xrange(k + 1):
+            cells = (numpy.floor(points[:, 0] * 2 ** a) * 2 ** (k - a) +
+                     numpy.floor(points[:, 1] * 2 ** (k - a)))
+            self.assertEqual(len(numpy.unique(cells)), 2 ** k)
+
+    def test_halton_radical_inverse(self):
+        points = QuasiRandomAlgorithm.halton(numpy.arange(6), 2)
+        self.assertTrue(numpy.allclose(points[:, 0],
+                                       [0, 1 / 2, 1 / 4, 3 / 4, 1 / 8, 5 / 8]))
+        self.assertTrue(numpy.allclose(points[:, 1],
+                                       [0, 1 / 3, 2 / 3, 1 / 9, 4 / 9, 7 / 9]))
+        # The digits of each index reflected about the radix point
+        indices = numpy.array([7, 100, 12345])
+        points = QuasiRandomAlgorithm.halton(indices, 4)
+        for dim, base in enumerate((2, 3, 5, 7)):
+            for index, point in zip(indices, points[:, dim]):
+                digits = []
+                while index:
+                    digits.append(index % base)
+                    index //= base
+                self.assertAlmostEqual(
+                    point, sum(d * float(base) ** -(i + 1)
+                               for i, d in enumerate(digits)))
+
+    def test_resume(self):
+        results_path = os.path.join(self.results_dir, 'samples.csv')
+        kwargs = {'method': 'sobol', 'batch_size': 8, 'num_best': 5,
+                  'random_seed': 1, 'randomize': True}
+        algorithm = QuasiRandomAlgorithm(50, **kwargs)
+        algorithm.set_tune_parameters(self.parameters)
+        full = CountingEvaluator()
+        expected_candidates, expected_fitnesses = algorithm.optimize(full)
+        # Interrupt the run after its third batch
+        interrupted = CountingEvaluator(fail_after=3)
+        algorithm = QuasiRandomAlgorithm(50, results_path=results_path,
+                                         **kwargs)
+        algorithm.set_tune_parameters(self.parameters)
+        with self.assertRaises(KeyboardInterrupt):
+            algorithm.optimize(interrupted)
+        table = numpy.loadtxt(results_path, delimiter=',', skiprows=1)
+        self.assertEqual(list(table[:, 0]), range(24))
+        # The resumed run starts from the first sample that wasn't saved
+        resumed = CountingEvaluator()
+        candidates, fitnesses = algorithm.optimize(resumed)
+        self.assertEqual(resumed.evaluated, full.evaluated[24:])
+        table = numpy.loadtxt(results_path, delimiter=',', skiprows=1)
+        self.assertEqual(list(table[:, 0]), range(50))
+        self.assertTrue(numpy.allclose(
+            table[:, 1:4], numpy.array(interrupted.evaluated +
+                                       resumed.evaluated)))
+        self.assertTrue(numpy.allclose(candidates, expected_candidates))
+        self.assertTrue(numpy.allclose(fitnesses, expected_fitnesses))
+
+
+class BatchAlgorithm(Algorithm):
+    """
+    Passes fixed batches of random candidates to the evaluator, recording the
+    fitnesses it is given for each
+    """
+
+    def __init__(self, num_batches, batch_size, random_seed=0):
+        self.num_batches = num_batches
+        self.batch_size = batch_size
+        self.rng = numpy.random.RandomState(random_seed)
+        self.tuner = None
+        self.batches = []
+
+    def optimize(self, evaluator, **kwargs):  # @UnusedVariable
+        for _ in xrange(self.num_batches):
+            candidates = [list(c) for c in self.rng.uniform(
+                                size=(self.batch_size, self.genome_size))]
+            self.batches.append((candidates, list(evaluator(candidates))))
+
+
+class TestSurrogateAssistedAlgorithm(unittest.TestCase):
+
+    def test_screened_ranking(self):
+        bad = BatchAlgorithm.BAD_FITNESS_VALUE
+        simulated = []
+
+        def failing_evaluator(candidates):
+            # The first candidate of each batch fails to simulate and the
+            # second is numerically unstable
+            simulated.extend(tuple(c) for c in candidates)
+            fitnesses = list(sphere(candidates))
+            fitnesses[0] = float('nan')
+            if len(fitnesses) > 1:
+                fitnesses[1] = bad
+            return fitnesses
+
+        algorithm = BatchAlgorithm(10, 12)
+        surrogate = SurrogateAssistedAlgorithm(algorithm, min_training=20)
+        surrogate.set_tune_parameters([Parameter('p{}'.format(i), 'nA',
+                                                 0.0, 1.0)
+                                       for i in xrange(2)])
+        self.assertIsNone(surrogate._model)
+        surrogate.optimize(failing_evaluator)
+        self.assertGreater(surrogate.num_screened, 0)
+        simulated = set(simulated)
+        for candidates, fitnesses in algorithm.batches:
+            is_simulated = numpy.array([tuple(c) in simulated
+                                        for c in candidates])
+            fitnesses = numpy.array(fitnesses)
+            if is_simulated.all():
+                continue
+            valid = is_simulated & ~numpy.isnan(fitnesses) & (fitnesses < bad)
+            # The screened candidates rank no better than any of the
+            # simulated ones but aren't treated as failures
+            screened = fitnesses[~is_simulated]
+            self.assertGreaterEqual(screened.min(), fitnesses[valid].max())
+            self.assertLess(screened.max(), bad)
+
+
+class TestSuccessiveHalvingAlgorithm(unittest.TestCase):
+
+    def test_promotion_ranking(self):
+        fidelities = [Fidelity(0.1, 4), Fidelity(0.5, 2)]
+        evaluated = {}
+
+        def fidelity_evaluator(candidates, fidelity=None):
+            # The reduced fidelities rank the candidates the same as full
+            # fidelity, except that the best candidate fails at full fidelity
+            for c in candidates:
+                evaluated.setdefault(fidelity, []).append(tuple(c))
+            fitnesses = list(sphere(candidates))
+            if fidelity is None:
+                best = numpy.argmin(fitnesses)
+                if fitnesses[best] == min(all_fitnesses):
+                    fitnesses[best] = float('nan')
+            return fitnesses
+
+        algorithm = BatchAlgorithm(1, 20)
+        halving = SuccessiveHalvingAlgorithm(algorithm, fidelities=fidelities,
+                                             promote_fraction=0.5)
+        halving.set_tune_parameters([Parameter('p{}'.format(i), 'nA',
+                                               0.0, 1.0)
+                                     for i in xrange(2)])
+        all_fitnesses = sphere(algorithm.rng.uniform(size=(20, 2)))
+        algorithm.rng.seed(0)
+        halving.optimize(fidelity_evaluator)
+        self.assertEqual(halving.num_evaluations, [20, 10, 5])
+        self.assertEqual(evaluated[fidelities[1]],
+                         [evaluated[fidelities[0]][i] for i in
+                          numpy.argsort(all_fitnesses, kind='mergesort')[:10]])
+        candidates, fitnesses = algorithm.batches[0]
+        fitnesses = numpy.array(fitnesses)
+        full = numpy.array([tuple(c) in evaluated[None] for c in candidates])
+        second = numpy.array([tuple(c) in evaluated[fidelities[1]]
+                              for c in candidates])
+        valid = full & ~numpy.isnan(fitnesses)
+        self.assertEqual(numpy.count_nonzero(valid), 4)
+        self.assertTrue(numpy.allclose(fitnesses[valid],
+                                       all_fitnesses[valid]))
+        # The eliminated candidates are ranked behind the valid fully
+        # evaluated ones, those eliminated at the first rung behind those
+        # eliminated at the second, and in order of fitness within each rung
+        first_eliminated = fitnesses[~second]
+        second_eliminated = fitnesses[second & ~full]
+        self.assertGreater(second_eliminated.min(), fitnesses[valid].max())
+        self.assertGreater(first_eliminated.min(), second_eliminated.max())
+        for eliminated in (~second, second & ~full):
+            order = numpy.argsort(all_fitnesses[eliminated])
+            self.assertTrue((numpy.diff(fitnesses[eliminated][order]) >
+                             0).all())
+            self.assertTrue((fitnesses[eliminated] <
+                             algorithm.BAD_FITNESS_VALUE).all())
+
+
+class TestAskTell(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.parameters = [Parameter('p{}'.format(i), 'nA', 0.0, 1.0)
+                           for i in xrange(4)]
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_cmaes_batches(self):
+        # Asking for each generation in two halves and telling it shuffled
+        # follows the same search as optimize
+        reference = CMAESAlgorithm(max_generations=30, random_seed=1)
+        reference.set_tune_parameters(self.parameters)
+        expected = reference.optimize(sphere)
+        algorithm = CMAESAlgorithm(max_generations=30, random_seed=1)
+        algorithm.set_tune_parameters(self.parameters)
+        rng = numpy.random.RandomState(2)
+        while not algorithm.stop():
+            half = algorithm._lambda // 2
+            candidates = algorithm.ask(half)
+            candidates += algorithm.ask(algorithm._lambda - half)
+            fitnesses = sphere(candidates)
+            order = rng.permutation(len(candidates))
+            for batch in (order[:3], order[3:]):
+                algorithm.tell([candidates[i] for i in batch],
+                               fitnesses[batch])
+        candidate, fitness = algorithm.result()
+        self.assertTrue(numpy.allclose(candidate, expected[0]))
+        self.assertEqual(fitness, expected[1])
+        self.assertTrue(numpy.allclose(algorithm._mean, reference._mean))
+
+    def test_inspyred_batches(self):
+        def run(subdir, ask_tell):
+            output_dir = os.path.join(self.output_dir, subdir)
+            os.mkdir(output_dir)
+            algorithm = EDAAlgorithm(10, output_dir=output_dir,
+                                     max_generations=10, random_seed=1)
+            algorithm.tuner = self
+            algorithm.set_tune_parameters(self.parameters)
+            evaluator = CountingEvaluator()
+            if ask_tell:
+                batch_sizes = []
+
+                def batch_evaluator(candidates):
+                    batch_sizes.append(len(candidates))
+                    return evaluator(candidates)
+                pop, _ = algorithm.optimize_ask_tell(batch_evaluator,
+                                                     num_candidates=4)
+                # The evolve loop isn't spun with empty batches while it
+                # moves on to the next generation
+                self.assertNotIn(0, batch_sizes)
+            else:
+                pop, _ = algorithm.optimize(
+                    lambda candidates, args: evaluator(candidates))
+            return evaluator.evaluated, sorted(i.fitness for i in pop)
+        self.assertEqual(run('ask_tell', True), run('optimize', False))
+
+    def test_inspyred_ask_kwargs(self):
+        # The evolution is only started by ask, so the arguments passed to it
+        # are used even if stop is called first
+        algorithm = EDAAlgorithm(10, output_dir=self.output_dir,
+                                 max_generations=10, random_seed=1)
+        algorithm.tuner = self
+        algorithm.set_tune_parameters(self.parameters)
+        evaluator = CountingEvaluator()
+        self.assertFalse(algorithm.stop())
+        candidates = algorithm.ask(4, max_generations=2)
+        self.assertRaises(Exception, algorithm.ask, 4, max_generations=5)
+        algorithm.tell(candidates, evaluator(candidates))
+        while not algorithm.stop():
+            candidates = algorithm.ask(4)
+            algorithm.tell(candidates, evaluator(candidates))
+        # The initial population and two generations of offspring
+        self.assertEqual(len(evaluator.evaluated), 30)
+
+
+class TestParallelTemperingAlgorithm(unittest.TestCase):
+
+    def setUp(self):
+        self.parameters = [Parameter('p{}'.format(i), 'nA', 0.0, 1.0)
+                           for i in xrange(3)]
+
+    def algorithm(self):
+        algorithm = ParallelTemperingAlgorithm(
+            num_chains=6, min_temperature=1e-4, max_temperature=1.0,
+            max_generations=50, random_seed=1)
+        algorithm.set_tune_parameters(self.parameters)
+        return algorithm
+
+    def test_chains(self):
+        algorithm = self.algorithm()
+        evaluator = CountingEvaluator()
+        candidate, fitness = algorithm.optimize(evaluator)
+        self.assertEqual(algorithm.num_evaluations, 6 * 51)
+        self.assertEqual(len(evaluator.evaluated), 6 * 51)
+        self.assertEqual(fitness, sphere(evaluator.evaluated).min())
+        self.assertEqual(fitness, sphere([candidate])[0])
+        # The fitnesses of the chains stay with their states when they are
+        # exchanged
+        self.assertGreater(algorithm.num_swaps.sum(), 0)
+        self.assertTrue(numpy.allclose(algorithm.fitnesses,
+                                       sphere(algorithm.states)))
+
+    def test_ask_tell(self):
+        expected = self.algorithm().optimize(sphere)
+        algorithm = self.algorithm()
+        rng = numpy.random.RandomState(2)
+        while not algorithm.stop():
+            candidates = algorithm.ask(4) + algorithm.ask()
+            self.assertEqual(len(candidates), 6)
+            self.assertEqual(algorithm.ask(), [])
+            fitnesses = sphere(candidates)
+            order = rng.permutation(len(candidates))
+            for batch in (order[:2], order[2:]):
+                algorithm.tell([candidates[i] for i in batch],
+                               fitnesses[batch])
+        self.assertEqual(algorithm.result(), expected)
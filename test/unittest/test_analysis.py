@@ -14,9 +14,14 @@ try:
 except ImportError:
     import unittest
 
+import numpy
 import quantities as pq
-from neo.core import AnalogSignal
-from neurotune.analysis import AnalysedSignal, AnalysedSignalSlice
+from neo.core import AnalogSignal, Segment, Block
+from neurotune.analysis import (AnalysedSignal, AnalysedSignalSlice,
+                                AnalysedSignalBatch, Analysis,
+                                FeatureExtractor, StreamingSpikeDetector,
+                                bincount_histogram2d, exponential_step_fit)
+from neurotune.simulation import Setup, RequestRef
 
 
 class TestAnalysedSignalFunctions(unittest.TestCase):
@@ -35,6 +40,84 @@ class TestAnalysedSignalFunctions(unittest.TestCase):
         os.remove('./pickle')
         self.assertEqual(analysed_signal1, analysed_signal2)
 
+    def test_encode(self):
+        signal = AnalysedSignal(AnalogSignal(numpy.sin(numpy.arange(1000)),
+                                             sampling_period=0.025 * pq.ms,
+                                             t_start=10 * pq.ms,
+                                             units=pq.mV, name='v'))
+        signal.dvdt  # Generate some cached analysis which won't be encoded
+        for precision in ('float32', 'float64'):
+            for compress in (True, False):
+                encoded = signal.encode(precision=precision, compress=compress)
+                decoded = AnalysedSignal.decode(encoded)
+                self.assertEqual(decoded.units, signal.units)
+                self.assertEqual(decoded.t_start, signal.t_start)
+                self.assertEqual(decoded.sampling_rate, signal.sampling_rate)
+                self.assertEqual(decoded.name, signal.name)
+                self.assertIsNone(decoded._dvdt)
+                self.assertTrue(numpy.allclose(decoded.magnitude,
+                                               signal.magnitude))
+        self.assertLess(len(signal.encode(precision='float32',
+                                          compress=False)),
+                        len(pickle.dumps(signal, pickle.HIGHEST_PROTOCOL)) / 2)
+
+
+class TestAnalysisFunctions(unittest.TestCase):
+
+    def test_pickle(self):
+        signal = AnalogSignal(numpy.arange(100), sampling_period=1 * pq.ms,
+                              units=pq.mV)
+        seg = Segment()
+        seg.analogsignals.append(signal)
+        recordings = Block(name='recordings', candidate=[1.0])
+        recordings.segments.append(seg)
+        setup = Setup(100 * pq.ms, None, [None],
+                      [[RequestRef('full', 0 * pq.ms, 100 * pq.ms),
+                        RequestRef('sliced', 20 * pq.ms, 50 * pq.ms)]])
+        analysis1 = Analysis(recordings, [setup])
+        analysis2 = pickle.loads(pickle.dumps(analysis1,
+                                              pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(analysis2.recordings.annotations['candidate'], [1.0])
+        for key in ('full', 'sliced'):
+            self.assertEqual(analysis1.get_signal(key),
+                             analysis2.get_signal(key))
+
+    def test_objective_specific(self):
+        signal = AnalogSignal(numpy.arange(100), sampling_period=1 * pq.ms,
+                              units=pq.mV)
+        seg = Segment()
+        seg.analogsignals.append(signal)
+        recordings = Block(name='recordings', candidate=[1.0])
+        recordings.segments.append(seg)
+        setup = Setup(100 * pq.ms, None, [None],
+                      [[RequestRef(('obj', 'full'), 0 * pq.ms, 100 * pq.ms)]])
+        analysis = Analysis(recordings, [setup])
+        # The objective specific analyses share the signals (and therefore
+        # their cached analysis) instead of rebuilding them
+        specific = analysis.objective_specific('obj')
+        self.assertIs(specific.get_signal('full'),
+                      analysis.get_signal(('obj', 'full')))
+        self.assertIsNone(analysis._objective_key)
+
+    def test_offset_window(self):
+        signal = AnalogSignal(numpy.arange(100), sampling_period=1 * pq.ms,
+                              t_start=0 * pq.ms, units=pq.mV)
+        seg = Segment()
+        seg.analogsignals.append(signal)
+        recordings = Block(name='recordings', candidate=[1.0])
+        recordings.segments.append(seg)
+        # The protocol of the 'shifted' request was concatenated 60 ms into
+        # the simulation
+        setup = Setup(100 * pq.ms, None, [None],
+                      [[RequestRef('sliced', 20 * pq.ms, 30 * pq.ms),
+                        RequestRef('shifted', 20 * pq.ms, 30 * pq.ms,
+                                   60 * pq.ms)]])
+        analysis = Analysis(recordings, [setup])
+        shifted = analysis.get_signal('shifted')
+        self.assertEqual(float(shifted.t_start), 20.0)
+        self.assertEqual(len(shifted), len(analysis.get_signal('sliced')))
+        self.assertEqual(float(shifted[0]), 80.0)
+
 
 class TestAnalysedSignalSliceFunctions(unittest.TestCase):
 
@@ -54,3 +137,275 @@ class TestAnalysedSignalSliceFunctions(unittest.TestCase):
                 sliced_signal2 = None
         os.remove('./pickle')
         self.assertEqual(sliced_signal1, sliced_signal2)
+
+    def test_slice_indices(self):
+        signal = AnalysedSignal(AnalogSignal(numpy.arange(1000),
+                                             sampling_period=0.025 * pq.ms,
+                                             units=pq.mV))
+        for t_start, t_stop in ((0.0, 24.975), (5.0, 15.0), (5.01, 14.99),
+                                (0.0125, 0.0125)):
+            t_start *= pq.ms
+            t_stop *= pq.ms
+            sliced = signal.slice(t_start, t_stop)
+            indices = numpy.where((signal.times >= t_start) &
+                                  (signal.times <= t_stop))[0]
+            self.assertEqual(len(sliced), len(indices))
+            if len(indices):
+                self.assertEqual(sliced._start_index, indices[0])
+                self.assertEqual(sliced._stop_index, indices[-1] + 1)
+                self.assertTrue(numpy.may_share_memory(sliced, signal))
+
+    def test_slice_spikes(self):
+        times = numpy.arange(0, 200, 0.1)
+        signal = AnalysedSignal(AnalogSignal(
+                                     40 * numpy.sin(2 * numpy.pi * times / 20),
+                                     sampling_period=0.1 * pq.ms,
+                                     units=pq.mV))
+        sliced = signal.slice(30 * pq.ms, 120 * pq.ms)
+        spikes = signal.spikes()
+        expected = spikes[numpy.where((spikes >= sliced.t_start) &
+                                      (spikes <= sliced.t_stop))]
+        self.assertTrue((sliced.spikes() == expected).all())
+        # Check the filtered spikes are memoized
+        self.assertIs(sliced.spikes(), sliced.spikes())
+        periods = signal._spike_period_indices()
+        expected = (periods[numpy.where(
+                                  (periods[:, 0] >= sliced._start_index) &
+                                  (periods[:, 1] <= sliced._stop_index))] -
+                    sliced._start_index)
+        self.assertTrue((sliced._spike_period_indices() == expected).all())
+
+
+class TestAnalysedSignalBatchFunctions(unittest.TestCase):
+
+    def setUp(self):
+        times = numpy.arange(0, 200, 0.025)
+        self.signals = [AnalogSignal(amp * numpy.sin(2 * numpy.pi * times /
+                                                     period),
+                                     t_start=0 * pq.ms,
+                                     sampling_period=0.025 * pq.ms,
+                                     units=pq.mV)
+                        for amp, period in ((40, 20), (50, 15), (10, 20),
+                                            (60, 33))]
+        self.batch = AnalysedSignalBatch.from_signals(self.signals)
+
+    def test_spikes(self):
+        # The batch analysis should be identical to that of each signal
+        dvdt = self.batch.dvdt.magnitude
+        for i, (signal, spikes) in enumerate(zip(self.signals,
+                                                 self.batch.spikes())):
+            signal = AnalysedSignal(signal)
+            self.assertTrue((dvdt[i] == signal.dvdt.magnitude).all())
+            expected = signal.spikes()
+            self.assertEqual(len(spikes), len(expected))
+            self.assertTrue((spikes.rescale(pq.ms).magnitude ==
+                             expected.rescale(pq.ms).magnitude).all())
+            self.assertTrue((self.batch._spike_period_indices()[i] ==
+                             signal._spike_period_indices()).all())
+
+    def test_from_analysed_signals(self):
+        analysed = [AnalysedSignal(s) for s in self.signals]
+        batch = AnalysedSignalBatch.from_signals(analysed)
+        self.assertTrue((batch.data == self.batch.data).all())
+        self.assertEqual(batch.units, self.batch.units)
+        self.assertEqual(batch.t_start, self.batch.t_start)
+        self.assertEqual(batch.sampling_period, self.batch.sampling_period)
+        sliced = [s.slice(50 * pq.ms, 150 * pq.ms) for s in analysed]
+        batch = AnalysedSignalBatch.from_signals(sliced)
+        for sig, row in zip(sliced, batch.data):
+            self.assertTrue((row == sig.magnitude).all())
+        self.assertTrue((batch.times.magnitude ==
+                         sliced[0].times.magnitude).all())
+        # The units are converted from the underlying neo signals
+        volts = AnalysedSignal(self.signals[0].rescale(pq.V))
+        batch = AnalysedSignalBatch.from_signals([analysed[1], volts])
+        self.assertTrue(numpy.allclose(batch.data[1], self.batch.data[0]))
+
+    def test_phase_plane_hist(self):
+        num_bins = (15, 20)
+        bounds = ((-100.0, 80.0), (-300.0, 400.0))
+        hists = self.batch.phase_plane_hist(num_bins, bounds)
+        dvdt = self.batch.dvdt.magnitude
+        for i, hist in enumerate(hists):
+            expected = numpy.histogram2d(self.batch.data[i], dvdt[i],
+                                         bins=num_bins, range=bounds)[0]
+            self.assertTrue((hist == expected).all())
+
+    def test_bincount_histogram2d(self):
+        num_bins = (15, 20)
+        bounds = ((-100.0, 80.0), (-300.0, 400.0))
+        signal = AnalysedSignal(self.signals[3])
+        x, y = signal.magnitude, signal.dvdt.magnitude
+        hist = bincount_histogram2d(x, y, num_bins, bounds)
+        expected = numpy.histogram2d(x, y, bins=num_bins, range=bounds)[0]
+        self.assertTrue((hist == expected).all())
+
+    def test_histogram_edges(self):
+        num_bins = (15, 20)
+        bounds = ((-100.0, 80.0), (-300.0, 400.0))
+        edges = [numpy.linspace(lower, upper, n + 1)
+                 for n, (lower, upper) in zip(num_bins, bounds)]
+        # Values exactly on every edge, just below the upper edges and
+        # (rounded) values either side of the bounds
+        rng = numpy.random.RandomState(0)
+        x = numpy.concatenate((edges[0], numpy.resize(edges[0], 21),
+                               [numpy.nextafter(80.0, 0)] * 21,
+                               numpy.round(rng.uniform(-110, 90, 1000), 1)))
+        y = numpy.concatenate((numpy.resize(edges[1], 16), edges[1],
+                               [numpy.nextafter(400.0, 0)] * 21,
+                               numpy.round(rng.uniform(-320, 420, 1000), 1)))
+        hist = bincount_histogram2d(x, y, num_bins, bounds)
+        expected = numpy.histogram2d(x, y, bins=num_bins, range=bounds)[0]
+        self.assertTrue((hist == expected).all())
+        # The voltages of the batch fall on the edges of the v axis
+        batch = AnalysedSignalBatch(numpy.vstack((x, x[::-1])), 1.0 * pq.ms)
+        dvdt = batch.dvdt.magnitude
+        for i, hist in enumerate(batch.phase_plane_hist(num_bins, bounds)):
+            expected = numpy.histogram2d(batch.data[i], dvdt[i],
+                                         bins=num_bins, range=bounds)[0]
+            self.assertTrue((hist == expected).all())
+
+    def test_exponential_fit(self):
+        times = numpy.arange(0, 200, 0.025)
+        taus = numpy.array([[5.0], [10.0], [40.0]])
+        data = -65.0 + 10.0 * (1.0 - numpy.exp(-times / taus))
+        v_inf, delta, tau = AnalysedSignalBatch(data, 0.025 * pq.ms
+                                                ).exponential_fit()
+        self.assertTrue(numpy.allclose(tau.rescale(pq.ms).magnitude,
+                                       taus.ravel(), rtol=1e-4))
+        self.assertTrue(numpy.allclose(v_inf.magnitude, -55.0, rtol=1e-4))
+        self.assertTrue(numpy.allclose(delta.magnitude, -10.0, rtol=1e-4))
+        # Flat traces don't decay towards a steady state
+        self.assertTrue(numpy.isinf(exponential_step_fit(
+                                                  numpy.ones((1, 100)))[2][0]))
+
+    def test_getitem(self):
+        spikes = self.batch.spikes()
+        signal = self.batch[1]
+        self.assertIsInstance(signal, AnalysedSignal)
+        self.assertIs(signal.spikes(), spikes[1])
+        self.assertTrue((signal.dvdt.magnitude ==
+                         AnalysedSignal(self.signals[1]).dvdt.magnitude).all())
+        self.assertAlmostEqual(float(signal.spike_frequency().rescale(pq.Hz)),
+                               float(self.batch.spike_frequency()[1]))
+
+
+class TestFeatureExtractor(unittest.TestCase):
+
+    def setUp(self):
+        times = numpy.arange(0, 200, 0.025)
+        self.signal = AnalysedSignal(AnalogSignal(
+                                       40 * numpy.sin(2 * numpy.pi * times / 20),
+                                       t_start=0 * pq.ms,
+                                       sampling_period=0.025 * pq.ms,
+                                       units=pq.mV))
+
+    def test_features(self):
+        features = FeatureExtractor(FeatureExtractor.FEATURES)(self.signal)
+        spikes = self.signal.spikes()
+        self.assertTrue((features['spike_times'] == spikes).all())
+        self.assertEqual(len(features['phase_plane_loops']), len(spikes))
+        self.assertTrue(numpy.allclose(features['peak_values'], 40.0))
+        self.assertTrue(numpy.allclose(features['peak_times'],
+                                       numpy.arange(25.0, 200.0, 20.0)))
+        self.assertTrue(numpy.allclose(features['trough_values'], -40.0))
+        self.assertEqual(len(features['ahp_depths']), len(spikes) - 1)
+        # The onset is the first sample after dV/dt crosses 10 mV/ms (so
+        # within ~0.25 mV) and the half-height is midway between the onset and
+        # the peak
+        omega = 2 * numpy.pi / 20.0
+        onset_v = -40.0 * numpy.sin(numpy.arccos(10.0 / (40.0 * omega)))
+        self.assertTrue(numpy.allclose(features['ahp_depths'],
+                                       onset_v + 40.0, atol=0.3))
+        half = numpy.arcsin((onset_v + 40.0) / 2.0 / 40.0)
+        self.assertTrue(numpy.allclose(features['widths'],
+                                       (numpy.pi - 2 * half) / omega,
+                                       atol=0.05))
+
+    def test_shared_intermediates(self):
+        FeatureExtractor(['peak_values'])(self.signal)
+        cached = dict(self.signal._features)
+        FeatureExtractor(['widths'])(self.signal)
+        # The periods and peaks should have been reused from the first
+        # extraction
+        for key, val in cached.iteritems():
+            self.assertIs(self.signal._features[key], val)
+        self.assertEqual(len(self.signal._features), len(cached) + 2)
+
+
+class TestStreamingSpikeDetector(unittest.TestCase):
+
+    def test_chunked_detection(self):
+        times = numpy.arange(0, 500, 0.025)
+        samples = (40 * numpy.sin(2 * numpy.pi * times / 20) +
+                   10 * numpy.sin(2 * numpy.pi * times / 130))
+        signal = AnalogSignal(samples, t_start=0 * pq.ms,
+                              sampling_period=0.025 * pq.ms, units=pq.mV)
+        for kwargs in ({}, {'index_buffer': 100},
+                       {'threshold': 'v', 'start': 10.0, 'stop': 0.0}):
+            # The detection shouldn't depend on how the recording is chunked
+            whole = StreamingSpikeDetector(0.025 * pq.ms, **kwargs)
+            whole.process(samples)
+            whole.finish()
+            expected = whole.spikes()
+            for chunk_size in (1, 7, 1000):
+                detector = StreamingSpikeDetector(0.025 * pq.ms, **kwargs)
+                for chunk in StreamingSpikeDetector.iter_chunks(samples,
+                                                                chunk_size):
+                    detector.process(chunk)
+                detector.finish()
+                spikes = detector.spikes()
+                self.assertEqual(len(spikes), len(expected))
+                self.assertTrue((spikes.magnitude ==
+                                 expected.magnitude).all())
+                self.assertEqual(detector.periods, whole.periods)
+            # The finite-difference dV/dt of the detector can shift the spike
+            # times by up to half a sampling period and the dV/dt threshold
+            # crossings by a sample from those of the spline fitted by
+            # AnalysedSignal
+            analysed = AnalysedSignal(signal)
+            self.assertTrue(numpy.allclose(
+                          analysed.spikes(**kwargs).magnitude,
+                          expected.magnitude, rtol=0.0, atol=0.5 * 0.025))
+            periods = analysed._spike_period_indices(**kwargs)
+            max_shift = 1 if kwargs.get('threshold', 'dvdt') == 'dvdt' else 0
+            self.assertLessEqual(numpy.abs(numpy.array(whole.periods) -
+                                           periods).max(), max_shift)
+
+    def test_repeated_start_crossings(self):
+        # The rise of each spike crosses the start threshold twice (as can
+        # happen with a noisy dV/dt) before the dV/dt crosses the stop
+        # threshold, which should be merged into a single spike period
+        profile = numpy.interp(numpy.linspace(0, 6, 120), range(7),
+                               [0, 15, 5, 20, 0, -30, 0])
+        dvdt = numpy.concatenate([numpy.zeros(200)] +
+                                 [numpy.concatenate((profile,
+                                                     numpy.zeros(150)))] * 3)
+        samples = -65.0 + numpy.cumsum(dvdt) * 0.025
+        signal = AnalogSignal(samples, t_start=0 * pq.ms,
+                              sampling_period=0.025 * pq.ms, units=pq.mV)
+        expected = StreamingSpikeDetector.detect([samples], 0.025 * pq.ms)
+        self.assertEqual(len(expected), 3)
+        for chunk_size in (1, 13):
+            detector = StreamingSpikeDetector(0.025 * pq.ms)
+            for chunk in StreamingSpikeDetector.iter_chunks(samples,
+                                                            chunk_size):
+                detector.process(chunk)
+            detector.finish()
+            self.assertTrue((detector.spikes().magnitude ==
+                             expected.magnitude).all())
+        self.assertTrue(numpy.allclose(AnalysedSignal(signal).spikes(
+                                                                ).magnitude,
+                                       expected.magnitude, rtol=0.0,
+                                       atol=0.5 * 0.025))
+
+    def test_pair_crossings(self):
+        # Leading and repeated stops are dropped, repeated starts are merged
+        # and a trailing start without a stop is dropped
+        periods = AnalysedSignal._pair_crossings(
+                                          numpy.array([5, 7, 20, 40]),
+                                          numpy.array([2, 3, 10, 12, 30]),
+                                          0, 50)
+        self.assertEqual(periods.tolist(), [[5, 10], [20, 30]])
+        self.assertEqual(len(AnalysedSignal._pair_crossings(
+                              numpy.array([5]), numpy.array([2]), 0, 50)), 0)
@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the objective functions that don't require simulations
+"""
+
+# needed for python 3 compatibility
+from __future__ import division
+
+import os.path
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import numpy
+import scipy.signal
+import quantities as pq
+import neo
+from neo.core import AnalogSignal, Segment, Block
+from neurotune.analysis import Analysis, FeatureExtractor
+from neurotune.simulation import Setup, RequestRef
+from neurotune.objective import Objective
+from neurotune.objective.phase_plane import (PhasePlaneHistObjective,
+                                             PhasePlanePointwiseObjective)
+from neurotune.objective.spike import (
+                    SpikeFrequencyObjective, SpikeTimesObjective,
+                    VictorPurpuraObjective, VanRossumObjective,
+                    victor_purpura_distance, nearest_sq_diffs)
+from neurotune.objective.multi import WeightedSumObjective
+from neurotune.objective.passive import (TimeConstantObjective,
+                                         PeakConductanceObjective)
+from neurotune.objective.trace import (TraceDistanceObjective,
+                                      shifted_sq_diffs, dtw_distance)
+
+
+def spiking_signal(spike_times, width=0.5, t_stop=300.0, dt=0.025):
+    """
+    A voltage trace with a Gaussian 'spike' at each of the spike times
+    """
+    times = numpy.arange(0.0, t_stop, dt)
+    v = numpy.empty(len(times))
+    v.fill(-65.0)
+    for spike_time in spike_times:
+        v += 100.0 * numpy.exp(-((times - spike_time) / width) ** 2)
+    return AnalogSignal(v, sampling_period=dt * pq.ms, t_start=0.0 * pq.ms,
+                        units=pq.mV)
+
+
+def step_response(tau, delta_v, time_start=100.0, time_stop=400.0,
+                  t_stop=500.0, dt=0.025):
+    """
+    A voltage trace that approaches -65 + delta_v exponentially with time
+    constant tau over the current step from time_start to time_stop, at the
+    end of which it returns to rest
+    """
+    times = numpy.arange(0.0, t_stop, dt)
+    v = numpy.empty(len(times))
+    v.fill(-65.0)
+    step = (times >= time_start) & (times <= time_stop)
+    v[step] += delta_v * (1.0 - numpy.exp(-(times[step] - time_start) / tau))
+    return AnalogSignal(v, sampling_period=dt * pq.ms, t_start=0.0 * pq.ms,
+                        units=pq.mV)
+
+
+def analysis_of(signal, keys=(None,), time_start=None, time_stop=None):
+    """
+    An analysis of a single recording, requested under each of the given keys
+    over the given window (the whole recording by default)
+    """
+    seg = Segment()
+    seg.analogsignals.append(signal)
+    recordings = Block(name='recordings', candidate=[0.0])
+    recordings.segments.append(seg)
+    if time_start is None:
+        time_start = signal.t_start
+    if time_stop is None:
+        time_stop = signal.t_stop
+    setup = Setup(signal.t_stop, None, [None],
+                  [[RequestRef(key, time_start, time_stop) for key in keys]])
+    return Analysis(recordings, [setup])
+
+
+class TestPhasePlanePointwiseObjective(unittest.TestCase):
+
+    def test_distance_methods(self):
+        reference = spiking_signal([50, 120, 200, 260])
+        recording = spiking_signal([40, 90, 150, 170, 240], width=0.7)
+        analysis = analysis_of(recording)
+        for method in PhasePlanePointwiseObjective.DISTANCE_METHODS:
+            objective = PhasePlanePointwiseObjective(
+                                  reference, time_start=0.0 * pq.ms,
+                                  time_stop=300.0 * pq.ms,
+                                  distance_method=method)
+            # The nested loop the distance matrix replaced
+            loops = analysis.get_signal().spike_v_dvdt(
+                                objective.num_points,
+                                interp_order=objective.interp_order,
+                                start_thresh=objective.thresh[0],
+                                stop_thresh=objective.thresh[1])
+            self.assertEqual(len(loops), 5)
+            fit_mat = numpy.array([[numpy.sum((rec - ref) ** 2)
+                                    for ref in objective.reference_loops]
+                                   for rec in loops])
+            expected = ((fit_mat.min(axis=0).sum() +
+                         fit_mat.min(axis=1).sum()) / sum(fit_mat.shape))
+            self.assertAlmostEqual(objective.fitness(analysis) / expected,
+                                   1.0, places=9)
+            # Split the broadcast differences into blocks of single rows
+            objective.MAX_BROADCAST_SIZE = 1
+            self.assertAlmostEqual(objective.fitness(analysis) / expected,
+                                   1.0, places=9)
+
+
+class TestPhasePlaneHistObjective(unittest.TestCase):
+
+    window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+
+    def setUp(self):
+        self.reference = spiking_signal([50, 120, 200, 260])
+        self.analysis = analysis_of(spiking_signal([40, 90, 150, 240],
+                                                   width=0.7))
+
+    def test_convolution_methods(self):
+        # Kernels with odd and even numbers of bins along each axis
+        for kernel_stdev, kernel_shape in (((10.0, 40.0), (29, 30)),
+                                           ((9.0, 35.0), (26, 26)),
+                                           ((12.0, 45.0), (35, 33))):
+            direct = PhasePlaneHistObjective(self.reference,
+                                             kernel_stdev=kernel_stdev,
+                                             **self.window)
+            self.assertEqual(direct.kernel.shape, kernel_shape)
+            expected = direct.fitness(self.analysis)
+            for method in ('separable', 'fft'):
+                objective = PhasePlaneHistObjective(
+                                    self.reference, kernel_stdev=kernel_stdev,
+                                    convolution=method, **self.window)
+                self.assertTrue(numpy.allclose(objective.ref_hist,
+                                               direct.ref_hist, rtol=1e-10,
+                                               atol=1e-16))
+                self.assertAlmostEqual(objective.fitness(self.analysis) /
+                                       expected, 1.0, places=10)
+
+    def test_spectral_diff(self):
+        # The convolved histograms lie within the bounds so the difference
+        # matches 'direct' up to rounding error
+        direct = PhasePlaneHistObjective(self.reference, **self.window)
+        spectral = PhasePlaneHistObjective(self.reference, convolution='fft',
+                                           spectral_diff=True, **self.window)
+        self.assertAlmostEqual(spectral.fitness(self.analysis) /
+                               direct.fitness(self.analysis), 1.0,
+                               places=10)
+        # With the bounds close to the peaks of the spikes the tails of the
+        # kernel extend beyond them, which are included in the spectral
+        # difference but cropped from the histograms by 'direct'
+        bounds = {'v_bounds': (-100.0, 40.0), 'dvdt_bounds': (-180.0, 180.0)}
+        bounds.update(self.window)
+        direct = PhasePlaneHistObjective(self.reference, **bounds)
+        spectral = PhasePlaneHistObjective(self.reference, convolution='fft',
+                                           spectral_diff=True, **bounds)
+        full_diff = scipy.signal.convolve2d(
+                        direct._bin(direct.reference) -
+                        direct._bin(self.analysis.get_signal()),
+                        direct.kernel, mode='full')
+        fitness = spectral.fitness(self.analysis)
+        self.assertAlmostEqual(fitness / (full_diff ** 2).sum(), 1.0,
+                               places=10)
+        self.assertGreater(fitness, direct.fitness(self.analysis) * 1.01)
+
+
+class TestSpikeTimesObjective(unittest.TestCase):
+
+    @classmethod
+    def brute_nearest_sq_diffs(cls, times, targets):
+        return numpy.array([numpy.square(targets - t).min() for t in times])
+
+    def test_nearest_sq_diffs(self):
+        rng = numpy.random.RandomState(0)
+        targets = numpy.sort(rng.uniform(0, 100, 20))
+        cases = [(rng.uniform(-10, 110, 50), targets),
+                 # Times on, before and after the targets
+                 (numpy.concatenate((targets, [-5.0, 0.0, 100.0, 200.0])),
+                  targets),
+                 # A single target and repeated targets
+                 (rng.uniform(0, 100, 10), numpy.array([50.0])),
+                 (rng.uniform(0, 100, 10), numpy.array([20.0, 20.0, 70.0])),
+                 (numpy.array([]), targets)]
+        for times, targets in cases:
+            diffs = nearest_sq_diffs(times, targets)
+            self.assertEqual(len(diffs), len(times))
+            self.assertTrue(numpy.allclose(
+                        diffs, self.brute_nearest_sq_diffs(times, targets)))
+
+    def test_fitness(self):
+        reference = spiking_signal([30, 75, 120, 180, 240, 285])
+        objective = SpikeTimesObjective(reference, time_start=0.0 * pq.ms,
+                                        time_stop=300.0 * pq.ms,
+                                        time_buffer=50.0 * pq.ms)
+        ref_spikes = objective.ref_spikes.magnitude
+        self.assertEqual(len(ref_spikes), 6)
+        # The inner reference spikes are taken from the spikes extracted from
+        # the reference signal
+        self.assertEqual(len(objective.ref_inner), 4)
+        for spike_times in ([45, 90, 110, 200, 250], [20, 290], []):
+            spikes = analysis_of(spiking_signal(spike_times)
+                                 ).get_signal().spikes().magnitude
+            inner = spikes[(spikes >= 50.0) & (spikes <= 250.0)]
+            if not len(spikes):
+                spikes = numpy.array([300.0])
+            # The loops over the spikes that the binary search replaced
+            expected = (sum(numpy.square(ref_spikes - s).min()
+                            for s in inner) +
+                        sum(numpy.square(spikes - s).min()
+                            for s in objective.ref_inner.magnitude))
+            self.assertAlmostEqual(objective.fitness(analysis_of(
+                                            spiking_signal(spike_times))),
+                                   expected)
+
+
+class TestWeightedSumObjective(unittest.TestCase):
+
+    def setUp(self):
+        reference = spiking_signal([30, 75, 120, 180, 240, 285])
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        self.objective = WeightedSumObjective(
+                  (0.5, SpikeFrequencyObjective(20.0 * pq.Hz, **window)),
+                  (2.0, SpikeTimesObjective(reference,
+                                            time_buffer=50.0 * pq.ms,
+                                            **window)),
+                  (1.0, VanRossumObjective(reference, **window)))
+        keys = [(obj, None) for obj in self.objective.objectives]
+        self.analyses = [analysis_of(spiking_signal(spikes), keys)
+                         for spikes in ([45, 90, 110, 200, 250], [20, 290],
+                                        [30, 75, 120, 180, 240, 285])]
+
+    def test_cutoff(self):
+        full_sums = [self.objective.fitness(a) for a in self.analyses]
+        for _ in xrange(5):
+            for analysis, full_sum in zip(self.analyses, full_sums):
+                # The cost ordering doesn't change sums below the cutoff
+                self.assertEqual(self.objective.fitness(analysis,
+                                                        cutoff=full_sum),
+                                 full_sum)
+                self.assertEqual(self.objective.fitness(analysis,
+                                                        cutoff=1e10),
+                                 full_sum)
+                # Sums above the cutoff are only bounded from below
+                if full_sum:
+                    cutoff = full_sum * 0.5
+                    partial_sum = self.objective.fitness(analysis,
+                                                         cutoff=cutoff)
+                    self.assertGreater(partial_sum, cutoff)
+                    self.assertLessEqual(partial_sum, full_sum)
+        self.assertNotIn(None, self.objective.costs)
+
+
+class TestPassivePropertiesObjective(unittest.TestCase):
+
+    window = {'time_start': 100.0 * pq.ms, 'time_stop': 400.0 * pq.ms}
+
+    def setUp(self):
+        self.reference = step_response(25.0, 10.0)
+        # Sweeps with different time constants and amplitudes
+        self.sweeps = [step_response(tau, delta_v)
+                       for tau, delta_v in ((25.0, 10.0), (30.0, 10.0),
+                                            (10.0, 5.0), (50.0, 20.0))]
+
+    def fitnesses(self, objective):
+        return [objective.fitness(analysis_of(sweep, **self.window))
+                for sweep in self.sweeps]
+
+    def test_time_constant(self):
+        objective = TimeConstantObjective(self.reference, 0.1 * pq.nA,
+                                          **self.window)
+        self.assertAlmostEqual(float(objective.reference_value), 25.0,
+                               places=3)
+        self.assertTrue(numpy.allclose(self.fitnesses(objective),
+                                       [0.0, 25.0, 225.0, 625.0], atol=1e-3,
+                                       rtol=1e-4))
+
+    def test_peak_conductance(self):
+        # 0.1 nA steps the voltage by 10 mV in the reference (0.01 uS)
+        objective = PeakConductanceObjective(self.reference, 0.1 * pq.nA,
+                                             **self.window)
+        self.assertAlmostEqual(float(objective.reference_value), 0.01,
+                               places=6)
+        self.assertTrue(numpy.allclose(self.fitnesses(objective),
+                                       [0.0, 0.0, 1e-4, 2.5e-5], atol=1e-9,
+                                       rtol=1e-3))
+
+    def test_batch_fitness(self):
+        # The batch is fitted over the window of the objective like the
+        # sliced recordings passed to the fitness method
+        for objective_class in (TimeConstantObjective,
+                                PeakConductanceObjective):
+            objective = objective_class(self.reference, 0.1 * pq.nA,
+                                        **self.window)
+            self.assertTrue(numpy.allclose(objective.batch_fitness(
+                                                                  self.sweeps),
+                                           self.fitnesses(objective),
+                                           rtol=1e-6, atol=1e-12))
+
+
+class TestReferenceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        Objective.reference_cache_dir = self.cache_dir
+
+    def tearDown(self):
+        Objective.reference_cache_dir = None
+        shutil.rmtree(self.cache_dir)
+
+    def test_cached_reference(self):
+        reference = spiking_signal([50, 120, 200, 260])
+        analysis = analysis_of(spiking_signal([40, 90, 150, 240], width=0.7))
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        computed = PhasePlaneHistObjective(reference, **window)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        loaded = PhasePlaneHistObjective(reference, **window)
+        self.assertTrue((loaded.ref_hist == computed.ref_hist).all())
+        # The artifacts are memory mapped from the cache but the fitnesses
+        # calculated from them shouldn't be
+        fitness = loaded.fitness(analysis)
+        self.assertNotIsInstance(fitness, numpy.memmap)
+        self.assertEqual(fitness, computed.fitness(analysis))
+
+
+class TestSpikeTrainDistances(unittest.TestCase):
+
+    @classmethod
+    def brute_victor_purpura(cls, times1, times2, cost):
+        # The full dynamic programming table
+        table = numpy.zeros((len(times1) + 1, len(times2) + 1))
+        table[:, 0] = numpy.arange(len(times1) + 1)
+        table[0, :] = numpy.arange(len(times2) + 1)
+        for i in xrange(1, len(times1) + 1):
+            for j in xrange(1, len(times2) + 1):
+                table[i, j] = min(table[i - 1, j] + 1, table[i, j - 1] + 1,
+                                  table[i - 1, j - 1] +
+                                  cost * abs(times1[i - 1] - times2[j - 1]))
+        return table[-1, -1]
+
+    @classmethod
+    def brute_van_rossum(cls, times1, times2, tau, dt=0.001):
+        # Numerically integrate the squared difference between the trains
+        # convolved with the (causal) exponential kernel
+        t = numpy.arange(0.0, max(numpy.concatenate(([0.0], times1,
+                                                     times2))) + 20.0 * tau,
+                         dt)
+        conv = [sum(numpy.where(t >= s, numpy.exp(-(t - s) / tau), 0.0)
+                    for s in times) for times in (times1, times2)]
+        return numpy.sqrt(numpy.sum((conv[0] - conv[1]) ** 2) * dt / tau)
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.trains = [numpy.sort(rng.uniform(0, 100, n))
+                       for n in (0, 1, 5, 12, 20)]
+        # Coincident spikes
+        self.trains.append(self.trains[3][::2].copy())
+
+    def test_victor_purpura(self):
+        for cost in (0.0, 0.05, 0.5, 10.0):
+            for times1 in self.trains:
+                for times2 in self.trains:
+                    self.assertAlmostEqual(
+                        victor_purpura_distance(times1, times2, cost),
+                        self.brute_victor_purpura(times1, times2, cost))
+
+    def test_van_rossum(self):
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        for tau in (2.0, 10.0):
+            for reference in self.trains[1:]:
+                objective = VanRossumObjective(
+                               neo.SpikeTrain(reference, 300.0, units='ms'),
+                               tau=tau * pq.ms, **window)
+                for times in self.trains:
+                    self.assertAlmostEqual(
+                        objective.distance(times),
+                        self.brute_van_rossum(times, reference, tau),
+                        places=2)
+                self.assertAlmostEqual(objective.distance(reference), 0.0)
+
+    def test_fitness(self):
+        reference = spiking_signal([30, 75, 120, 180, 240, 285])
+        recording = spiking_signal([45, 90, 110, 200, 250])
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        spikes = analysis_of(recording).get_signal().spikes()
+        ref_times = analysis_of(reference).get_signal().spikes().magnitude
+        vp = VictorPurpuraObjective(reference, cost=0.1 / pq.ms, **window)
+        self.assertAlmostEqual(vp.fitness(analysis_of(recording)),
+                               self.brute_victor_purpura(spikes.magnitude,
+                                                         ref_times, 0.1))
+        vr = VanRossumObjective(reference, **window)
+        self.assertAlmostEqual(vr.fitness(analysis_of(recording)),
+                               vr.batch_fitness([spikes])[0])
+
+
+class TestSharedFeatures(unittest.TestCase):
+
+    def setUp(self):
+        # Count the calculations of the intermediates of the spike times
+        self.calculations = []
+        for name in ('_dvdt', '_periods', '_spike_times'):
+            method = FeatureExtractor.__dict__[name]
+            setattr(FeatureExtractor, name, self.counted(name, method))
+            self.addCleanup(setattr, FeatureExtractor, name, method)
+
+    def counted(self, name, method):
+        def counted_method(extractor, signal, results):
+            self.calculations.append(name)
+            return method(extractor, signal, results)
+        return counted_method
+
+    def test_shared_intermediates(self):
+        reference = spiking_signal([30, 75, 120, 180, 240, 285])
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        objectives = [SpikeFrequencyObjective(20.0 * pq.Hz, **window),
+                      SpikeTimesObjective(reference, time_buffer=50.0 * pq.ms,
+                                          **window),
+                      VanRossumObjective(reference, **window)]
+        recording = spiking_signal([45, 90, 110, 200, 250])
+        analysis = analysis_of(recording)
+        fitnesses = [o.fitness(analysis) for o in objectives]
+        self.assertEqual(sorted(self.calculations),
+                         ['_dvdt', '_periods', '_spike_times'])
+        # The features are the same as those the signal calculates itself
+        spikes = analysis_of(recording).get_signal().spikes()
+        self.assertAlmostEqual(fitnesses[0], float((20.0 * pq.Hz - 4.0 /
+                                                    (spikes[-1] - spikes[0]))
+                                                   ** 2))
+        self.assertAlmostEqual(fitnesses[2],
+                               objectives[2].batch_fitness([spikes])[0])
+
+
+class TestTraceDistanceObjective(unittest.TestCase):
+
+    @classmethod
+    def brute_shifted_sq_diffs(cls, x, y, max_shift):
+        length = min(len(x), len(y))
+        x, y = x[:length], y[:length]
+        max_shift = min(max_shift, length - 1)
+        diffs = []
+        for s in xrange(-max_shift, max_shift + 1):
+            if s >= 0:
+                diffs.append(numpy.mean((x[s:] - y[:length - s]) ** 2))
+            else:
+                diffs.append(numpy.mean((x[:length + s] - y[-s:]) ** 2))
+        return numpy.array(diffs)
+
+    @classmethod
+    def brute_dtw(cls, x, y, band_width):
+        # The full dynamic programming table with the cells outside the band
+        # left infinite
+        n, m = len(x), len(y)
+        w = max(band_width, abs(n - m))
+        table = numpy.empty((n + 1, m + 1))
+        table.fill(numpy.inf)
+        table[0, 0] = 0.0
+        for i in xrange(1, n + 1):
+            for j in xrange(max(1, i - w), min(m, i + w) + 1):
+                table[i, j] = (x[i - 1] - y[j - 1]) ** 2 + min(
+                    table[i - 1, j], table[i, j - 1], table[i - 1, j - 1])
+        return table[n, m] / max(n, m)
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.traces = [numpy.cumsum(rng.standard_normal(n))
+                       for n in (1, 2, 7, 30, 33)]
+
+    def test_shifted_sq_diffs(self):
+        for x in self.traces:
+            for y in self.traces:
+                for max_shift in (0, 1, 5, 40):
+                    self.assertTrue(numpy.allclose(
+                        shifted_sq_diffs(x, y, max_shift),
+                        self.brute_shifted_sq_diffs(x, y, max_shift)))
+
+    def test_dtw_distance(self):
+        for x in self.traces:
+            for y in self.traces:
+                for band_width in (0, 1, 3, 40):
+                    self.assertAlmostEqual(
+                        dtw_distance(x, y, band_width),
+                        self.brute_dtw(x, y, band_width))
+
+    def test_fitness(self):
+        reference = spiking_signal([30, 75, 120, 180, 240, 285])
+        recording = spiking_signal([32, 77, 122, 182, 242, 287])
+        window = {'time_start': 0.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+        # The recording is requested under the objective's recording site
+        analysis = analysis_of(recording, keys=['v'])
+        ref_trace = reference.magnitude
+        trace = recording.magnitude
+        for alignment, expected in (
+                (None, numpy.mean((trace - ref_trace) ** 2)),
+                ('shift', self.brute_shifted_sq_diffs(trace, ref_trace,
+                                                      120).min())):
+            objective = TraceDistanceObjective(reference, alignment=alignment,
+                                               max_shift=3.0 * pq.ms,
+                                               record_variable='v', **window)
+            self.assertAlmostEqual(objective.fitness(analysis), expected)
+        # The shift that aligns the spikes leaves them matching exactly
+        self.assertLess(objective.fitness(analysis), 1e-9)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the planning of simulation setups that don't require a simulator
+"""
+
+# needed for python 3 compatibility
+from __future__ import division
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import numpy
+import quantities as pq
+from neo.core import AnalogSignal, Segment
+from neurotune.analysis import Analysis
+from neurotune.simulation import (Simulation, RecordingRequest,
+                                  ExperimentalConditions, StepCurrentSource,
+                                  ProtocolConcatenator)
+
+
+class InjectedCurrentSimulation(Simulation):
+    """
+    A simulation that 'records' the current it injects, so the recordings
+    show which protocol was run when
+    """
+
+    supported_clamp_types = [StepCurrentSource]
+
+    def __init__(self, protocol_planner=None, dt=0.5):
+        self.protocol_planner = protocol_planner
+        self.dt = dt
+        self.num_runs = 0
+
+    def run(self, candidate, setup):  # @UnusedVariable
+        self.num_runs += 1
+        # The recording includes the sample at the record time, as NEURON's
+        # do
+        record_time = float(pq.Quantity(setup.record_time, 'ms'))
+        times = numpy.arange(int(round(record_time / self.dt)) + 1) * self.dt
+        # Each sample records the current injected in the step leading up to
+        # it, as the voltage would reflect
+        current = numpy.zeros(len(times))
+        if setup.conditions is not None:
+            for source in setup.conditions.clamps:
+                for amp, t in zip(source.amplitudes, source.times):
+                    current[times > float(pq.Quantity(t, 'ms'))] = amp
+        seg = Segment()
+        for _ in setup.record_variables:
+            seg.analogsignals.append(AnalogSignal(
+                                current, units=pq.nA, t_start=0.0 * pq.ms,
+                                sampling_period=self.dt * pq.ms))
+        return seg
+
+
+class TestProtocolConcatenator(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = {}
+        for i, amp in enumerate((0.1, 0.2, 0.3)):
+            conditions = ExperimentalConditions(
+                      clamps=[StepCurrentSource([0.0, amp], [0.0, 100.0])])
+            self.requests[i] = RecordingRequest(time_start=50.0 * pq.ms,
+                                                time_stop=300.0 * pq.ms,
+                                                conditions=conditions)
+        # A request from a separate site under one of the same protocols
+        self.requests['other'] = RecordingRequest(
+                                  time_start=150.0 * pq.ms,
+                                  time_stop=200.0 * pq.ms,
+                                  record_variable='other',
+                                  conditions=self.requests[2].conditions)
+
+    def analyse(self, simulation):
+        simulation.set_tune_parameters([])
+        simulation._process_requests(self.requests)
+        return Analysis(simulation.run_all([]), simulation.setups)
+
+    def test_concatenated_run(self):
+        separate = InjectedCurrentSimulation()
+        concatenated = InjectedCurrentSimulation(ProtocolConcatenator(
+                                                recovery_time=200.0 * pq.ms))
+        separate_analysis = self.analyse(separate)
+        concatenated_analysis = self.analyse(concatenated)
+        self.assertEqual(separate.num_runs, 3)
+        self.assertEqual(concatenated.num_runs, 1)
+        setup = concatenated.setups[0]
+        self.assertEqual(float(setup.record_time), 300.0 * 3 + 200.0 * 2)
+        # Each request sees its own protocol over the times it requested
+        for key in self.requests:
+            expected = separate_analysis.get_signal(key)
+            signal = concatenated_analysis.get_signal(key)
+            self.assertEqual(float(signal.t_start),
+                             float(self.requests[key].time_start))
+            self.assertEqual(len(signal), len(expected))
+            self.assertTrue((signal.magnitude == expected.magnitude).all())
+        self.assertEqual(concatenated_analysis.get_signal(1).magnitude[-1],
+                         0.2)
+
+    def test_incompatible_protocols(self):
+        # Setups with different initial voltages can't be concatenated
+        self.requests[0].conditions = ExperimentalConditions(
+                        initial_v=-70.0 * pq.mV,
+                        clamps=self.requests[0].conditions.clamps)
+        simulation = InjectedCurrentSimulation(ProtocolConcatenator())
+        analysis = self.analyse(simulation)
+        self.assertEqual(simulation.num_runs, 2)
+        self.assertEqual(analysis.get_signal(0).magnitude[-1], 0.1)
+        self.assertEqual(analysis.get_signal(2).magnitude[-1], 0.3)
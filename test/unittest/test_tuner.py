@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the tuner driving real objectives with a cheap stand-in simulation
+"""
+
+# needed for python 3 compatibility
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import numpy
+import quantities as pq
+from neo.core import AnalogSignal, Segment
+from neurotune import Parameter
+from neurotune.tuner import Tuner
+from neurotune.algorithm.inspyred import ESAlgorithm
+from neurotune.simulation import Simulation, Fidelity
+from neurotune.objective import Objective
+from neurotune.objective.phase_plane import PhasePlaneHistObjective
+from neurotune.objective.spike import (SpikeFrequencyObjective,
+                                       SpikeTimesObjective, VanRossumObjective)
+from neurotune.objective.trace import TraceDistanceObjective
+from neurotune.objective.multi import MultiObjective, WeightedSumObjective
+
+
+def spike_train_trace(frequency, width, t_stop, dt=0.05):
+    """
+    A voltage trace with a Gaussian 'spike' of the given width at a regular
+    frequency (in Hz), which includes the sample at the stop time as NEURON's
+    recordings do
+    """
+    times = numpy.arange(int(round(t_stop / dt)) + 1) * dt
+    v = numpy.empty(len(times))
+    v.fill(-65.0)
+    for spike_time in numpy.arange(10.0, t_stop, 1000.0 / frequency):
+        v += 100.0 * numpy.exp(-((times - spike_time) / width) ** 2)
+    return AnalogSignal(v, sampling_period=dt * pq.ms, t_start=0.0 * pq.ms,
+                        units=pq.mV)
+
+
+class SpikeTrainSimulation(Simulation):
+    """
+    A simulation of a regularly spiking cell, whose spike frequency and width
+    are the parameters of the candidate
+    """
+
+    def __init__(self):
+        self.num_runs = 0
+
+    def run(self, candidate, setup):
+        self.num_runs += 1
+        record_time = float(pq.Quantity(setup.record_time, 'ms'))
+        seg = Segment()
+        for _ in setup.record_variables:
+            seg.analogsignals.append(spike_train_trace(candidate[0],
+                                                       candidate[1],
+                                                       record_time))
+        return seg
+
+
+class CountingObjectiveMixin(object):
+    """
+    Counts the number of times an objective is evaluated
+    """
+
+    num_evaluations = 0
+
+    def fitness(self, analysis):
+        self.num_evaluations += 1
+        return super(CountingObjectiveMixin, self).fitness(analysis)
+
+
+class CountingSpikeFrequencyObjective(CountingObjectiveMixin,
+                                      SpikeFrequencyObjective):
+    pass
+
+
+class CountingPhasePlaneHistObjective(CountingObjectiveMixin,
+                                      PhasePlaneHistObjective):
+    pass
+
+
+class TestTunerCutoffs(unittest.TestCase):
+
+    window = {'time_start': 50.0 * pq.ms, 'time_stop': 300.0 * pq.ms}
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.parameters = [Parameter('frequency', 'Hz', 10.0, 50.0),
+                           Parameter('width', 'ms', 0.3, 1.0)]
+        self.reference = spike_train_trace(20.0, 0.5, 300.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def tune(self, subdir, cutoffs):
+        output_dir = os.path.join(self.output_dir, subdir)
+        os.mkdir(output_dir)
+        objectives = [
+            CountingSpikeFrequencyObjective(20.0 * pq.Hz, **self.window),
+            CountingPhasePlaneHistObjective(self.reference, **self.window)]
+        objective = WeightedSumObjective((1e3, objectives[0]),
+                                         (1.0, objectives[1]))
+        algorithm = ESAlgorithm(6, output_dir=output_dir, max_generations=10,
+                                random_seed=1)
+        simulation = SpikeTrainSimulation()
+        tuner = Tuner(self.parameters, objective, algorithm, simulation)
+        if cutoffs:
+            pop, _ = tuner.tune()
+        else:
+            # Drop the cutoffs so every candidate is evaluated exactly
+            pop, _ = algorithm.optimize(
+                lambda candidates, args, cutoffs=None: tuner._evaluator(
+                                                            candidates, args))
+        num_evaluations = sum(o.num_evaluations for o in objectives)
+        return (sorted((i.fitness, i.candidate) for i in pop),
+                num_evaluations, simulation.num_runs)
+
+    def test_es_cutoffs(self):
+        # The evolution strategy only keeps offspring fitter than the least
+        # fit of the population, so passing its fitness as the cutoff skips
+        # objectives without changing the course of the evolution
+        expected_pop, expected_evals, num_runs = self.tune('exact', False)
+        self.assertEqual(expected_evals, 2 * num_runs)
+        pop, num_evaluations, num_cutoff_runs = self.tune('cutoff', True)
+        self.assertEqual(num_cutoff_runs, num_runs)
+        self.assertLess(num_evaluations, expected_evals)
+        self.assertEqual(pop, expected_pop)
+
+
+class WindowLengthObjective(Objective):
+    """
+    An objective that can't be truncated, as its fitness depends on the
+    length of the whole window
+    """
+
+    def fitness(self, analysis):
+        signal = analysis.get_signal()
+        return float(signal.t_stop - signal.t_start)
+
+
+class TestTunerFidelity(unittest.TestCase):
+
+    candidates = [[20.0, 0.5], [25.0, 0.7], [15.0, 0.4]]
+
+    def setUp(self):
+        self.parameters = [Parameter('frequency', 'Hz', 10.0, 50.0),
+                           Parameter('width', 'ms', 0.3, 1.0)]
+        self.reference = spike_train_trace(20.0, 0.5, 600.0)
+
+    def tuner(self, objective):
+        return Tuner(self.parameters, objective, ESAlgorithm(3),
+                     SpikeTrainSimulation())
+
+    def objectives(self, time_stop):
+        window = {'time_start': 100.0 * pq.ms, 'time_stop': time_stop}
+        return [PhasePlaneHistObjective(self.reference, **window),
+                SpikeTimesObjective(self.reference, time_buffer=50.0 * pq.ms,
+                                    **window),
+                VanRossumObjective(self.reference, **window),
+                TraceDistanceObjective(self.reference, **window)]
+
+    def test_reduced_window(self):
+        # At reduced fidelity the objectives compare the simulated fraction of
+        # their window with the same fraction of the reference, as objectives
+        # over the shorter window do at full fidelity
+        fidelity = Fidelity(0.4, 1)
+        tuner = self.tuner(MultiObjective(*self.objectives(600.0 * pq.ms)))
+        reduced = tuner._evaluator(self.candidates, fidelity=fidelity)
+        self.assertEqual(tuner.simulation.num_runs, len(self.candidates))
+        expected = self.tuner(MultiObjective(
+                    *self.objectives(300.0 * pq.ms)))._evaluator(
+                                                               self.candidates)
+        self.assertTrue(numpy.allclose(reduced, expected, rtol=1e-10,
+                                       atol=0.0))
+        self.assertFalse(numpy.allclose(reduced, tuner._evaluator(
+                                                             self.candidates)))
+        # The weighted sum passes its cutoff on to the reduced objectives
+        weighted = self.tuner(WeightedSumObjective(
+                  *[(1.0, o) for o in self.objectives(600.0 * pq.ms)]))
+        self.assertTrue(numpy.allclose(
+                weighted._evaluator(self.candidates, fidelity=fidelity,
+                                    cutoffs=[numpy.inf] * 3),
+                numpy.sum(expected, axis=1), rtol=1e-10, atol=0.0))
+        # The reduced copies are reused
+        self.assertIs(tuner.objective.at_fidelity(fidelity),
+                      tuner.objective.at_fidelity(Fidelity(0.4, 2)))
+
+    def test_untruncatable(self):
+        tuner = self.tuner(WindowLengthObjective(100.0 * pq.ms,
+                                                 600.0 * pq.ms))
+        self.assertAlmostEqual(tuner._evaluator([[20.0, 0.5]])[0], 500.0,
+                               delta=0.1)
+        self.assertRaises(Exception, tuner._evaluator, [[20.0, 0.5]],
+                          fidelity=Fidelity(0.5, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()